@@ -1,13 +1,28 @@
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, flash, jsonify, session
+from flask import Flask, Request, Response, render_template, request, redirect, url_for, send_from_directory, send_file, flash, jsonify, session
+import io
 import os
 import random
 import string
+import time
 import uuid
-import threading
-from werkzeug.utils import secure_filename
-import pandas as pd
-from image_utils import compress_image, remove_background, create_final_image
-from model_utils import predict_image
+from pipeline import identify, identify_batch, result_cache, inspect_image, make_preview, ImageTooLargeError, PIPELINE_STEPS, PIPELINE_VERSION
+from PIL import UnidentifiedImageError
+from image_utils import SubjectDetectionError, SubjectTooSmallError
+from model_utils import DEFAULT_TOP_K, CONFIDENCE_THRESHOLD, prediction_confidence, is_confident, vote_predictions
+from inference_index import InferenceIndex
+from photo_wall import PhotoWallCatalog
+from dataset_manifest import DATASET_MANIFEST_PATH
+from smallphoto import ensure_thumbnail, THUMBNAIL_SIZES, THUMBNAIL_FORMATS
+from werkzeug.security import safe_join
+from bird_pages import BirdPageCache
+from class_registry import get_class_registry, BIRD_CLASS_MAPPING_CSV
+from model_registry import model_registry, preload_for_fork, PRELOAD_MODELS
+import re
+import inference_server
+from jobs import JobStore, JobQueue, QueueFullError, JOB_WAIT_TIMEOUT
+from uploads_janitor import UploadsJanitor
+from result_cache import RESULT_CACHE_DIR
+from metrics import metrics_registry, job_queue_wait, request_duration
 
 # Imports for web scraping
 import requests
@@ -15,7 +30,6 @@ from pyquery import PyQuery as pq
 import urllib.parse
 import ssl
 import warnings
-import json
 from datetime import datetime
 
 # Suppress SSL warnings and InsecureRequestWarning
@@ -23,50 +37,55 @@ ssl._create_default_https_context = ssl._create_unverified_context
 warnings.filterwarnings("ignore", category=requests.packages.urllib3.exceptions.InsecureRequestWarning)
 warnings.filterwarnings("ignore") # General warnings
 
+class InMemoryUploadRequest(Request):
+    """上传文件直接读入内存（大小受 MAX_CONTENT_LENGTH 限制），不写临时文件"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 # Configure Flask application
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# 单次请求的最大上传大小（MB），超过时返回 413
+app.config['MAX_CONTENT_LENGTH'] = int(float(os.environ.get('BIRD_MAX_UPLOAD_MB', '16')) * 1024 * 1024)
+# 设置后会把压缩图与最终图保存到该目录，便于调试；默认不写中间文件
+app.config['DEBUG_ARTIFACTS_FOLDER'] = os.environ.get('BIRD_DEBUG_ARTIFACTS_DIR') or None
 app.secret_key = 'your_secret_key'  # Replace with your actual secret key
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 DATA_FOLDER = 'static/'
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600  # 缩略图 URL 带版本号，可缓存一年
+# /api/identify_batch 单次请求的最大图片数
+MAX_BATCH_IMAGES = int(os.environ.get('BIRD_MAX_BATCH_IMAGES', '16'))
+
+# 任务状态保存在 SQLite 中，可跨进程共享并在重启后保留
+job_store = JobStore()
+
+# 多进程部署时在 fork 之前加载模型，各 worker 共享同一份权重（见 gunicorn.conf.py）
+if PRELOAD_MODELS:
+    preload_for_fork()
 
-# Initialize global task dictionary
-tasks = {}
+# 照片墙图片的预计算识别结果（由 inference_index.py 离线生成）
+inference_index = InferenceIndex(version=PIPELINE_VERSION)
 
 # Load class mapping (required for bird name lookup)
-BIRD_CLASS_MAPPING_CSV = "class_mapping.csv"
-INVALID_IMAGES_LIST = "invalid_images_list.txt"  # 无效图片列表文件
+PHOTO_WALL_CSV = "all_data.csv"
 
 # 添加本地数据目录配置
 LOCAL_BIRD_DATA_DIR = "bird_data_local"
 
-try:
-    class_mapping_df = pd.read_csv(BIRD_CLASS_MAPPING_CSV)
-    # print("class_mapping.csv loaded successfully.")
-except FileNotFoundError:
-    print(f"错误: {BIRD_CLASS_MAPPING_CSV} 未找到。鸟类名称查找功能将无法工作。")
-    class_mapping_df = pd.DataFrame(columns=['class', 'original_label'])
-
-# 加载无效图片列表
-def load_invalid_images_list():
-    """加载无效图片列表"""
-    invalid_images = set()
-    if os.path.exists(INVALID_IMAGES_LIST):
-        try:
-            with open(INVALID_IMAGES_LIST, 'r', encoding='utf-8') as f:
-                invalid_images = set(line.strip() for line in f if line.strip())
-            print(f"📝 已加载 {len(invalid_images)} 张无效图片的黑名单")
-        except Exception as e:
-            print(f"⚠️ 加载无效图片列表失败: {e}")
-    else:
-        print(f"💡 提示: 未找到无效图片列表文件 {INVALID_IMAGES_LIST}")
-        print(f"💡 您可以运行 'python filter_problematic_images.py' 来生成此文件")
-    return invalid_images
+# 本地鸟类数据索引与详情页渲染缓存
+bird_page_cache = BirdPageCache(LOCAL_BIRD_DATA_DIR)
+bird_page_cache.scan()
+
+# 类别注册表：只加载一次，提供ID与名称的双向字典查询
+class_registry = get_class_registry(BIRD_CLASS_MAPPING_CSV)
 
-# 在应用启动时加载无效图片列表
-invalid_images_set = load_invalid_images_list()
+# 照片墙目录：启动时从数据集清单构建一次，清单变化时自动重新加载（清单由 dataset_manifest.py 离线生成）
+photo_wall_catalog = PhotoWallCatalog(DATASET_MANIFEST_PATH, PHOTO_WALL_CSV, DATA_FOLDER, class_registry.id_to_label)
+photo_wall_catalog.refresh_if_changed()
 
 def allowed_file(filename):
     """Check if the file extension is allowed"""
@@ -77,77 +96,24 @@ def generate_random_filename(extension):
     random_str = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
     return f"{random_str}.{extension}"
 
+def _thumbnail_urls(filepath, version):
+    """照片墙卡片使用的缩略图地址：{格式: {尺寸: URL}}"""
+    return {
+        fmt: {size: url_for('thumbnail', size=size, fmt=fmt, filename=filepath, v=version)
+              for size in THUMBNAIL_SIZES}
+        for fmt in THUMBNAIL_FORMATS
+    }
+
 def _get_photo_wall_images():
-    """Generate photo wall data with filtering of invalid images"""
-    csv_path = "all_data.csv"
-    df = pd.read_csv(csv_path)
-    class_to_label = {}
-    if not class_mapping_df.empty:
-        class_to_label = class_mapping_df.set_index('class')['original_label'].to_dict()
-
-    test_images = df[df['data set'] == 'test'][['filepaths', 'class']].values.tolist()
-    valid_images_with_labels = []
-    filtered_count = 0
-    
-    for filepath, bird_class_numeric in test_images:
-        # 检查图片是否在无效列表中
-        if filepath in invalid_images_set:
-            filtered_count += 1
-            # print(f"🚫 过滤无效图片: {filepath}")
-            continue
-            
-        full_path = os.path.join(DATA_FOLDER, filepath)
-        if os.path.exists(full_path):
-            bird_name = class_to_label.get(bird_class_numeric, "未知鸟类")
-            image_url = url_for('data_file', filename=filepath)
-            # 现在包含 bird_class_numeric 以便创建详情页链接
-            valid_images_with_labels.append((image_url, bird_name, filepath, bird_class_numeric))
-
-    if filtered_count > 0:
-        print(f"✅ 已过滤掉 {filtered_count} 张无效图片，剩余 {len(valid_images_with_labels)} 张有效图片")
-    
-    displayed_images = random.sample(valid_images_with_labels, min(50, len(valid_images_with_labels)))
+    """Sample photo wall data from the precomputed catalog of valid images"""
+    displayed_images = [
+        # 包含 bird_class_numeric 以便创建详情页链接
+        (_thumbnail_urls(filepath, version), bird_name, filepath, bird_class_numeric)
+        for filepath, bird_name, bird_class_numeric, version in photo_wall_catalog.sample(50)
+    ]
     return [displayed_images[i:i + 10] for i in range(0, len(displayed_images), 10)]
 
-def load_local_bird_data(bird_class_id):
-    """从本地加载鸟类数据"""
-    bird_dir = os.path.join(LOCAL_BIRD_DATA_DIR, str(bird_class_id))
-    
-    if not os.path.exists(bird_dir):
-        return None
-    
-    # 读取鸟类基本信息
-    info_file = os.path.join(bird_dir, 'info.json')
-    if not os.path.exists(info_file):
-        return None
-    
-    try:
-        with open(info_file, 'r', encoding='utf-8') as f:
-            bird_info = json.load(f)
-        
-        # 读取描述HTML
-        description_file = os.path.join(bird_dir, 'description.html')
-        description_html = None
-        if os.path.exists(description_file):
-            with open(description_file, 'r', encoding='utf-8') as f:
-                description_html = f.read()
-        
-        # 读取分布HTML
-        distribution_file = os.path.join(bird_dir, 'distribution.html')
-        distribution_html = None
-        if os.path.exists(distribution_file):
-            with open(distribution_file, 'r', encoding='utf-8') as f:
-                distribution_html = f.read()
-        
-        return {
-            'info': bird_info,
-            'description': description_html,
-            'distribution': distribution_html
-        }
-        
-    except Exception as e:
-        print(f"⚠️ 读取本地鸟类数据失败 (ID: {bird_class_id}): {e}")
-        return None
+LOCAL_IMAGE_SRC_PATTERN = re.compile(r'src="(images/[^"]+)"')
 
 def _update_local_image_urls(html_content, bird_class_id):
     """更新HTML中的图片URL为本地路径"""
@@ -155,8 +121,6 @@ def _update_local_image_urls(html_content, bird_class_id):
         return html_content
     
     # 将相对路径的图片URL更新为Flask路由
-    import re
-    
     def replace_img_src(match):
         src = match.group(1)
         if src.startswith('images/'):
@@ -167,7 +131,7 @@ def _update_local_image_urls(html_content, bird_class_id):
         return match.group(0)
     
     # 使用正则表达式替换 src="images/..." 
-    updated_html = re.sub(r'src="(images/[^"]+)"', replace_img_src, html_content)
+    updated_html = LOCAL_IMAGE_SRC_PATTERN.sub(replace_img_src, html_content)
     return updated_html
 
 # 添加本地图片服务路由
@@ -188,79 +152,166 @@ def data_file(filename):
     """Serve static data files"""
     return send_from_directory(DATA_FOLDER, filename)
 
-@app.route('/uploads/<filename>')
+@app.route('/thumb/<int:size>/<fmt>/<path:filename>')
+def thumbnail(size, fmt, filename):
+    """照片墙缩略图，缺失时即时生成；URL 带版本号，因此可长期缓存"""
+    if size not in THUMBNAIL_SIZES or fmt not in THUMBNAIL_FORMATS:
+        return "Thumbnail not found", 404
+    original_path = safe_join(DATA_FOLDER, filename)
+    if original_path is None or not os.path.isfile(original_path):
+        return "Image not found", 404
+
+    thumbnail_path, key = ensure_thumbnail(original_path, size, fmt)
+    if thumbnail_path is None:
+        # 生成失败时退回原图
+        return send_from_directory(DATA_FOLDER, filename)
+
+    response = send_file(thumbnail_path, mimetype=THUMBNAIL_FORMATS[fmt][1], etag=key,
+                         max_age=THUMBNAIL_MAX_AGE, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
     """Serve uploaded files"""
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
+@app.route('/upload_preview/<task_id>')
+def upload_preview(task_id):
+    """上传图片的预览（与任务状态分开保存，原图不落盘）"""
+    preview = job_store.get_preview(task_id)
+    if preview is None:
+        return "预览不存在", 404
+    response = Response(preview, mimetype='image/jpeg')
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    """上传内容超过 MAX_CONTENT_LENGTH"""
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] / 1024 / 1024
+    if request.path.startswith('/api/'):
+        return jsonify({
+            'success': False,
+            'error': f'文件过大，最大允许 {limit_mb:.0f}MB',
+            'error_code': 'FILE_TOO_LARGE',
+            'timestamp': datetime.now().isoformat()
+        }), 413
+    flash(f"文件过大，最大允许 {limit_mb:.0f}MB")
+    return redirect(url_for('index'))
+
 @app.route('/task_status/<task_id>')
 def task_status(task_id):
-    """Query task status"""
-    task = tasks.get(task_id)
+    """
+    Query task status
+    带 revision 参数时为长轮询：阻塞到任务状态的 revision 变化、任务结束或超时（最长 wait 秒）后返回，
+    同时等待的请求过多时立即返回并附带 retry_after（秒），客户端应延迟后再请求
+    """
+    revision = request.args.get('revision', type=int)
+    if revision is None:
+        task = job_store.get(task_id)
+    else:
+        timeout = min(max(request.args.get('wait', JOB_WAIT_TIMEOUT, type=float), 0.0), JOB_WAIT_TIMEOUT)
+        task, waited = job_store.wait_for_change(task_id, revision, timeout)
+        if task and not waited:
+            task['retry_after'] = 1
     if task:
         return jsonify(task)
     else:
         return jsonify({'status': 'not found'})
 
 def process_task(task_id, task_data):
-    """Function to process the image in a background thread"""
-    try:
-        # Update task status in the global tasks dictionary
-        if task_data['step'] == 'upload':
-            upload_path = task_data['upload_path']
-            tasks[task_id]['steps']['compress_image'] = False
-            compressed_image_path = compress_image(upload_path)
-            tasks[task_id]['steps']['compress_image'] = True
+    """Function to process the image in a job worker thread"""
+    def mark_step(*steps):
+        job_store.set_steps(task_id, steps)
 
-            tasks[task_id]['steps']['remove_background'] = False
-            image_np, mask = remove_background(compressed_image_path)
-            tasks[task_id]['steps']['remove_background'] = True
+    def record_file(path):
+        job_store.add_files(task_id, [path])
 
-            tasks[task_id]['steps']['create_final_image'] = False
-            final_image_path = create_final_image(image_np, mask)
-            tasks[task_id]['steps']['create_final_image'] = True
+    start = time.perf_counter()
+    queue_wait_ms = (start - task_data['enqueued_at']) * 1000 if 'enqueued_at' in task_data else None
+    if queue_wait_ms is not None:
+        job_queue_wait.observe(queue_wait_ms)
 
-            tasks[task_id]['steps']['prediction'] = False
-            predicted_label = predict_image(final_image_path)
-            tasks[task_id]['steps']['prediction'] = True
-
-            tasks[task_id]['status'] = 'completed'
-            tasks[task_id]['result'] = predicted_label
+    try:
+        job_store.set_fields(task_id, status='processing')
+        if task_data['step'] == 'upload':
+            # 上传内容只保存在内存中，结果页使用缩小后的预览
+            image_bytes = task_data['image_bytes']
+            job_store.set_preview(task_id, make_preview(image_bytes))
         elif task_data['step'] == 'select':
-            image_path = task_data['image_path']
-            tasks[task_id]['steps']['compress_image'] = False
-            compressed_image_path = compress_image(image_path)
-            tasks[task_id]['steps']['compress_image'] = True
-
-            tasks[task_id]['steps']['remove_background'] = False
-            image_np, mask = remove_background(compressed_image_path)
-            tasks[task_id]['steps']['remove_background'] = True
-
-            tasks[task_id]['steps']['create_final_image'] = False
-            final_image_path = create_final_image(image_np, mask)
-            tasks[task_id]['steps']['create_final_image'] = True
-
-            tasks[task_id]['steps']['prediction'] = False
-            predicted_label = predict_image(final_image_path)
-            tasks[task_id]['steps']['prediction'] = True
-
-            tasks[task_id]['status'] = 'completed'
-            tasks[task_id]['result'] = predicted_label
+            with open(task_data['image_path'], 'rb') as f:
+                image_bytes = f.read()
+        else:
+            raise ValueError(f"未知的处理步骤: {task_data['step']}")
+
+        prediction, cache_hit = identify(image_bytes, debug_dir=app.config['DEBUG_ARTIFACTS_FOLDER'],
+                                         on_step=mark_step, on_artifact=record_file)
+
+        total_ms = (time.perf_counter() - start) * 1000
+        request_duration.observe(total_ms, endpoint='job')
+        # 各步骤耗时（毫秒），另含排队等待时间与任务总耗时
+        timings = dict(prediction['timings'], total=round(total_ms, 2))
+        if queue_wait_ms is not None:
+            timings['queue_wait'] = round(queue_wait_ms, 2)
+        job_store.set_fields(task_id, status='completed', result=prediction['label'],
+                             class_id=prediction['class_id'], confidence=prediction['confidence'],
+                             top_k=prediction['top_k'], cache_hit=cache_hit, timings=timings)
     except Exception as e:
-        tasks[task_id]['status'] = 'failed'
-        tasks[task_id]['error'] = str(e)
+        job_store.set_fields(task_id, status='failed', error=str(e))
         print(f"Error during processing and prediction: {e}")
 
+# 有界工作线程池，替代每个请求单独启动的线程
+job_queue = JobQueue(process_task, job_store)
+orphaned_count = job_store.fail_orphaned()
+if orphaned_count:
+    print(f"⚠️ 已将 {orphaned_count} 个中断的任务标记为失败")
+
+def _referenced_files():
+    """未结束任务在磁盘上产生的文件（任务的 files 字段），清理上传目录时跳过"""
+    return [path for task in job_store.list_active() for path in task.get('files', [])]
+
+# 上传目录、调试产物目录与结果缓存磁盘层的后台清理（TTL + 总大小配额）
+uploads_janitor = UploadsJanitor([app.config['UPLOAD_FOLDER'], app.config['DEBUG_ARTIFACTS_FOLDER'], RESULT_CACHE_DIR],
+                                 referenced=_referenced_files)
+
+@app.before_request
+def _start_uploads_janitor():
+    """在处理请求的进程中启动清理线程（gunicorn 预加载时主进程不启动线程，fork 后由各 worker 启动）"""
+    uploads_janitor.start()
+
+def _queue_full_response(depth):
+    """任务队列已满时返回 429"""
+    message = f"服务器繁忙，当前排队任务 {depth} 个，请稍后重试"
+    return message, 429, {'Retry-After': '5', 'X-Queue-Depth': str(depth)}
+
+def _enqueue_task(task_id, task_data, image_bytes=None):
+    """保存任务并放入队列，队列已满时返回 429 响应，否则重定向到处理页面"""
+    job_store.create(task_id, task_data)
+    payload = dict(task_data, enqueued_at=time.perf_counter())
+    if image_bytes is not None:
+        payload['image_bytes'] = image_bytes
+    try:
+        job_queue.submit(task_id, payload)
+    except QueueFullError as e:
+        job_store.set_fields(task_id, status='failed', error=str(e))
+        return _queue_full_response(e.depth)
+    return redirect(url_for('processing', task_id=task_id))
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     """Main page route"""
     if request.method == 'POST':
         step = request.form.get('step', None)
+        # 队列已满时直接拒绝，避免保存无法处理的上传文件
+        if job_queue.depth() >= job_queue.max_queue:
+            return _queue_full_response(job_queue.depth())
         # Generate a unique task ID
         task_id = str(uuid.uuid4())
         # Initialize task status
-        tasks[task_id] = {
-            'status': 'processing',
+        task_data = {
+            'status': 'queued',
             'steps': {
                 'compress_image': False,
                 'remove_background': False,
@@ -279,23 +330,22 @@ def index():
                 flash("无效的文件或未选择文件")
                 return redirect(request.url)
 
-            extension = file.filename.rsplit('.', 1)[1].lower()
-            filename = generate_random_filename(extension)
-            upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-            file.save(upload_path)
-
-            # Save original image URL for display on the result page
-            original_image_url = url_for('uploaded_file', filename=filename)
-            tasks[task_id]['image_url'] = original_image_url
-            tasks[task_id]['upload_path'] = upload_path
+            # 上传内容直接读入内存，先只解析文件头校验格式与像素数
+            image_bytes = file.read()
+            try:
+                inspect_image(image_bytes)
+            except ImageTooLargeError as e:
+                flash(str(e))
+                return redirect(request.url)
+            except (UnidentifiedImageError, OSError):
+                flash("无法识别的图片文件")
+                return redirect(request.url)
 
-            # Start background processing thread
-            thread = threading.Thread(target=process_task, args=(task_id, tasks[task_id]))
-            thread.start()
+            # 结果页展示处理时生成的预览
+            task_data['image_url'] = url_for('upload_preview', task_id=task_id)
 
-            # Redirect to the processing page
-            return redirect(url_for('processing', task_id=task_id))
+            # Queue for background processing and redirect to the processing page
+            return _enqueue_task(task_id, task_data, image_bytes)
 
         elif step == 'select':  # Selected image processing
             selected_image = request.form.get('selected_image')
@@ -310,15 +360,24 @@ def index():
 
             # Save original image URL for display on the result page
             original_image_url = url_for('data_file', filename=selected_image)
-            tasks[task_id]['image_url'] = original_image_url
-            tasks[task_id]['image_path'] = image_path
-
-            # Start background processing thread
-            thread = threading.Thread(target=process_task, args=(task_id, tasks[task_id]))
-            thread.start()
-
-            # Redirect to the processing page
-            return redirect(url_for('processing', task_id=task_id))
+            task_data['image_url'] = original_image_url
+            task_data['image_path'] = image_path
+
+            # 优先使用预计算索引，命中时无需排队和模型计算
+            indexed = inference_index.lookup(selected_image)
+            if indexed is not None:
+                task_data['status'] = 'completed'
+                task_data['steps'] = {step: True for step in PIPELINE_STEPS}
+                task_data['result'] = indexed['label']
+                task_data['class_id'] = indexed['class_id']
+                task_data['confidence'] = prediction_confidence(indexed)
+                task_data['top_k'] = indexed['top_k']
+                task_data['from_index'] = True
+                job_store.create(task_id, task_data)
+                return redirect(url_for('result', task_id=task_id))
+
+            # Queue for background processing and redirect to the processing page
+            return _enqueue_task(task_id, task_data)
 
     return render_template('index.html', image_rows=_get_photo_wall_images())
 
@@ -330,6 +389,25 @@ def processing():
         return redirect(url_for('index'))
     return render_template('processing.html', task_id=task_id)
 
+def _lookup_class_id(label):
+    """按名称查找类别ID：先精确匹配，再使用预建的模糊匹配索引"""
+    class_id = class_registry.class_id(label)
+    if class_id is not None:
+        return class_id
+
+    matches = class_registry.find(label)
+    # 相似度 0.99 以上表示名称互相包含（即原来的部分匹配）
+    partial_matches = [match for match in matches if match[2] >= 0.99]
+    if partial_matches:
+        class_id, matched_label, _ = partial_matches[0]
+        print(f"✅ 使用部分匹配结果 '{matched_label}'，ID: {class_id}")
+        return class_id
+
+    print(f"❌ 未找到识别结果 '{label}' 对应的ID（包括部分匹配）")
+    for class_id, matched_label, score in matches:
+        print(f"   相似: ID {class_id}: '{matched_label}' ({score:.2f})")
+    return None
+
 @app.route('/result')
 def result():
     """Result page"""
@@ -337,48 +415,24 @@ def result():
     if not task_id:
         flash("未找到任务ID")
         return redirect(url_for('index'))
-    task = tasks.get(task_id)
+    task = job_store.get(task_id)
     if not task:
         flash("未找到任务信息")
         return redirect(url_for('index'))
     if task['status'] == 'completed':
-        # 查找识别结果对应的鸟类ID
-        bird_class_id = None
-        if task['result'] and not class_mapping_df.empty:
-            print(f"🔍 开始查找识别结果 '{task['result']}' 对应的ID")
-            print(f"📊 class_mapping_df 包含 {len(class_mapping_df)} 条记录")
-            
-            # 在class_mapping中查找匹配的鸟类名称
-            matching_birds = class_mapping_df[class_mapping_df['original_label'] == task['result']]
-            
-            if not matching_birds.empty:
-                bird_class_id = matching_birds.iloc[0]['class']
-                print(f"✅ 找到匹配！识别结果 '{task['result']}' 对应ID: {bird_class_id}")
+        # 模型直接返回类别ID；缺少 class_id 的旧任务按名称查找
+        bird_class_id = task.get('class_id')
+        if bird_class_id is None:
+            if task['result']:
+                bird_class_id = _lookup_class_id(task['result'])
             else:
-                print(f"❌ 精确匹配失败，尝试部分匹配...")
-                # 尝试部分匹配
-                partial_matches = class_mapping_df[class_mapping_df['original_label'].str.contains(task['result'], na=False)]
-                if not partial_matches.empty:
-                    print(f"🔍 找到部分匹配的鸟类:")
-                    for idx, row in partial_matches.iterrows():
-                        print(f"   ID {row['class']}: '{row['original_label']}'")
-                    # 使用第一个部分匹配的结果
-                    bird_class_id = partial_matches.iloc[0]['class']
-                    print(f"✅ 使用部分匹配结果，ID: {bird_class_id}")
-                else:
-                    print(f"❌ 未找到识别结果 '{task['result']}' 对应的ID（包括部分匹配）")
-                    # 显示最相似的几个名称
-                    print("🔍 数据库中相似的鸟类名称:")
-                    for idx, row in class_mapping_df.iterrows():
-                        if task['result'] in row['original_label'] or row['original_label'] in task['result']:
-                            print(f"   ID {row['class']}: '{row['original_label']}'")
-        else:
-            if not task['result']:
                 print("⚠️ 识别结果为空")
-            if class_mapping_df.empty:
-                print("⚠️ class_mapping_df 为空")
         
-        return render_template('result.html', result=task['result'], image_url=task['image_url'], bird_class_id=bird_class_id)
+        confidence = task.get('confidence')
+        return render_template('result.html', result=task['result'], image_url=task['image_url'], bird_class_id=bird_class_id,
+                               confidence=confidence, top_k=task.get('top_k') or [],
+                               low_confidence=confidence is not None and not is_confident(task),
+                               confidence_threshold=CONFIDENCE_THRESHOLD)
     elif task['status'] == 'failed':
         flash(f"处理失败：{task.get('error', '未知错误')}")
         return redirect(url_for('index'))
@@ -389,6 +443,12 @@ def result():
 # 新的/修改的鸟类详情页面路由 - 只使用本地数据
 @app.route('/bird/<bird_class_id>')
 def bird_detail(bird_class_id):
+    # 命中渲染缓存时直接返回，无需读取磁盘
+    cached_page = bird_page_cache.get(bird_class_id)
+    if cached_page is not None:
+        return cached_page
+
+    page_signature = None
     bird_data = {
         'name': '未知鸟类',
         'class_id': bird_class_id,
@@ -399,14 +459,14 @@ def bird_detail(bird_class_id):
     
     try:
         numeric_class_id = int(bird_class_id)
-        if not class_mapping_df.empty:
-            bird_name_series = class_mapping_df[class_mapping_df['class'] == numeric_class_id]['original_label']
-            if not bird_name_series.empty:
-                bird_data['name'] = bird_name_series.iloc[0]
+        if not class_registry.empty:
+            bird_name = class_registry.label(numeric_class_id)
+            if bird_name is not None:
+                bird_data['name'] = bird_name
                 print(f"🔍 加载鸟类 '{bird_data['name']}' (ID: {bird_class_id}) 的本地数据")
                 
                 # 只从本地加载数据
-                local_data = load_local_bird_data(bird_class_id)
+                local_data, page_signature = bird_page_cache.load(bird_class_id)
                 
                 if local_data:
                     bird_data['description'] = local_data['description']
@@ -443,13 +503,65 @@ def bird_detail(bird_class_id):
         flash("获取鸟类详情时发生内部错误。")
 
     print(f"🎨 渲染模板，传递数据: {list(bird_data.keys())}")
-    return render_template('bird_detail.html', bird_data=bird_data)
+    page = render_template('bird_detail.html', bird_data=bird_data)
+    # 只缓存成功加载本地数据的页面，其余情况保留原有的提示流程
+    if page_signature is not None:
+        bird_page_cache.put(bird_class_id, page, page_signature)
+    return page
+
+def _float_param(name, default, low, high):
+    """读取表单中的数值参数，超出范围时抛出 ValueError"""
+    raw = request.form.get(name)
+    if raw is None or raw == '':
+        return default
+    value = float(raw)
+    if not low <= value <= high:
+        raise ValueError(f"{name} 必须在 {low} 到 {high} 之间")
+    return value
+
+def _api_params():
+    """读取识别接口的 top_k 与 min_confidence 参数，非法时抛出 ValueError"""
+    top_k = int(_float_param('top_k', DEFAULT_TOP_K, 1, DEFAULT_TOP_K))
+    min_confidence = _float_param('min_confidence', CONFIDENCE_THRESHOLD, 0.0, 1.0)
+    return top_k, min_confidence
+
+def _api_result(prediction, cache_hit, top_k, min_confidence):
+    """识别接口返回的单张图片结果"""
+    return {
+        'bird_name': prediction['label'],
+        # 模型直接返回鸟类ID（用于详情页链接）
+        'bird_class_id': prediction['class_id'],
+        'confidence': prediction['confidence'],
+        'confidence_threshold': min_confidence,
+        'top_k': prediction['top_k'][:top_k],
+        'timestamp': datetime.now().isoformat(),
+        # 各步骤耗时之和与明细（毫秒），命中缓存时只有 cache_lookup
+        'processing_time': round(sum(prediction['timings'].values()), 2),
+        'timings': prediction['timings'],
+        'cache_hit': cache_hit
+    }
+
+def _processing_error_code(error):
+    """根据识别过程中的异常返回错误码"""
+    if isinstance(error, ImageTooLargeError):
+        return 'IMAGE_TOO_LARGE'
+    elif isinstance(error, UnidentifiedImageError):
+        return 'INVALID_IMAGE'
+    elif isinstance(error, SubjectTooSmallError):
+        return 'SUBJECT_TOO_SMALL'
+    elif isinstance(error, SubjectDetectionError):
+        return 'SUBJECT_DETECTION_FAILED'
+    return 'PROCESSING_ERROR'
 
 @app.route('/api/identify_bird', methods=['POST'])
 def api_identify_bird():
     """
     树莓派专用鸟类识别API接口
     接收图像文件，返回识别结果的JSON响应
+    可选表单参数:
+        top_k: 返回的候选类别数量（1 到 BIRD_TOP_K）
+        min_confidence: 置信度阈值（0 到 1，默认 BIRD_CONFIDENCE_THRESHOLD），
+                        低于阈值时返回 LOW_CONFIDENCE，客户端无需再提交更多帧
     """
     try:
         # 检查是否有文件上传
@@ -476,54 +588,40 @@ def api_identify_bird():
                 'error_code': 'INVALID_FORMAT'
             }), 400
         
-        # 保存上传的文件
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_filename = f"rpi_{timestamp}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(file_path)
+        try:
+            top_k, min_confidence = _api_params()
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': f'参数错误: {e}',
+                'error_code': 'INVALID_PARAMETER'
+            }), 400
+        
+        # 读取上传内容（用于计算缓存键，无需落盘）
+        image_bytes = file.read()
         
-        # 执行图像处理和识别流程
+        # 执行图像处理和识别流程（先查结果缓存，各步骤在内存中完成）
         try:
-            # 步骤1: 压缩图像
-            compressed_path = compress_image(file_path)
-            
-            # 步骤2: 去背景
-            image_np, mask = remove_background(compressed_path)
+            start = time.perf_counter()
+            prediction, cache_hit = identify(image_bytes, debug_dir=app.config['DEBUG_ARTIFACTS_FOLDER'])
+            request_duration.observe((time.perf_counter() - start) * 1000, endpoint='api')
+            result_data = _api_result(prediction, cache_hit, top_k, min_confidence)
+            confidence = result_data['confidence']
             
-            # 步骤3: 创建最终图像
-            final_image_path = create_final_image(image_np, mask)
-            
-            # 步骤4: 模型预测
-            predicted_bird = predict_image(final_image_path)
-            
-            # 查找鸟类ID（用于详情页链接）
-            bird_class_id = None
-            if not class_mapping_df.empty:
-                matching_rows = class_mapping_df[class_mapping_df['original_label'] == predicted_bird]
-                if not matching_rows.empty:
-                    # 转换为Python原生int类型，避免JSON序列化错误
-                    bird_class_id = int(matching_rows.iloc[0]['class'])
-            
-            # 清理临时文件
-            cleanup_files = [file_path, compressed_path, final_image_path]
-            for temp_file in cleanup_files:
-                if os.path.exists(temp_file):
-                    try:
-                        os.remove(temp_file)
-                    except Exception as e:
-                        print(f"清理文件失败 {temp_file}: {e}")
+            # 置信度不足时直接拒绝，候选结果仍一并返回
+            if not is_confident(prediction, min_confidence):
+                return jsonify({
+                    'success': False,
+                    'error': f'识别置信度过低 ({confidence:.2f} < {min_confidence:.2f})',
+                    'error_code': 'LOW_CONFIDENCE',
+                    'result': result_data,
+                    'timestamp': result_data['timestamp']
+                }), 422
             
             # 返回成功结果
             return jsonify({
                 'success': True,
-                'result': {
-                    'bird_name': predicted_bird,
-                    'bird_class_id': bird_class_id,
-                    'confidence': 'high',  # 可以后续添加置信度计算
-                    'timestamp': datetime.now().isoformat(),
-                    'processing_time': 'completed'
-                },
+                'result': result_data,
                 'message': '识别成功'
             }), 200
             
@@ -531,25 +629,19 @@ def api_identify_bird():
             # 处理过程中的错误
             error_msg = str(processing_error)
             
-            # 清理上传的文件
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
-            
             # 根据错误类型返回不同的错误码
-            if "未检测到主体或检测到多个主体" in error_msg:
-                error_code = 'SUBJECT_DETECTION_FAILED'
-            elif "主体尺寸过小" in error_msg:
-                error_code = 'SUBJECT_TOO_SMALL'
-            else:
-                error_code = 'PROCESSING_ERROR'
+            if isinstance(processing_error, ImageTooLargeError):
+                return jsonify({
+                    'success': False,
+                    'error': error_msg,
+                    'error_code': 'IMAGE_TOO_LARGE',
+                    'timestamp': datetime.now().isoformat()
+                }), 413
             
             return jsonify({
                 'success': False,
                 'error': f'图像处理失败: {error_msg}',
-                'error_code': error_code,
+                'error_code': _processing_error_code(processing_error),
                 'timestamp': datetime.now().isoformat()
             }), 422
             
@@ -562,21 +654,118 @@ def api_identify_bird():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/identify_batch', methods=['POST'])
+def api_identify_batch():
+    """
+    树莓派连拍批量识别API接口
+    一次请求上传多张图片（表单字段 images，可重复），分割与分类各以一批执行
+    可选表单参数:
+        top_k / min_confidence: 与 /api/identify_bird 相同
+        vote: 为 1/true 时汇总所有识别成功且达到置信度阈值的图片，返回整组的投票结果
+    每张图片单独返回结果或错误（如 SUBJECT_TOO_SMALL），单张失败不影响其他图片
+    """
+    try:
+        files = request.files.getlist('images') or request.files.getlist('image')
+        if not files:
+            return jsonify({
+                'success': False,
+                'error': '未找到图像文件',
+                'error_code': 'NO_FILE'
+            }), 400
+        if len(files) > MAX_BATCH_IMAGES:
+            return jsonify({
+                'success': False,
+                'error': f'图片数量过多（{len(files)} 张，上限 {MAX_BATCH_IMAGES} 张）',
+                'error_code': 'TOO_MANY_IMAGES'
+            }), 400
+
+        try:
+            top_k, min_confidence = _api_params()
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': f'参数错误: {e}',
+                'error_code': 'INVALID_PARAMETER'
+            }), 400
+        vote = request.form.get('vote', '').lower() in ('1', 'true', 'yes')
+
+        items = []
+        pending = []
+        for index, file in enumerate(files):
+            item = {'index': index, 'filename': file.filename}
+            items.append(item)
+            if file.filename == '':
+                item.update(success=False, error='未选择文件', error_code='EMPTY_FILENAME')
+            elif not allowed_file(file.filename):
+                item.update(success=False, error='不支持的文件格式，仅支持: png, jpg, jpeg, gif',
+                            error_code='INVALID_FORMAT')
+            else:
+                pending.append((item, file.read()))
+
+        confident_predictions = []
+        start = time.perf_counter()
+        outcomes = identify_batch([data for _, data in pending], debug_dir=app.config['DEBUG_ARTIFACTS_FOLDER'])
+        batch_ms = (time.perf_counter() - start) * 1000
+        request_duration.observe(batch_ms, endpoint='api_batch')
+        for (item, _), outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                item.update(success=False, error=f'图像处理失败: {outcome}',
+                            error_code=_processing_error_code(outcome))
+                continue
+            prediction, cache_hit = outcome
+            item['result'] = _api_result(prediction, cache_hit, top_k, min_confidence)
+            if not is_confident(prediction, min_confidence):
+                item.update(success=False, error_code='LOW_CONFIDENCE',
+                            error=f"识别置信度过低 ({prediction['confidence']:.2f} < {min_confidence:.2f})")
+            else:
+                item['success'] = True
+                confident_predictions.append(prediction)
+
+        succeeded = len(confident_predictions)
+        response = {
+            'success': succeeded > 0,
+            'results': items,
+            'summary': {'total': len(items), 'succeeded': succeeded, 'failed': len(items) - succeeded},
+            'processing_time': round(batch_ms, 2),
+            'timestamp': datetime.now().isoformat()
+        }
+        if vote:
+            voted = vote_predictions(confident_predictions)
+            response['vote'] = None if voted is None else {
+                'bird_name': voted['label'],
+                'bird_class_id': voted['class_id'],
+                'score': voted['score'],
+                'frames': voted['frames'],
+                'top1_frames': voted['top1_frames']
+            }
+        return jsonify(response), 200 if succeeded else 422
+
+    except Exception as e:
+        # 系统级错误
+        return jsonify({
+            'success': False,
+            'error': f'服务器内部错误: {str(e)}',
+            'error_code': 'INTERNAL_ERROR',
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
 @app.route('/api/health', methods=['GET'])
 def api_health_check():
     """
     健康检查接口，供树莓派检测服务状态
     """
     try:
-        # 检查模型是否正常加载 - 修复检查逻辑
-        model_status = "not_loaded"
-        try:
-            from model_utils import classification_model
-            if classification_model is not None:
-                model_status = "loaded"
-        except Exception as model_error:
-            print(f"模型检查失败: {model_error}")
+        # 模型在首次使用时加载，未加载不代表异常
+        models_status = model_registry.status()
+        states = {status['state'] for status in models_status.values()}
+        if 'error' in states:
             model_status = "error"
+        elif states == {'loaded'}:
+            model_status = "loaded"
+        elif 'loading' in states:
+            model_status = "loading"
+        else:
+            model_status = "not_loaded"
         
         # 检查上传目录是否可写
         upload_writable = os.access(app.config['UPLOAD_FOLDER'], os.W_OK)
@@ -585,7 +774,18 @@ def api_health_check():
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
             'model_status': model_status,
+            'models': models_status,
             'upload_directory': 'writable' if upload_writable else 'not_writable',
+            'inference': inference_server.get_stats(),
+            'result_cache': result_cache.stats(),
+            'job_queue': {
+                'depth': job_queue.depth(),
+                'capacity': job_queue.max_queue,
+                'workers': job_queue.num_workers,
+                'long_poll': dict(job_store.waiter_stats)
+            },
+            'uploads': uploads_janitor.stats(),
+            'photo_wall': photo_wall_catalog.status(),
             'version': '1.0.0'
         }), 200
         
@@ -596,5 +796,48 @@ def api_health_check():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+def _collect_metrics():
+    """/metrics 导出时读取的即时指标：任务队列、模型加载、结果缓存、推理批处理与上传目录清理"""
+    models = model_registry.status()
+    cache = result_cache.stats()
+    inference = inference_server.get_stats()
+    uploads = uploads_janitor.stats()
+    batchers = ('segmentation', 'classification')
+    return [
+        ('bird_job_queue_depth', 'gauge', '排队中的后台任务数', [({}, job_queue.depth())]),
+        ('bird_job_queue_capacity', 'gauge', '后台任务队列容量', [({}, job_queue.max_queue)]),
+        ('bird_task_long_poll_total', 'counter', '任务进度长轮询次数（result=waited/rejected/woken/timeout）',
+         [({'result': 'waited'}, job_store.waiter_stats['waits']),
+          ({'result': 'rejected'}, job_store.waiter_stats['rejected']),
+          ({'result': 'woken'}, job_store.waiter_stats['wakeups']),
+          ({'result': 'timeout'}, job_store.waiter_stats['timeouts'])]),
+        ('bird_model_loaded', 'gauge', '模型是否已加载',
+         [({'model': name, 'runtime': status['runtime']}, status['state'] == 'loaded')
+          for name, status in models.items()]),
+        ('bird_model_load_seconds', 'gauge', '模型加载耗时（秒）',
+         [({'model': name, 'runtime': status['runtime']}, status['load_seconds'])
+          for name, status in models.items() if status['load_seconds'] is not None]),
+        ('bird_result_cache_hits_total', 'counter', '结果缓存命中次数',
+         [({'tier': 'memory'}, cache['memory_hits']), ({'tier': 'disk'}, cache['disk_hits'])]),
+        ('bird_result_cache_misses_total', 'counter', '结果缓存未命中次数', [({}, cache['misses'])]),
+        ('bird_result_cache_evictions_total', 'counter', '结果缓存淘汰次数', [({}, cache['evictions'])]),
+        ('bird_result_cache_entries', 'gauge', '结果缓存内存条目数', [({}, cache['entries'])]),
+        ('bird_inference_batches_total', 'counter', '推理批次数',
+         [({'model': name}, inference[name]['batches']) for name in batchers]),
+        ('bird_inference_items_total', 'counter', '推理图片数',
+         [({'model': name}, inference[name]['items']) for name in batchers]),
+        ('bird_inference_slot_wait_ms_total', 'counter', '等待推理槽位的累计时间（毫秒）',
+         [({'model': name}, inference[name]['slot_wait_ms']) for name in batchers]),
+        ('bird_uploads_deleted_files_total', 'counter', '上传目录清理删除的文件数', [({}, uploads['deleted_files'])]),
+        ('bird_uploads_reclaimed_bytes_total', 'counter', '上传目录清理回收的字节数', [({}, uploads['reclaimed_bytes'])]),
+    ]
+
+metrics_registry.register_collector(_collect_metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus 文本格式的运行指标（按 worker 进程统计）"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=80, debug=True)
\ No newline at end of file
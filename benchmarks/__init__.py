@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""性能基准脚本，需在项目根目录以 python -m benchmarks.<脚本名> 方式运行"""
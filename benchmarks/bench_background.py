@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+最终图像背景填充方式对比
+1. 速度：在按随机种子生成的画布与掩膜上，对每种 BIRD_BACKGROUND_MODE 测量
+   render_final_image 与分类输入准备（images_to_tensor）的耗时；
+   legacy 为改造前的做法：每次生成随机噪声、多余的 BGR→RGB 通道交换、转为 PIL 后经过 data_transforms
+2. 准确率（--accuracy）：在测试集上每张图片只分割一次，再按每种方式合成最终图像并分类，
+   报告相对 CSV 标注的 top-1 准确率，以及同一方式重复运行两次时预测不一致的图片数
+
+用法: python -m benchmarks.bench_background --runs 200
+      python -m benchmarks.bench_background --accuracy --limit 500
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmarks.bench_model_variants import load_test_set
+from benchmarks.common import summarize, write_results
+from image_utils import BACKGROUND_MODES, render_final_image
+
+VARIANTS = ('legacy',) + BACKGROUND_MODES
+
+
+def render_variant(variant, image_np, subject_mask, bbox):
+    """按方式合成最终图像；legacy 复现改造前的随机噪声与通道交换"""
+    if variant == 'legacy':
+        return np.ascontiguousarray(render_final_image(image_np, subject_mask, bbox, mode='random')[..., ::-1])
+    return render_final_image(image_np, subject_mask, bbox, mode=variant)
+
+
+def prepare_input(variant, final_image):
+    """分类输入准备；legacy 经 PIL 与 data_transforms，其余直接写入预分配张量"""
+    from model_utils import data_transforms, images_to_tensor
+    if variant == 'legacy':
+        return data_transforms(Image.fromarray(final_image)).unsqueeze(0)
+    return images_to_tensor([final_image])
+
+
+def seeded_samples(count, seed):
+    """随机画布与椭圆主体掩膜（与模型无关，每次运行相同）"""
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _ in range(count):
+        image_np = rng.integers(0, 256, (1024, 1024, 3), dtype=np.uint8)
+        mask = np.zeros((1024, 1024), dtype=np.uint8)
+        center = (int(rng.integers(300, 724)), int(rng.integers(300, 724)))
+        axes = (int(rng.integers(80, 300)), int(rng.integers(80, 300)))
+        cv2.ellipse(mask, center, axes, float(rng.uniform(0, 180)), 0, 360, 1, -1)
+        samples.append((image_np, mask, cv2.boundingRect(cv2.findNonZero(mask))))
+    return samples
+
+
+def run_speed(samples, runs):
+    """返回 {方式/步骤: 汇总统计}"""
+    results = {}
+    print(f"{'方式':<10}{'合成':>12}{'输入准备':>12}{'合计':>12}")
+    for variant in VARIANTS:
+        render_ms = []
+        prepare_ms = []
+        for i in range(runs):
+            image_np, mask, bbox = samples[i % len(samples)]
+            start = time.perf_counter()
+            final_image = render_variant(variant, image_np, mask, bbox)
+            middle = time.perf_counter()
+            prepare_input(variant, final_image)
+            end = time.perf_counter()
+            render_ms.append((middle - start) * 1000)
+            prepare_ms.append((end - middle) * 1000)
+        render = results[f'{variant}/render'] = summarize(render_ms)
+        prepare = results[f'{variant}/prepare'] = summarize(prepare_ms)
+        print(f"{variant:<10}{render['p50']:>10.3f}ms{prepare['p50']:>10.3f}ms"
+              f"{render['p50'] + prepare['p50']:>10.3f}ms")
+    return results
+
+
+def run_accuracy(csv_file, data_folder, limit, batch_size):
+    from image_utils import compress_pil_image, remove_background_batch, select_subject
+    from model_utils import classify_batch
+
+    samples = load_test_set(csv_file, data_folder, limit)
+    if not samples:
+        raise SystemExit(f"{csv_file} 中没有可用的测试集图片")
+
+    # 每张图片只分割、选择主体一次，各方式共用
+    subjects = []
+    labels = []
+    for path, label in samples:
+        with Image.open(path) as image:
+            canvas = compress_pil_image(image)
+        image_np = np.array(canvas)
+        mask = remove_background_batch([canvas])[0]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                subject_mask, bbox, _ = select_subject(image_np, mask)
+        except Exception:
+            continue
+        subjects.append((image_np, subject_mask, bbox))
+        labels.append(label)
+    print(f"🔍 测试集 {len(samples)} 张，其中 {len(subjects)} 张检测到主体")
+
+    def predict(variant):
+        predictions = []
+        for start in range(0, len(subjects), batch_size):
+            finals = [render_variant(variant, *subject) for subject in subjects[start:start + batch_size]]
+            if variant == 'legacy':
+                finals = [Image.fromarray(final) for final in finals]
+            predictions.extend(result['class_id'] for result in classify_batch(finals))
+        return predictions
+
+    print(f"{'方式':<10}{'准确率':>10}{'重复不一致':>12}")
+    for variant in VARIANTS:
+        first = predict(variant)
+        second = predict(variant)
+        accuracy = sum(a == b for a, b in zip(first, labels)) / len(labels)
+        unstable = sum(a != b for a, b in zip(first, second))
+        print(f"{variant:<10}{accuracy * 100:>9.2f}%{unstable:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="最终图像背景填充方式对比")
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--accuracy', action='store_true', help="在测试集上比较准确率（需要模型与数据集）")
+    parser.add_argument('--csv', default='all_data.csv')
+    parser.add_argument('--data-folder', default='static/')
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--output', default=None, help="保存速度结果的 JSON 路径，可用 benchmarks.compare 对比")
+    args = parser.parse_args()
+
+    print(f"🔍 速度: {args.runs} 次合成与输入准备（种子 {args.seed}），表中为 p50")
+    results = run_speed(seeded_samples(16, args.seed), args.runs)
+    if args.output:
+        write_results(args.output, 'background', results, args)
+        print(f"💾 结果已保存到 {args.output}")
+    if args.accuracy:
+        run_accuracy(args.csv, args.data_folder, args.limit, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
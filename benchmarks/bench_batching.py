@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+微批处理吞吐量基准
+对比逐张推理（当前路径）与 inference_server 动态微批处理在并发请求下的吞吐量。
+
+用法: python -m benchmarks.bench_batching --requests 64 --concurrency 8
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from image_utils import remove_background_batch
+from model_utils import classify_batch
+from inference_server import MicroBatcher, _segment_grouped
+
+
+def _load_inputs(image_path):
+    """准备与线上一致的输入：1024x1024 分割输入与 224x224 分类输入"""
+    image = Image.open(image_path).convert("RGB")
+    seg_input = image.resize((1024, 1024))
+    cls_input = image.resize((224, 224))
+    return seg_input, cls_input
+
+
+def _run(label, fn, inputs, concurrency):
+    """并发调用 fn 处理全部输入，返回每秒处理张数"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fn, inputs))
+    elapsed = time.perf_counter() - start
+    throughput = len(inputs) / elapsed
+    print(f"  {label:<28} {elapsed:8.2f}s  {throughput:8.2f} 张/秒")
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description="微批处理吞吐量基准")
+    parser.add_argument('--image', default='bird.jpg')
+    parser.add_argument('--requests', type=int, default=32)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--max-batch', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    seg_input, cls_input = _load_inputs(args.image)
+    seg_inputs = [seg_input] * args.requests
+    cls_inputs = [cls_input] * args.requests
+
+    # 预热，避免首次调用的初始化开销影响结果
+    remove_background_batch([seg_input])
+    classify_batch([cls_input])
+
+    print(f"🔍 请求数: {args.requests}, 并发: {args.concurrency}, "
+          f"max_batch: {args.max_batch}, max_wait: {args.max_wait_ms}ms")
+
+    seg_batcher = MicroBatcher(_segment_grouped, args.max_batch, args.max_wait_ms, name='bench-seg')
+    cls_batcher = MicroBatcher(classify_batch, args.max_batch, args.max_wait_ms, name='bench-cls')
+
+    print("分割 (DeepLabV3):")
+    seg_single = _run("逐张推理", lambda image: remove_background_batch([image])[0],
+                      seg_inputs, args.concurrency)
+    seg_batched = _run("微批处理", seg_batcher, seg_inputs, args.concurrency)
+
+    print("分类 (ResNet50):")
+    cls_single = _run("逐张推理", lambda image: classify_batch([image])[0],
+                      cls_inputs, args.concurrency)
+    cls_batched = _run("微批处理", cls_batcher, cls_inputs, args.concurrency)
+
+    print(f"📈 分割加速比: {seg_batched / seg_single:.2f}x, 平均批大小: "
+          f"{seg_batcher.stats['items'] / max(seg_batcher.stats['batches'], 1):.1f}")
+    print(f"📈 分类加速比: {cls_batched / cls_single:.2f}x, 平均批大小: "
+          f"{cls_batcher.stats['items'] / max(cls_batcher.stats['batches'], 1):.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+主页（照片墙）延迟与吞吐量基准
+对比两种模式：
+- uncached: 每次请求都重新加载数据集清单并构建照片墙目录
+- cached:   使用常驻内存的照片墙目录，每次请求只随机抽样 50 张
+
+用法: python -m benchmarks.bench_index_page --requests 200 --concurrency 4
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, photo_wall_catalog
+
+
+def _run(label, requests, concurrency, before_request=None):
+    """通过 Flask 测试客户端并发请求主页，打印延迟与每秒请求数"""
+    def fetch(_):
+        if before_request is not None:
+            before_request()
+        with app.test_client() as client:
+            start = time.perf_counter()
+            response = client.get('/')
+            elapsed = (time.perf_counter() - start) * 1000
+        assert response.status_code == 200, response.status_code
+        return elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timings = sorted(executor.map(fetch, range(requests)))
+    total = time.perf_counter() - start
+
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"  {label:<10} 平均 {statistics.mean(timings):7.2f}ms  中位数 {statistics.median(timings):7.2f}ms  "
+          f"p95 {p95:7.2f}ms  {requests / total:8.1f} 请求/秒")
+    return requests / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="主页延迟与吞吐量基准")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"🔍 照片墙有效图片: {len(photo_wall_catalog)} 张, 请求数: {args.requests}, 并发: {args.concurrency}")
+    # 预热模板缓存
+    _run("预热", min(args.requests, 10), 1)
+
+    uncached = _run("uncached", args.requests, args.concurrency, before_request=photo_wall_catalog.rebuild)
+    cached = _run("cached", args.requests, args.concurrency)
+    print(f"📈 吞吐量提升: {cached / uncached:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+模型运行时评估
+对 eager fp32 与 model_export.py 导出的各版本（TorchScript / int8 / ONNX）分别报告：
+- 分类模型在测试集上与 fp32 的 top-1 一致率，以及相对 CSV 标注的准确率
+- 分割模型前景掩膜与 fp32 的平均 IoU
+- 单张图片的分类 / 分割延迟
+- 模型加载后的常驻内存与进程峰值内存（每个版本在独立进程中运行）
+
+用法: python -m benchmarks.bench_model_variants --limit 500 --seg-limit 20
+"""
+
+import argparse
+import os
+import resource
+import statistics
+import time
+
+from benchmarks.bench_segmentation import mask_iou, spawn_call
+from dataset_manifest import ensure_manifest, DATASET_MANIFEST_PATH, FLAG_MISSING
+
+DEFAULT_RUNTIMES = ('torchscript', 'torchscript-int8', 'onnx', 'onnx-int8')
+
+
+def load_test_set(csv_file, data_folder, limit):
+    """从数据集清单读取测试集 (图片路径, 标注类别ID)，按 CSV 顺序取前 limit 张存在的图片"""
+    manifest = ensure_manifest(DATASET_MANIFEST_PATH, csv_file, data_folder)
+    return [(os.path.join(data_folder, entry.filepath), entry.class_id)
+            for entry in manifest.entries('test', exclude=FLAG_MISSING)[:limit]]
+
+
+def _current_rss_mb():
+    """当前常驻内存（MB）"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def _run_variant(runtime, samples, seg_paths):
+    """在子进程中按运行时加载两个模型并评估"""
+    os.environ['BIRD_MODEL_RUNTIME'] = runtime
+
+    import numpy as np
+    from PIL import Image
+    from model_utils import classify_batch, CLASSIFIER_RUNTIME
+    from image_utils import compress_pil_image, remove_background_batch, SEGMENTATION_RUNTIME
+
+    loaded_rss_mb = _current_rss_mb()
+
+    images = []
+    for path, _ in samples:
+        with Image.open(path) as image:
+            images.append(image.convert('RGB'))
+    canvases = []
+    for path in seg_paths:
+        with Image.open(path) as image:
+            canvases.append(compress_pil_image(image))
+
+    # 预热
+    classify_batch(images[:1])
+    remove_background_batch(canvases[:1])
+
+    classify_timings = []
+    predictions = []
+    for image in images:
+        start = time.perf_counter()
+        predictions.append(classify_batch([image])[0]['class_id'])
+        classify_timings.append((time.perf_counter() - start) * 1000)
+
+    segment_timings = []
+    masks = []
+    for canvas in canvases:
+        start = time.perf_counter()
+        mask = remove_background_batch([canvas])[0]
+        segment_timings.append((time.perf_counter() - start) * 1000)
+        masks.append(np.packbits(mask > 0))
+
+    return {
+        'classifier_runtime': CLASSIFIER_RUNTIME,
+        'segmentation_runtime': SEGMENTATION_RUNTIME,
+        'predictions': predictions,
+        'masks': masks,
+        'classify_ms': statistics.mean(classify_timings),
+        'segment_ms': statistics.mean(segment_timings),
+        'loaded_rss_mb': loaded_rss_mb,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="eager / TorchScript / int8 / ONNX 模型评估")
+    parser.add_argument('--csv', default='all_data.csv')
+    parser.add_argument('--data-folder', default='static/')
+    parser.add_argument('--limit', type=int, default=500, help="参与分类评估的测试集图片数")
+    parser.add_argument('--seg-limit', type=int, default=20, help="参与分割评估的图片数")
+    parser.add_argument('--runtimes', nargs='+', default=list(DEFAULT_RUNTIMES))
+    args = parser.parse_args()
+
+    samples = load_test_set(args.csv, args.data_folder, args.limit)
+    if not samples:
+        parser.error(f"{args.csv} 中没有可用的测试集图片")
+    seg_paths = [path for path, _ in samples[:args.seg_limit]]
+    labels = [class_id for _, class_id in samples]
+    print(f"🔍 分类评估 {len(samples)} 张，分割评估 {len(seg_paths)} 张")
+
+    reference = spawn_call(_run_variant, 'eager', samples, seg_paths)
+    outcomes = [('eager', reference)]
+    for runtime in args.runtimes:
+        print(f"  运行 {runtime} ...")
+        outcomes.append((runtime, spawn_call(_run_variant, runtime, samples, seg_paths)))
+
+    print(f"\n{'运行时':<18}{'实际(分类/分割)':<34}{'top1一致':>9}{'准确率':>8}{'掩膜IoU':>9}"
+          f"{'分类':>10}{'分割':>10}{'常驻内存':>10}{'峰值内存':>10}")
+    for runtime, outcome in outcomes:
+        agreement = sum(a == b for a, b in zip(outcome['predictions'], reference['predictions'])) / len(samples)
+        accuracy = sum(a == b for a, b in zip(outcome['predictions'], labels)) / len(samples)
+        iou = statistics.mean(mask_iou(a, b) for a, b in zip(outcome['masks'], reference['masks']))
+        actual = f"{outcome['classifier_runtime']}/{outcome['segmentation_runtime']}"
+        print(f"{runtime:<18}{actual:<34}{agreement * 100:>8.1f}%{accuracy * 100:>7.1f}%{iou:>9.3f}"
+              f"{outcome['classify_ms']:>8.1f}ms{outcome['segment_ms']:>8.1f}ms"
+              f"{outcome['loaded_rss_mb']:>8.0f}MB{outcome['peak_rss_mb']:>8.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+识别流程延迟基准
+对比基于文件的流程（compress_image → remove_background → create_final_image → predict_image，
+每一步都写入并重新读取 JPEG）与 pipeline.run_pipeline 的内存流程。
+
+用法: python -m benchmarks.bench_pipeline --runs 10
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+# 单调用方场景下无需等待凑批
+os.environ.setdefault('BIRD_INFERENCE_MAX_WAIT_MS', '0')
+
+from image_utils import compress_image, create_final_image
+from inference_server import remove_background, predict_image
+from pipeline import run_pipeline
+
+
+def file_based_pipeline(image_path, work_dir):
+    """原有的基于文件的流程"""
+    compressed_path = compress_image(image_path, output_folder=work_dir)
+    image_np, mask = remove_background(compressed_path)
+    final_image_path = create_final_image(image_np, mask, output_folder=work_dir)
+    return predict_image(final_image_path)
+
+
+def _measure(label, fn, runs):
+    """运行 runs 次并打印延迟统计（毫秒）"""
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    print(f"  {label:<12} 平均 {statistics.mean(timings):8.1f}ms  "
+          f"中位数 {statistics.median(timings):8.1f}ms  最小 {min(timings):8.1f}ms")
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文件流程与内存流程的延迟对比")
+    parser.add_argument('--image', default='bird.jpg')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    try:
+        # 预热
+        run_pipeline(args.image)
+
+        print(f"🔍 图片: {args.image}, 运行次数: {args.runs}")
+        file_label, file_ms = _measure("文件流程", lambda: file_based_pipeline(args.image, work_dir), args.runs)
+        memory_outcome, memory_ms = _measure("内存流程", lambda: run_pipeline(args.image), args.runs)
+
+        print(f"📈 延迟降低: {file_ms - memory_ms:.1f}ms ({(1 - memory_ms / file_ms) * 100:.1f}%)")
+        print(f"   文件流程结果: {file_label}, 内存流程结果: {memory_outcome['label']}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
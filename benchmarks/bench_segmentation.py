@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分割后端精度/延迟基准
+在固定的本地图片集上分别运行各分割后端，报告：
+- 分割延迟（平均 / p95）与相对基准的加速比
+- 进程峰值内存，以及其中推理过程新增的部分（每个后端在独立进程中运行，互不影响）
+- 前景掩膜与基准（全分辨率 deeplabv3_resnet101）的平均 IoU
+- 最终分类结果与基准一致的比例
+
+后端写法为「名称」、「名称@输入边长」或「名称@输入边长/mask」，例如 deeplabv3_resnet101@512 表示
+在 512x512 的缩小副本上分割后把全部类别 logits 上采样回 1024x1024 再取 argmax，
+deeplabv3_resnet101@512/mask 则在低分辨率下取 argmax，只上采样前景掩膜。
+
+用法: python -m benchmarks.bench_segmentation --images static/test --limit 50
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import resource
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+REFERENCE_BACKEND = 'deeplabv3_resnet101'
+
+DEFAULT_BACKENDS = (
+    'deeplabv3_resnet101@512',
+    'deeplabv3_resnet101@512/mask',
+    'deeplabv3_mobilenet_v3_large',
+    'lraspp_mobilenet_v3_large',
+    'lraspp_mobilenet_v3_large@512/mask',
+)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def parse_backend(spec):
+    """'名称@边长/上采样方式' -> (名称, 边长, 上采样方式)，未指定边长时为 0（全分辨率）"""
+    spec, _, upsample = spec.partition('/')
+    name, _, size = spec.partition('@')
+    return name, int(size) if size else 0, upsample or 'logits'
+
+
+def collect_images(image_dir, limit):
+    """按文件名排序取前 limit 张图片，保证每次运行使用同一图片集"""
+    paths = sorted(
+        path for path in glob.glob(os.path.join(image_dir, '**', '*'), recursive=True)
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit]
+
+
+def _run_backend(spec, image_paths):
+    """
+    在子进程中运行单个后端（通过环境变量选择，与线上配置方式一致）
+    Returns:
+        dict: 延迟、峰值内存、打包后的前景掩膜与分类结果
+    """
+    backend, input_size, upsample = parse_backend(spec)
+    os.environ['BIRD_SEGMENTATION_BACKEND'] = backend
+    os.environ['BIRD_SEGMENTATION_INPUT_SIZE'] = str(input_size)
+    os.environ['BIRD_SEGMENTATION_UPSAMPLE'] = upsample
+
+    import torch
+    from PIL import Image
+    from image_utils import compress_pil_image, remove_background_batch, select_subject, render_final_image
+    from model_utils import classify_batch
+
+    canvases = []
+    for path in image_paths:
+        with Image.open(path) as image:
+            canvases.append(compress_pil_image(image))
+
+    # 模型与图片已加载，此后的内存增长来自推理本身
+    baseline_memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    # 预热
+    remove_background_batch(canvases[:1])
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+
+    timings = []
+    masks = []
+    labels = []
+    for index, canvas in enumerate(canvases):
+        start = time.perf_counter()
+        mask = remove_background_batch([canvas])[0]
+        timings.append((time.perf_counter() - start) * 1000)
+        masks.append(np.packbits(mask > 0))
+
+        image_np = np.array(canvas)
+        try:
+            subject_mask, bbox, _ = select_subject(image_np, mask)
+        except Exception:
+            labels.append(None)
+            continue
+        # 固定噪声背景，保证各后端之间的分类结果可比
+        np.random.seed(index)
+        final_image = render_final_image(image_np, subject_mask, bbox)
+        labels.append(classify_batch([Image.fromarray(final_image)])[0]['class_id'])
+
+    peak_memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    inference_memory_mb = peak_memory_mb - baseline_memory_mb
+    if torch.cuda.is_available():
+        peak_memory_mb = inference_memory_mb = torch.cuda.max_memory_allocated() / 1024 / 1024
+    return {
+        'timings': timings,
+        'peak_memory_mb': peak_memory_mb,
+        'inference_memory_mb': inference_memory_mb,
+        'masks': masks,
+        'labels': labels
+    }
+
+
+def spawn_call(fn, *args):
+    """在全新的子进程中调用 fn，避免模型与内存统计相互影响"""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def run_isolated(spec, image_paths):
+    """在独立进程中运行单个后端"""
+    return spawn_call(_run_backend, spec, image_paths)
+
+
+def mask_iou(packed_a, packed_b):
+    """两个打包前景掩膜的 IoU，二者都为空时视为 1"""
+    a = np.unpackbits(packed_a).astype(bool)
+    b = np.unpackbits(packed_b).astype(bool)
+    union = np.count_nonzero(a | b)
+    return 1.0 if union == 0 else np.count_nonzero(a & b) / union
+
+
+def summarize(spec, outcome, reference):
+    """计算相对基准的指标"""
+    timings = sorted(outcome['timings'])
+    ious = [mask_iou(a, b) for a, b in zip(outcome['masks'], reference['masks'])]
+    agree = sum(1 for a, b in zip(outcome['labels'], reference['labels']) if a == b)
+    return {
+        'backend': spec,
+        'mean_ms': statistics.mean(timings),
+        'p95_ms': timings[max(0, int(len(timings) * 0.95) - 1)],
+        'speedup': statistics.mean(reference['timings']) / statistics.mean(timings),
+        'peak_memory_mb': outcome['peak_memory_mb'],
+        'inference_memory_mb': outcome['inference_memory_mb'],
+        'mask_iou': statistics.mean(ious),
+        'label_agreement': agree / len(outcome['labels']),
+        'failed': sum(1 for label in outcome['labels'] if label is None)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分割后端精度/延迟基准")
+    parser.add_argument('--images', default='static/test', help="本地图片目录（递归查找）")
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--backends', nargs='+', default=list(DEFAULT_BACKENDS),
+                        help="待比较的后端，格式为 名称、名称@输入边长 或 名称@输入边长/mask")
+    args = parser.parse_args()
+
+    image_paths = collect_images(args.images, args.limit)
+    if not image_paths:
+        parser.error(f"在 {args.images} 中未找到图片")
+    print(f"🔍 图片: {len(image_paths)} 张（{args.images}），基准后端: {REFERENCE_BACKEND}")
+
+    reference = run_isolated(REFERENCE_BACKEND, image_paths)
+    rows = [summarize(REFERENCE_BACKEND, reference, reference)]
+    for spec in args.backends:
+        print(f"  运行 {spec} ...")
+        rows.append(summarize(spec, run_isolated(spec, image_paths), reference))
+
+    print(f"\n{'后端':<34}{'平均':>9}{'p95':>9}{'加速':>7}{'峰值内存':>10}{'推理内存':>10}"
+          f"{'掩膜IoU':>9}{'结果一致':>9}{'失败':>5}")
+    for row in rows:
+        print(f"{row['backend']:<34}{row['mean_ms']:>7.1f}ms{row['p95_ms']:>7.1f}ms{row['speedup']:>6.2f}x"
+              f"{row['peak_memory_mb']:>8.0f}MB{row['inference_memory_mb']:>8.0f}MB"
+              f"{row['mask_iou']:>9.3f}{row['label_agreement'] * 100:>8.1f}%{row['failed']:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+主体选择微基准
+在随机生成的含噪声掩膜（数十到数百个连通组件）上对比：
+- reference:  改造前的逐组件循环（每个组件生成一张整图掩膜并调用 countNonZero / findNonZero / boundingRect）
+- vectorized: image_utils.select_subject（connectedComponentsWithStats + NumPy 批量评分）
+同时校验两者选出的组件、边界框与掩膜完全一致。
+
+用法: python -m benchmarks.bench_select_subject --masks 20 --blobs 300
+"""
+
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+from image_utils import select_subject
+
+
+def select_subject_reference(image_np, mask):
+    """改造前的实现（仅用于对比）"""
+    subject_mask = (mask > 0).astype(np.uint8)
+    kernel_small = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    subject_mask = cv2.morphologyEx(subject_mask, cv2.MORPH_OPEN, kernel_small)
+    kernel_large = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+    subject_mask = cv2.morphologyEx(subject_mask, cv2.MORPH_CLOSE, kernel_large)
+
+    num_labels, labels_im = cv2.connectedComponents(subject_mask)
+    num_subjects = num_labels - 1
+    if num_subjects == 0:
+        raise Exception("未检测到任何主体")
+    elif num_subjects == 1:
+        x, y, w, h = cv2.boundingRect(cv2.findNonZero(subject_mask))
+        best_component = 1
+    else:
+        best_score = 0
+        best_component = 0
+        image_center_x, image_center_y = image_np.shape[1] // 2, image_np.shape[0] // 2
+        for label in range(1, num_labels):
+            component_mask = (labels_im == label).astype(np.uint8)
+            area = cv2.countNonZero(component_mask)
+            if area < 100:
+                continue
+            coords = cv2.findNonZero(component_mask)
+            if coords is None:
+                continue
+            x, y, w, h = cv2.boundingRect(coords)
+            component_center_x = x + w // 2
+            component_center_y = y + h // 2
+            area_score = area / (image_np.shape[0] * image_np.shape[1])
+            distance_to_center = np.sqrt((component_center_x - image_center_x)**2 +
+                                         (component_center_y - image_center_y)**2)
+            max_distance = np.sqrt(image_center_x**2 + image_center_y**2)
+            position_score = 1 - (distance_to_center / max_distance)
+            aspect_ratio = max(w, h) / min(w, h)
+            if aspect_ratio <= 2.0:
+                shape_score = 1.0
+            elif aspect_ratio <= 3.0:
+                shape_score = 0.7
+            else:
+                shape_score = 0.3
+            size_ratio = min(w, h) / max(image_np.shape[0], image_np.shape[1])
+            size_score = 1.0 if 0.1 <= size_ratio <= 0.8 else 0.5
+            total_score = (area_score * 0.6 + position_score * 0.1 +
+                           shape_score * 0.1 + size_score * 0.1)
+            if total_score > best_score:
+                best_score = total_score
+                best_component = label
+        if best_component == 0:
+            raise Exception("未找到合适的主体组件")
+        subject_mask = (labels_im == best_component).astype(np.uint8)
+        x, y, w, h = cv2.boundingRect(cv2.findNonZero(subject_mask))
+
+    if w < 64 or h < 64:
+        raise Exception(f"主体尺寸过小（{w}x{h}）")
+    return subject_mask, (x, y, w, h), best_component
+
+
+def noisy_mask(rng, blobs, size=1024):
+    """生成一个大主体加大量随机小斑块的分割掩膜"""
+    mask = np.zeros((size, size), dtype=np.uint8)
+    cv2.ellipse(mask, (size // 2, size // 2), (size // 5, size // 7), 0, 0, 360, 3, -1)
+    for _ in range(blobs):
+        center = (int(rng.integers(0, size)), int(rng.integers(0, size)))
+        radius = int(rng.integers(3, 20))
+        cv2.circle(mask, center, radius, int(rng.integers(1, 21)), -1)
+    return mask
+
+
+def _measure(fn, image_np, masks, runs):
+    """返回每个掩膜的中位耗时（毫秒）与最后一次的结果"""
+    timings = []
+    results = []
+    for mask in masks:
+        samples = []
+        result = None
+        for _ in range(runs):
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                try:
+                    result = fn(image_np, mask)
+                except Exception as e:
+                    result = e
+                samples.append((time.perf_counter() - start) * 1000)
+        timings.append(statistics.median(samples))
+        results.append(result)
+    return timings, results
+
+
+def _same(a, b):
+    if isinstance(a, Exception) or isinstance(b, Exception):
+        return type(a) is type(b) and str(a) == str(b)
+    return a[1] == b[1] and a[2] == b[2] and np.array_equal(a[0], b[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="主体选择微基准")
+    parser.add_argument('--masks', type=int, default=20)
+    parser.add_argument('--blobs', type=int, default=300, help="每个掩膜中的随机斑块数")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    masks = [noisy_mask(rng, args.blobs) for _ in range(args.masks)]
+    image_np = np.zeros((1024, 1024, 3), dtype=np.uint8)
+    components = [cv2.connectedComponents((mask > 0).astype(np.uint8))[0] - 1 for mask in masks]
+    print(f"🔍 掩膜: {args.masks} 张 1024x1024，连通组件数 {min(components)}~{max(components)}（形态学处理前）")
+
+    reference_ms, reference_results = _measure(select_subject_reference, image_np, masks, args.runs)
+    vectorized_ms, vectorized_results = _measure(select_subject, image_np, masks, args.runs)
+
+    mismatches = sum(not _same(a, b) for a, b in zip(reference_results, vectorized_results))
+    print(f"  reference   中位数 {statistics.median(reference_ms):8.2f}ms  最大 {max(reference_ms):8.2f}ms")
+    print(f"  vectorized  中位数 {statistics.median(vectorized_ms):8.2f}ms  最大 {max(vectorized_ms):8.2f}ms")
+    print(f"📈 加速比: {statistics.median(reference_ms) / statistics.median(vectorized_ms):.1f}x，"
+          f"结果不一致: {mismatches} 张")
+
+
+if __name__ == "__main__":
+    main()
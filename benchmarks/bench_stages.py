@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+识别流程分步微基准
+在固定输入上分别测量 image_utils / model_utils 的每个步骤：
+    decode → compress → segmentation → select_subject → render → preprocess → classify
+输入为 bird.jpg 与按随机种子生成的合成照片（不同尺寸，含一个椭圆形主体），每次运行完全相同；
+各步骤的输入由上一步骤在预热时的输出提供。
+结果写入 JSON（每个步骤的汇总以及「步骤/输入」的明细），可用 --baseline 与已保存的基线对比。
+
+用法: python -m benchmarks.bench_stages --runs 10 --output bench_results/stages.json
+      python -m benchmarks.bench_stages --stages decode compress select_subject render --baseline baselines/stages.json
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.common import summarize, write_results, load_results, compare_results, print_comparison
+
+STAGES = ('decode', 'compress', 'segmentation', 'select_subject', 'render', 'preprocess', 'classify')
+
+# 合成照片的尺寸：小图、普通照片、相机原图
+SYNTHETIC_SIZES = ((800, 600), (1600, 1200), (4000, 3000))
+
+
+def make_synthetic_photo(rng, width, height):
+    """平滑的随机背景加一个椭圆形主体，返回 JPEG 字节"""
+    import cv2
+
+    small = rng.integers(0, 256, (max(1, height // 32), max(1, width // 32), 3), dtype=np.uint8)
+    background = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    center = (int(width * rng.uniform(0.4, 0.6)), int(height * rng.uniform(0.4, 0.6)))
+    axes = (int(width * rng.uniform(0.12, 0.2)), int(height * rng.uniform(0.12, 0.2)))
+    color = tuple(int(c) for c in rng.integers(0, 256, 3))
+    cv2.ellipse(background, center, axes, float(rng.uniform(0, 180)), 0, 360, color, -1)
+    buffer = io.BytesIO()
+    Image.fromarray(background).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def build_inputs(image_path, seed):
+    """{输入名: JPEG 字节}"""
+    inputs = {}
+    if image_path and os.path.exists(image_path):
+        with open(image_path, 'rb') as f:
+            inputs[os.path.basename(image_path)] = f.read()
+    rng = np.random.default_rng(seed)
+    for width, height in SYNTHETIC_SIZES:
+        inputs[f'synthetic_{width}x{height}'] = make_synthetic_photo(rng, width, height)
+    return inputs
+
+
+def _time(fn, runs):
+    """运行 runs 次，返回延迟列表（毫秒）与最后一次的结果；步骤输出的日志被丢弃"""
+    timings = []
+    result = None
+    for _ in range(runs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = fn()
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings, result
+
+
+def run_stages(inputs, stages, runs):
+    """返回 {步骤: 延迟列表} 与 {步骤/输入: 延迟列表}"""
+    import torch
+    from image_utils import compress_pil_image, remove_background_batch, select_subject, render_final_image
+    from model_utils import classify_batch, images_to_tensor
+    from pipeline import load_image, CANVAS_SIZE
+
+    per_stage = {stage: [] for stage in stages}
+    per_input = {}
+
+    def measure(stage, name, fn):
+        if stage not in stages:
+            # 未选中的步骤只执行一次，为后续步骤提供输入
+            with contextlib.redirect_stdout(io.StringIO()):
+                return fn()
+        _time(fn, 1)  # 预热
+        timings, result = _time(fn, runs)
+        per_stage[stage].extend(timings)
+        per_input[f'{stage}/{name}'] = timings
+        return result
+
+    for name, data in inputs.items():
+        decoded = measure('decode', name, lambda: load_image(io.BytesIO(data), target_size=CANVAS_SIZE))
+        canvas = measure('compress', name, lambda: compress_pil_image(decoded))
+        if not {'segmentation', 'select_subject', 'render', 'preprocess', 'classify'} & set(stages):
+            continue
+        mask = measure('segmentation', name, lambda: remove_background_batch([canvas])[0])
+        image_np = np.array(canvas)
+        try:
+            subject_mask, bbox, _ = measure('select_subject', name, lambda: select_subject(image_np, mask))
+        except Exception as e:
+            print(f"⚠️ {name}: 未找到主体（{e}），跳过后续步骤")
+            continue
+        final_image = measure('render', name, lambda: render_final_image(image_np, subject_mask, bbox))
+        measure('preprocess', name, lambda: images_to_tensor([final_image]))
+        with torch.no_grad():
+            measure('classify', name, lambda: classify_batch([final_image]))
+    return per_stage, per_input
+
+
+def main():
+    parser = argparse.ArgumentParser(description="识别流程分步微基准")
+    parser.add_argument('--image', default='bird.jpg')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--output', default='bench_results/stages.json')
+    parser.add_argument('--baseline', default=None, help="基线结果 JSON，指定时输出对比并在回退时以退出码 1 结束")
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    np.random.seed(args.seed)
+    inputs = build_inputs(args.image, args.seed)
+    print(f"🔍 输入: {', '.join(inputs)}；每个步骤运行 {args.runs} 次")
+    per_stage, per_input = run_stages(inputs, args.stages, args.runs)
+
+    results = {stage: summarize(timings) for stage, timings in per_stage.items() if timings}
+    results.update({name: summarize(timings) for name, timings in per_input.items()})
+
+    print(f"{'步骤':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'次/秒':>10}")
+    for stage in args.stages:
+        if stage in results:
+            summary = results[stage]
+            print(f"{stage:<16}{summary['p50']:>8.2f}ms{summary['p95']:>8.2f}ms{summary['p99']:>8.2f}ms"
+                  f"{summary['throughput']:>10.1f}")
+
+    payload = write_results(args.output, 'stages', results, args)
+    print(f"💾 结果已保存到 {args.output}")
+    if args.baseline:
+        regressions = print_comparison(compare_results(payload, load_results(args.baseline), args.threshold),
+                                       args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
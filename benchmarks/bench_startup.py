@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+启动时间与 worker 内存基准
+1. 启动时间：在新进程中导入 app，对比延迟加载（默认）与预加载（BIRD_PRELOAD_MODELS=1）的导入耗时与常驻内存
+2. worker 内存：模拟 gunicorn 的 fork 模型启动多个 worker，每个 worker 完成一次分割与分类后读取
+   /proc/<pid>/smaps_rollup，对比「fork 前预加载」与「各 worker 自行加载」的 RSS / PSS / 私有内存
+
+用法: python -m benchmarks.bench_startup --workers 4 --image bird.jpg
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+
+from benchmarks.bench_segmentation import spawn_call
+
+_IMPORT_APP = '''
+import json, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+from model_registry import model_registry
+with open('/proc/self/statm') as f:
+    rss_mb = int(f.read().split()[1]) * __import__('os').sysconf('SC_PAGE_SIZE') / 1024 / 1024
+print(json.dumps({'import_seconds': elapsed, 'rss_mb': rss_mb, 'models': model_registry.status()}))
+'''
+
+
+def measure_startup(preload):
+    """在新进程中导入 app，返回导入耗时、常驻内存与模型状态"""
+    env = dict(os.environ, BIRD_PRELOAD_MODELS='1' if preload else '0')
+    output = subprocess.run([sys.executable, '-c', _IMPORT_APP], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def read_smaps_rollup(pid):
+    """读取进程的 Rss / Pss / 私有内存（MB）"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        'rss_mb': values.get('Rss', 0.0),
+        'pss_mb': values.get('Pss', 0.0),
+        'private_mb': values.get('Private_Clean', 0.0) + values.get('Private_Dirty', 0.0)
+    }
+
+
+def _worker(image_path, ready, done):
+    """模拟一个 worker：完成一次分割与分类后等待父进程测量内存"""
+    from PIL import Image
+    from image_utils import compress_pil_image, remove_background_batch
+    from model_utils import classify_batch
+
+    with Image.open(image_path) as image:
+        canvas = compress_pil_image(image)
+    remove_background_batch([canvas])
+    classify_batch([canvas])
+    ready.set()
+    done.wait()
+
+
+def measure_workers(preload, workers, image_path):
+    """在当前进程中（可选地预加载后）fork 出 workers 个子进程并测量各自的内存"""
+    import image_utils  # noqa: F401  登记分割模型
+    import model_utils  # noqa: F401  登记分类模型
+    from model_registry import preload_for_fork
+
+    if preload:
+        preload_for_fork()
+
+    context = multiprocessing.get_context('fork')
+    done = context.Event()
+    processes = []
+    for _ in range(workers):
+        ready = context.Event()
+        process = context.Process(target=_worker, args=(image_path, ready, done), daemon=True)
+        process.start()
+        processes.append((process, ready))
+
+    try:
+        for _, ready in processes:
+            ready.wait()
+        # 全部 worker 都存活时测量，PSS 才能反映共享情况
+        return [read_smaps_rollup(process.pid) for process, _ in processes]
+    finally:
+        done.set()
+        for process, _ in processes:
+            process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动时间与 worker 内存基准")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--image', default='bird.jpg')
+    args = parser.parse_args()
+
+    print("🔍 启动时间（导入 app）")
+    for preload in (False, True):
+        startup = measure_startup(preload)
+        load_seconds = sum(status['load_seconds'] or 0 for status in startup['models'].values())
+        label = "预加载" if preload else "延迟加载"
+        print(f"  {label:<6} 导入 {startup['import_seconds']:6.2f}s（其中模型加载 {load_seconds:5.2f}s）"
+              f"  常驻内存 {startup['rss_mb']:7.0f}MB")
+
+    print(f"\n🔍 worker 内存（{args.workers} 个 worker，各完成一次推理）")
+    for preload in (False, True):
+        # 每种模式在全新的进程中 fork，避免相互影响
+        stats = spawn_call(measure_workers, preload, args.workers, args.image)
+        label = "fork前预加载" if preload else "各自加载"
+        rss = sum(item['rss_mb'] for item in stats) / len(stats)
+        pss = sum(item['pss_mb'] for item in stats) / len(stats)
+        private = sum(item['private_mb'] for item in stats) / len(stats)
+        print(f"  {label:<8} 每个 worker RSS {rss:7.0f}MB  PSS {pss:7.0f}MB  私有 {private:7.0f}MB  "
+              f"合计 PSS {sum(item['pss_mb'] for item in stats):7.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
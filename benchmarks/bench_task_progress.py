@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+任务进度查询负载测试
+用真实的 JobStore / JobQueue（临时数据库）模拟 --clients 个同时等待结果的处理页，
+任务由 --workers 个工作线程依次执行，每个步骤耗时 --step-ms 毫秒。对比：
+- poll:           改造前的处理页，每 --interval 秒请求一次 /task_status
+- longpoll:       长轮询，任务状态变化时在同一进程内立即唤醒
+- longpoll-xproc: 长轮询，但任务在另一个进程中更新（只能靠每 BIRD_TASK_WAIT_RECHECK 秒复查数据库发现）
+- gunicorn:       按 gunicorn.conf.py 的设置模拟部署：每个 web worker 一个 JobStore（各自的等待数上限）与
+                  --workers 个工作线程，任务轮流分配给各 worker，客户端的每次请求随机落在某个 worker 上；
+                  超过等待数上限的请求按 retry_after 退回轮询
+报告请求总数、每个客户端的请求数、被拒绝（退回轮询）的请求数，以及任务完成到客户端发现之间的延迟。
+
+用法: python -m benchmarks.bench_task_progress --clients 100 --workers 2 --step-ms 100
+      python -m benchmarks.bench_task_progress --modes gunicorn --gunicorn-conf gunicorn.conf.py
+"""
+
+import argparse
+import os
+import random
+import runpy
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+from benchmarks.common import percentile
+from jobs import JobStore, JobQueue, FINISHED_STATUSES, JOB_WAIT_RECHECK
+
+STEPS = ('compress_image', 'remove_background', 'create_final_image', 'prediction')
+
+
+def run_mode(mode, clients, workers, step_ms, interval, timeout, web_workers=1, max_waiters=None,
+             recheck=JOB_WAIT_RECHECK, seed=0):
+    with tempfile.TemporaryDirectory(prefix='bench_jobs_') as work_dir:
+        db_path = os.path.join(work_dir, 'jobs.db')
+        if mode == 'gunicorn':
+            # 每个 web worker 进程各有一个 JobStore（独立的 JobEvents 与等待数上限）
+            worker_stores = [JobStore(db_path, max_waiters=max_waiters) for _ in range(web_workers)]
+            client_stores = worker_stores
+        else:
+            worker_stores = [JobStore(db_path, max_waiters=clients)]
+            # 另一个 JobStore 实例拥有独立的 JobEvents，相当于由其他进程处理请求
+            client_stores = [JobStore(db_path, max_waiters=clients)] if mode == 'longpoll-xproc' else worker_stores
+        completed_at = {}
+        rng = random.Random(seed)
+        rng_lock = threading.Lock()
+
+        def make_handler(store):
+            def handler(task_id, payload):
+                store.set_fields(task_id, status='processing')
+                for step in STEPS:
+                    time.sleep(step_ms / 1000)
+                    store.set_step(task_id, step)
+                store.set_fields(task_id, status='completed', result='bench')
+                completed_at[task_id] = time.perf_counter()
+            return handler
+
+        # 清理线程在测试期间不运行（临时数据库随后会被删除）
+        job_queues = [JobQueue(make_handler(store), store, num_workers=workers, max_queue=clients,
+                               cleanup_interval=24 * 3600) for store in worker_stores]
+        task_ids = [str(uuid.uuid4()) for _ in range(clients)]
+        for task_id in task_ids:
+            worker_stores[0].create(task_id, {'status': 'queued', 'steps': {step: False for step in STEPS}})
+
+        request_counts = {}
+        noticed_at = {}
+
+        def pick_store():
+            if len(client_stores) == 1:
+                return client_stores[0]
+            with rng_lock:
+                return rng.choice(client_stores)
+
+        def client(task_id):
+            requests = 0
+            revision = -1
+            while True:
+                requests += 1
+                store = pick_store()
+                if mode == 'poll':
+                    task = store.get(task_id)
+                else:
+                    task, waited = store.wait_for_change(task_id, revision, timeout, recheck)
+                    revision = task.get('revision', 0)
+                if task['status'] in FINISHED_STATUSES:
+                    noticed_at[task_id] = time.perf_counter()
+                    break
+                if mode == 'poll':
+                    time.sleep(interval)
+                elif not waited:
+                    # 与 /task_status 相同：等待数超过上限时客户端 1 秒后重试
+                    time.sleep(task.get('retry_after', 1))
+            request_counts[task_id] = requests
+
+        threads = [threading.Thread(target=client, args=(task_id,), daemon=True) for task_id in task_ids]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for i, task_id in enumerate(task_ids):
+            job_queues[i % len(job_queues)].submit(task_id, {})
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        lags = sorted((noticed_at[task_id] - completed_at[task_id]) * 1000 for task_id in task_ids)
+        counts = list(request_counts.values())
+        return {
+            'requests': sum(counts),
+            'per_client': statistics.mean(counts),
+            'rejected': sum(store.waiter_stats['rejected'] for store in client_stores),
+            'lag_p50': percentile(lags, 50),
+            'lag_p95': percentile(lags, 95),
+            'elapsed': elapsed
+        }
+
+
+def gunicorn_settings(conf_path):
+    """
+    执行 gunicorn 配置文件
+    Returns:
+        tuple: (web worker 数, 每个 worker 的线程数, 每个 worker 的长轮询等待数上限, 跨进程复查间隔)
+    """
+    conf = runpy.run_path(conf_path)
+    recheck = float(os.environ.get('BIRD_TASK_WAIT_RECHECK', JOB_WAIT_RECHECK))
+    return conf['workers'], conf['threads'], int(os.environ['BIRD_TASK_MAX_WAITERS']), recheck
+
+
+def main():
+    parser = argparse.ArgumentParser(description="任务进度查询负载测试")
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=2, help="每个进程的任务工作线程数")
+    parser.add_argument('--step-ms', type=float, default=100)
+    parser.add_argument('--interval', type=float, default=1.0, help="轮询间隔（秒）")
+    parser.add_argument('--timeout', type=float, default=25.0, help="长轮询最长等待时间（秒）")
+    parser.add_argument('--modes', nargs='+', default=['poll', 'longpoll', 'longpoll-xproc', 'gunicorn'])
+    parser.add_argument('--gunicorn-conf', default='gunicorn.conf.py', help="gunicorn 模式使用的配置文件")
+    args = parser.parse_args()
+
+    if 'gunicorn' in args.modes:
+        web_workers, threads, max_waiters, gunicorn_recheck = gunicorn_settings(args.gunicorn_conf)
+        print(f"⚙️ {args.gunicorn_conf}: {web_workers} 个 worker x {threads} 个线程，"
+              f"每个 worker 最多 {max_waiters} 个长轮询等待，跨进程复查间隔 {gunicorn_recheck}s")
+
+    print(f"🔍 {args.clients} 个等待中的客户端，{args.workers} 个工作线程，每个任务 {len(STEPS)} 步 x {args.step_ms:.0f}ms")
+    print(f"{'模式':<16}{'请求总数':>10}{'每客户端':>10}{'被拒绝':>8}{'发现延迟p50':>14}{'p95':>10}{'总耗时':>10}")
+    for mode in args.modes:
+        if mode == 'gunicorn':
+            outcome = run_mode(mode, args.clients, args.workers, args.step_ms, args.interval, args.timeout,
+                               web_workers, max_waiters, gunicorn_recheck)
+        else:
+            outcome = run_mode(mode, args.clients, args.workers, args.step_ms, args.interval, args.timeout)
+        print(f"{mode:<16}{outcome['requests']:>10}{outcome['per_client']:>10.1f}{outcome['rejected']:>8}"
+              f"{outcome['lag_p50']:>12.0f}ms{outcome['lag_p95']:>8.0f}ms{outcome['elapsed']:>9.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+线程策略负载测试
+对每组「推理槽位数:intra-op 线程数:inter-op 线程数」在独立进程中启动推理服务，
+用固定数量的并发客户端线程调用完整识别流程（pipeline.run_pipeline），报告 p50/p95/p99 延迟与吞吐量。
+inter-op 线程数每个进程只能设置一次，因此每组设置都使用新进程。
+
+--workers N 同时启动 N 个进程（模拟 gunicorn 的 N 个 worker，各自承受 --concurrency 个客户端的负载），
+结果为所有进程的合计；最后按吞吐量给出推荐设置，可用 --output 保存结果作为选择默认值的依据。
+
+用法: python -m benchmarks.bench_threads --requests 64 --concurrency 4 --settings 1:8:1 2:4:1 4:2:1
+      python -m benchmarks.bench_threads --workers 2 --output bench_results/threads.json
+（intra-op 线程数为 0 时按 CPU 核数 / (worker 数 x 槽位数) 计算，inter-op 线程数为 0 时使用 PyTorch 默认值；
+默认设置包含改造前的行为：不限制槽位、每次计算使用全部核心）
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from benchmarks.common import summarize, write_results
+
+
+def _run_setting(setting, image_path, requests, concurrency, workers, barrier):
+    """在子进程中按设置启动推理服务，所有进程预热完成后同时施加负载"""
+    slots, intra, inter = setting.split(':')
+    os.environ['BIRD_INFERENCE_SLOTS'] = slots
+    os.environ['BIRD_TORCH_THREADS'] = intra
+    os.environ['BIRD_TORCH_INTEROP_THREADS'] = inter
+    os.environ['BIRD_WEB_WORKERS'] = str(workers)
+
+    from PIL import Image
+    import inference_server
+    from pipeline import run_pipeline
+
+    with Image.open(image_path) as image:
+        source = image.convert('RGB')
+
+    # 预热（加载模型）
+    run_pipeline(source)
+    barrier.wait()
+
+    def one_request(_):
+        start = time.perf_counter()
+        run_pipeline(source)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one_request, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'policy': inference_server.get_stats()['thread_policy'],
+        'latencies': latencies,
+        'elapsed': elapsed
+    }
+
+
+def run_setting(setting, image_path, requests, concurrency, workers):
+    """在 workers 个全新进程中同时运行同一设置，返回合计的汇总统计与线程策略"""
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager:
+        barrier = manager.Barrier(workers)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [executor.submit(_run_setting, setting, image_path, requests, concurrency, workers, barrier)
+                       for _ in range(workers)]
+            outcomes = [future.result() for future in futures]
+    latencies = [latency for outcome in outcomes for latency in outcome['latencies']]
+    return summarize(latencies, max(outcome['elapsed'] for outcome in outcomes)), outcomes[0]['policy']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="线程策略负载测试")
+    parser.add_argument('--image', default='bird.jpg')
+    parser.add_argument('--requests', type=int, default=64, help="每个进程的请求数")
+    parser.add_argument('--concurrency', type=int, default=4, help="每个进程的并发客户端数")
+    parser.add_argument('--workers', type=int, default=1, help="同时运行的进程数（模拟 gunicorn worker 数）")
+    parser.add_argument('--settings', nargs='+', default=None,
+                        help="槽位数:intra-op 线程数:inter-op 线程数")
+    parser.add_argument('--output', default=None, help="保存结果的 JSON 路径")
+    args = parser.parse_args()
+
+    if args.settings is None:
+        cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+        args.settings = [
+            f"{args.concurrency * 2}:{cpu_count}:0",  # 改造前：不限制并发，每次计算使用全部核心
+            '1:0:1',
+            '2:0:1',
+            '4:0:1',
+        ]
+
+    print(f"🔍 图片: {args.image}, 进程数: {args.workers}, 每个进程请求数: {args.requests}, "
+          f"并发客户端: {args.concurrency}")
+    print(f"{'设置':<10}{'槽位':>5}{'intra':>6}{'inter':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'平均':>10}{'吞吐量':>12}")
+    results = {}
+    for setting in args.settings:
+        summary, policy = run_setting(setting, args.image, args.requests, args.concurrency, args.workers)
+        results[setting] = dict(summary, policy=policy)
+        print(f"{setting:<10}{policy['inference_slots']:>5}{policy['intra_op_threads']:>6}{policy['inter_op_threads']:>6}"
+              f"{summary['p50']:>8.0f}ms{summary['p95']:>8.0f}ms{summary['p99']:>8.0f}ms{summary['mean']:>8.0f}ms"
+              f"{summary['throughput']:>8.2f}张/秒")
+
+    best = max(results, key=lambda setting: results[setting]['throughput'])
+    policy = results[best]['policy']
+    print(f"✅ 吞吐量最高的设置: {best}（p95 {results[best]['p95']:.0f}ms），对应环境变量:")
+    print(f"   BIRD_WEB_WORKERS={args.workers} BIRD_INFERENCE_SLOTS={policy['inference_slots']} "
+          f"BIRD_TORCH_THREADS={policy['intra_op_threads']} BIRD_TORCH_INTEROP_THREADS={policy['inter_op_threads']}")
+    if args.output:
+        write_results(args.output, 'threads', results, args)
+        print(f"💾 结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+大图上传解码基准
+用固定随机种子生成一张 24MP（6000x4000）JPEG，对比：
+- full:  改造前的路径，上传先写入 uploads/，再完整解码后缩放到 1024x1024 画布
+- draft: pipeline.load_image 在内存中按画布尺寸解码（JPEG draft），再缩放到画布
+每种方式在独立进程中运行，报告延迟与进程峰值内存。
+
+用法: python -m benchmarks.bench_upload_decode --runs 10
+"""
+
+import argparse
+import io
+import os
+import resource
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_segmentation import spawn_call
+
+
+def make_camera_jpeg(width=6000, height=4000, seed=0):
+    """生成带噪声纹理的大尺寸 JPEG（纯色图会让解码器走捷径）"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((width, height), Image.Resampling.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def _run_mode(mode, data, runs):
+    from PIL import Image
+    from image_utils import compress_pil_image
+    from pipeline import load_image, CANVAS_SIZE
+
+    baseline_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    timings = []
+    with tempfile.TemporaryDirectory(prefix='bench_upload_') as work_dir:
+        for _ in range(runs):
+            start = time.perf_counter()
+            if mode == 'full':
+                path = os.path.join(work_dir, 'upload.jpg')
+                with open(path, 'wb') as f:
+                    f.write(data)
+                with Image.open(path) as image:
+                    canvas = compress_pil_image(image.convert('RGB'))
+            else:
+                canvas = compress_pil_image(load_image(io.BytesIO(data), target_size=CANVAS_SIZE))
+            timings.append((time.perf_counter() - start) * 1000)
+    assert canvas.size == (CANVAS_SIZE, CANVAS_SIZE)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {'timings': timings, 'peak_growth_mb': peak_mb - baseline_mb}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大图上传解码基准")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--width', type=int, default=6000)
+    parser.add_argument('--height', type=int, default=4000)
+    args = parser.parse_args()
+
+    data = make_camera_jpeg(args.width, args.height)
+    print(f"🔍 {args.width}x{args.height} JPEG，{len(data) / 1024 / 1024:.1f}MB，运行 {args.runs} 次")
+    results = {}
+    for mode in ('full', 'draft'):
+        outcome = spawn_call(_run_mode, mode, data, args.runs)
+        results[mode] = statistics.median(outcome['timings'])
+        print(f"  {mode:<6} 中位数 {results[mode]:8.1f}ms  最大 {max(outcome['timings']):8.1f}ms  "
+              f"峰值内存增长 {outcome['peak_growth_mb']:7.1f}MB")
+    print(f"📈 延迟降低: {(1 - results['draft'] / results['full']) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+基准脚本的公共工具
+- summarize: 延迟列表（毫秒）的 p50/p95/p99 与吞吐量
+- write_results / load_results: 统一的 JSON 结果格式 {'suite', 'meta', 'results': {名称: 统计}}
+- compare_results: 与基线结果对比，延迟分位数变大或吞吐量下降超过阈值时视为回退，错误率有任何上升都视为回退
+"""
+
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# 比较时检查的指标：(名称, 数值越大越好)
+COMPARED_METRICS = (('p50', False), ('p95', False), ('p99', False), ('throughput', True))
+# 失败的请求不计入延迟统计，错误率单独比较：比基线高出任何一点都视为回退
+ERROR_RATE_METRIC = 'error_rate'
+
+
+def percentile(sorted_values, percent):
+    """最近秩法分位数，sorted_values 须已排序"""
+    index = min(len(sorted_values) - 1, max(0, math.ceil(len(sorted_values) * percent / 100) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies_ms, elapsed_seconds=None, errors=0):
+    """
+    汇总一组延迟；elapsed_seconds 为整组的墙钟时间，用于计算吞吐量（每秒完成数）
+    latencies_ms 只包含成功的请求，errors 为失败数，error_rate = errors / (成功数 + 失败数)
+    """
+    values = sorted(latencies_ms)
+    total = len(values) + errors
+    error_rate = round(errors / total, 4) if total else 0.0
+    if not values:
+        return {'count': 0, 'errors': errors, 'error_rate': error_rate}
+    elapsed = elapsed_seconds if elapsed_seconds is not None else sum(values) / 1000
+    return {
+        'count': len(values),
+        'errors': errors,
+        'error_rate': error_rate,
+        'mean': round(statistics.mean(values), 3),
+        'min': round(values[0], 3),
+        'max': round(values[-1], 3),
+        'p50': round(percentile(values, 50), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+        'throughput': round(len(values) / elapsed, 3) if elapsed > 0 else None
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(args=None):
+    """结果文件中的运行环境信息"""
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'args': vars(args) if args is not None else None
+    }
+
+
+def write_results(path, suite, results, args=None):
+    """保存结果 JSON 并返回写入的内容"""
+    payload = {'suite': suite, 'meta': run_metadata(args), 'results': results}
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return payload
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _error_rate(summary):
+    """结果中的错误率；旧格式的结果没有 error_rate 时由 count / errors 计算"""
+    if ERROR_RATE_METRIC in summary:
+        return summary[ERROR_RATE_METRIC]
+    if 'count' not in summary or 'errors' not in summary:
+        return None
+    total = summary['count'] + summary['errors']
+    return summary['errors'] / total if total else 0.0
+
+
+def compare_results(current, baseline, threshold=0.1):
+    """
+    对比两份结果中同名条目的指标
+    Returns:
+        list: [(名称, 指标, 基线值, 当前值, 变化, 是否回退)]，变化以「变差」为正；
+              延迟与吞吐量为相对变化，错误率为绝对变化
+    """
+    rows = []
+    baseline_results = baseline.get('results', {})
+    for name, summary in current.get('results', {}).items():
+        base = baseline_results.get(name)
+        if not base:
+            continue
+        # 错误率的变化按绝对值（百分点）计算，基线为 0 时同样适用
+        old_rate, new_rate = _error_rate(base), _error_rate(summary)
+        if old_rate is not None and new_rate is not None:
+            rows.append((name, ERROR_RATE_METRIC, old_rate, new_rate, new_rate - old_rate, new_rate > old_rate))
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = base.get(metric), summary.get(metric)
+            if not old or new is None:
+                continue
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            rows.append((name, metric, old, new, change, change > threshold))
+    return rows
+
+
+def print_comparison(rows, threshold):
+    """打印对比表，返回回退的条目数"""
+    print(f"{'名称':<28}{'指标':<12}{'基线':>12}{'当前':>12}{'变化':>10}")
+    for name, metric, old, new, change, regressed in rows:
+        flag = '  ❌ 回退' if regressed else ''
+        print(f"{name:<28}{metric:<12}{old:>12.2f}{new:>12.2f}{change * 100:>+9.1f}%{flag}")
+    regressions = sum(1 for row in rows if row[5])
+    if regressions:
+        print(f"⚠️ {regressions} 项指标回退（延迟/吞吐量变差超过 {threshold * 100:.0f}%，或错误率上升）")
+    else:
+        print(f"✅ 没有指标变差超过 {threshold * 100:.0f}%，错误率没有上升")
+    return regressions
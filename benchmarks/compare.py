@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准结果对比
+比较 bench_stages / loadgen 输出的两份 JSON 结果，p50/p95/p99 变大或吞吐量下降超过阈值时标记为回退，
+存在回退时以退出码 1 结束，便于在 CI 或发布前检查中使用。
+
+用法: python -m benchmarks.compare results/stages.json baselines/stages.json --threshold 0.1
+"""
+
+import argparse
+import sys
+
+from benchmarks.common import load_results, compare_results, print_comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基准结果对比")
+    parser.add_argument('current', help="本次结果 JSON")
+    parser.add_argument('baseline', help="基线结果 JSON")
+    parser.add_argument('--threshold', type=float, default=0.1, help="允许的相对变差（默认 10%%）")
+    args = parser.parse_args()
+
+    current = load_results(args.current)
+    baseline = load_results(args.baseline)
+    if current.get('suite') != baseline.get('suite'):
+        print(f"⚠️ 结果类型不同: {current.get('suite')} / {baseline.get('suite')}")
+    print(f"🔍 当前 {current['meta'].get('commit')} ({current['meta'].get('timestamp')}) "
+          f"对比基线 {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+    regressions = print_comparison(compare_results(current, baseline, args.threshold), args.threshold)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Web 接口负载生成器
+以指定并发对以下场景发送请求，统计每个场景的延迟分位数、吞吐量与错误数：
+- index:        GET /（照片墙主页）
+- bird_detail:  GET /bird/<id>（按随机种子从 class_mapping.csv 中选取类别）
+- api_identify: POST /api/identify_bird
+- upload_flow:  POST /（上传）→ /processing → 长轮询 /task_status → GET /result，计时覆盖整个流程
+默认在进程内通过 Flask 测试客户端请求（会导入 app 并加载模型）；指定 --url 时通过 HTTP 请求已启动的服务。
+识别类场景默认每次请求在 JPEG 末尾附加不同的随机字节（解码结果不变），使结果缓存不会命中；
+--allow-cache 时重复发送同一张图片。
+
+用法: python -m benchmarks.loadgen --requests 50 --concurrency 4 --output bench_results/load.json
+      python -m benchmarks.loadgen --url http://localhost --scenarios index bird_detail --baseline baselines/load.json
+"""
+
+import argparse
+import csv
+import io
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks.common import summarize, write_results, load_results, compare_results, print_comparison
+
+SCENARIOS = ('index', 'bird_detail', 'api_identify', 'upload_flow')
+
+
+class FlaskClient:
+    """进程内的 Flask 测试客户端（每个线程一个）"""
+
+    def __init__(self):
+        from app import app
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client
+
+    def get(self, path, params=None):
+        response = self._client().get(path, query_string=params)
+        return response.status_code, response.headers.get('Location'), response.get_data()
+
+    def post(self, path, data, files):
+        form = dict(data)
+        for field, (filename, content) in files.items():
+            form[field] = (io.BytesIO(content), filename)
+        response = self._client().post(path, data=form, content_type='multipart/form-data')
+        return response.status_code, response.headers.get('Location'), response.get_data()
+
+
+class HttpClient:
+    """通过 HTTP 请求已启动的服务（每个线程一个连接池）"""
+
+    def __init__(self, base_url):
+        import requests
+        self.requests = requests
+        self.base_url = base_url.rstrip('/')
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self.requests.Session()
+        return session
+
+    def get(self, path, params=None):
+        response = self._session().get(self.base_url + path, params=params, allow_redirects=False, timeout=120)
+        return response.status_code, response.headers.get('Location'), response.content
+
+    def post(self, path, data, files):
+        files = {field: (filename, content) for field, (filename, content) in files.items()}
+        response = self._session().post(self.base_url + path, data=data, files=files,
+                                        allow_redirects=False, timeout=120)
+        return response.status_code, response.headers.get('Location'), response.content
+
+
+def _path_of(location):
+    """重定向地址中的路径与查询参数部分"""
+    if location and '://' in location:
+        location = '/' + location.split('://', 1)[1].split('/', 1)[-1]
+    return location
+
+
+def _query_param(location, name):
+    return parse_qs(urlparse(location).query).get(name, [None])[0]
+
+
+class Scenarios:
+    """各场景的单次请求，返回是否成功"""
+
+    def __init__(self, client, image_bytes, class_ids, seed, allow_cache):
+        self.client = client
+        self.image_bytes = image_bytes
+        self.class_ids = class_ids
+        self.allow_cache = allow_cache
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def _random(self, fn):
+        with self._rng_lock:
+            return fn(self._rng)
+
+    def _image(self):
+        if self.allow_cache:
+            return self.image_bytes
+        # JPEG 解码器忽略 EOI 之后的字节：图片内容不变，但缓存键不同
+        return self.image_bytes + self._random(lambda rng: bytes(rng.getrandbits(8) for _ in range(16)))
+
+    def index(self):
+        status, _, _ = self.client.get('/')
+        return status == 200
+
+    def bird_detail(self):
+        class_id = self._random(lambda rng: rng.choice(self.class_ids))
+        status, _, _ = self.client.get(f'/bird/{class_id}')
+        return status == 200
+
+    def api_identify(self):
+        status, _, _ = self.client.post('/api/identify_bird', {}, {'image': ('bird.jpg', self._image())})
+        # 422 为识别失败或置信度不足，属于正常的业务结果
+        return status in (200, 422)
+
+    def upload_flow(self):
+        status, location, _ = self.client.post('/', {'step': 'upload'}, {'file': ('bird.jpg', self._image())})
+        if status != 302 or not location:
+            return False
+        location = _path_of(location)
+        task_id = _query_param(location, 'task_id')
+        status, _, _ = self.client.get(location)
+        if status != 200 or not task_id:
+            return False
+
+        revision = -1
+        while True:
+            status, _, body = self.client.get(f'/task_status/{task_id}', {'revision': revision})
+            if status != 200:
+                return False
+            task = json.loads(body)
+            if task.get('status') == 'completed':
+                break
+            if task.get('status') in ('failed', 'not found'):
+                return False
+            revision = task.get('revision', 0)
+            if task.get('retry_after'):
+                time.sleep(task['retry_after'])
+
+        status, _, _ = self.client.get('/result', {'task_id': task_id})
+        return status == 200
+
+
+def run_scenario(fn, requests, concurrency):
+    """并发执行 requests 次，返回汇总统计"""
+    def one(_):
+        start = time.perf_counter()
+        try:
+            ok = fn()
+        except Exception:
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for latency, ok in outcomes if ok]
+    return summarize(latencies, elapsed, errors=sum(1 for _, ok in outcomes if not ok))
+
+
+def _load_class_ids(csv_path):
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        return [row['class'] for row in csv.DictReader(f) if row.get('class')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Web 接口负载生成器")
+    parser.add_argument('--url', default=None, help="服务地址，例如 http://localhost；不指定时在进程内请求")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=50, help="每个场景的请求数")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--image', default='bird.jpg')
+    parser.add_argument('--class-mapping', default='class_mapping.csv')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--allow-cache', action='store_true', help="识别场景重复发送同一张图片（可命中结果缓存）")
+    parser.add_argument('--warmup', type=int, default=2, help="每个场景正式计时前的请求数")
+    parser.add_argument('--output', default='bench_results/load.json')
+    parser.add_argument('--baseline', default=None, help="基线结果 JSON，指定时输出对比并在回退时以退出码 1 结束")
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    client = HttpClient(args.url) if args.url else FlaskClient()
+    with open(args.image, 'rb') as f:
+        image_bytes = f.read()
+    scenarios = Scenarios(client, image_bytes, _load_class_ids(args.class_mapping), args.seed, args.allow_cache)
+
+    print(f"🔍 目标: {args.url or '进程内 Flask 测试客户端'}，每个场景 {args.requests} 次请求，并发 {args.concurrency}")
+    print(f"{'场景':<14}{'p50':>10}{'p95':>10}{'p99':>10}{'请求/秒':>10}{'错误':>6}")
+    results = {}
+    for name in args.scenarios:
+        fn = getattr(scenarios, name)
+        if args.warmup:
+            run_scenario(fn, args.warmup, 1)
+        summary = results[name] = run_scenario(fn, args.requests, args.concurrency)
+        if summary['count']:
+            print(f"{name:<14}{summary['p50']:>8.1f}ms{summary['p95']:>8.1f}ms{summary['p99']:>8.1f}ms"
+                  f"{summary['throughput']:>10.2f}{summary['errors']:>6}")
+        else:
+            print(f"{name:<14}{'全部失败':>38}{summary['errors']:>6}")
+
+    payload = write_results(args.output, 'load', results, args)
+    print(f"💾 结果已保存到 {args.output}")
+    if args.baseline:
+        regressions = print_comparison(compare_results(payload, load_results(args.baseline), args.threshold),
+                                       args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+鸟类详情页缓存
+- 启动时扫描一次 bird_data_local，记录哪些鸟类ID有本地数据
+- 渲染后的详情页保存在内存 LRU 中，命中时不读取磁盘
+- 每个条目最多每 check_interval 秒检查一次源文件的修改时间，文件变化后重新加载并渲染
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 详情页缓存配置（可通过环境变量覆盖）
+BIRD_PAGE_CACHE_SIZE = int(os.environ.get('BIRD_PAGE_CACHE_SIZE', '256'))
+BIRD_PAGE_CHECK_INTERVAL = float(os.environ.get('BIRD_PAGE_CHECK_INTERVAL', '5'))
+
+# 每个鸟类目录中参与渲染的文件
+SOURCE_FILES = ('info.json', 'description.html', 'distribution.html')
+
+
+def _file_signature(path):
+    """文件的 (mtime, size)，不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class BirdPageCache:
+    """本地鸟类数据索引与渲染结果缓存"""
+
+    def __init__(self, root_dir, max_entries=BIRD_PAGE_CACHE_SIZE, check_interval=BIRD_PAGE_CHECK_INTERVAL):
+        self.root_dir = root_dir
+        self.max_entries = max(1, max_entries)
+        self.check_interval = check_interval
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self._known_ids = frozenset()
+        self._root_signature = None
+        self._root_checked_at = 0.0
+        self.stats = {'hits': 0, 'misses': 0, 'reloads': 0}
+
+    def scan(self):
+        """扫描数据目录，记录拥有 info.json 的鸟类ID"""
+        signature = _file_signature(self.root_dir)
+        known_ids = set()
+        if signature is not None:
+            with os.scandir(self.root_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir() and os.path.exists(os.path.join(entry.path, 'info.json')):
+                        known_ids.add(entry.name)
+        self._known_ids = frozenset(known_ids)
+        self._root_signature = signature
+        self._root_checked_at = time.monotonic()
+        print(f"📚 已索引 {len(known_ids)} 种鸟类的本地数据")
+        return len(known_ids)
+
+    def has_data(self, bird_class_id):
+        """判断该鸟类是否有本地数据（数据目录新增子目录时自动重新扫描）"""
+        now = time.monotonic()
+        if now - self._root_checked_at >= self.check_interval:
+            self._root_checked_at = now
+            if _file_signature(self.root_dir) != self._root_signature:
+                self.scan()
+        return str(bird_class_id) in self._known_ids
+
+    def _signature(self, bird_class_id):
+        bird_dir = os.path.join(self.root_dir, str(bird_class_id))
+        return tuple(_file_signature(os.path.join(bird_dir, name)) for name in SOURCE_FILES)
+
+    def load(self, bird_class_id):
+        """
+        从磁盘读取鸟类数据
+        Returns:
+            tuple: ({'info', 'description', 'distribution'}, 源文件签名)；无数据时为 (None, None)
+        """
+        if not self.has_data(bird_class_id):
+            return None, None
+
+        # 先取签名再读取，读取期间文件若被修改，下次检查时会重新加载
+        signature = self._signature(bird_class_id)
+        bird_dir = os.path.join(self.root_dir, str(bird_class_id))
+        try:
+            with open(os.path.join(bird_dir, 'info.json'), 'r', encoding='utf-8') as f:
+                bird_info = json.load(f)
+
+            contents = {}
+            for key, name in (('description', 'description.html'), ('distribution', 'distribution.html')):
+                contents[key] = None
+                path = os.path.join(bird_dir, name)
+                if os.path.exists(path):
+                    with open(path, 'r', encoding='utf-8') as f:
+                        contents[key] = f.read()
+        except Exception as e:
+            print(f"⚠️ 读取本地鸟类数据失败 (ID: {bird_class_id}): {e}")
+            return None, None
+
+        return {
+            'info': bird_info,
+            'description': contents['description'],
+            'distribution': contents['distribution']
+        }, signature
+
+    def get(self, bird_class_id):
+        """返回缓存的渲染结果，未命中或源文件已变化时返回 None"""
+        key = str(bird_class_id)
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._pages.move_to_end(key)
+            if time.monotonic() - entry['checked_at'] < self.check_interval:
+                self.stats['hits'] += 1
+                return entry['html']
+
+        # 超过检查间隔，确认源文件未变化
+        if self._signature(key) != entry['signature']:
+            with self._lock:
+                self._pages.pop(key, None)
+                self.stats['misses'] += 1
+                self.stats['reloads'] += 1
+            return None
+        with self._lock:
+            entry['checked_at'] = time.monotonic()
+            self.stats['hits'] += 1
+        return entry['html']
+
+    def put(self, bird_class_id, html, signature):
+        """缓存渲染结果"""
+        with self._lock:
+            self._pages[str(bird_class_id)] = {
+                'html': html,
+                'signature': signature,
+                'checked_at': time.monotonic()
+            }
+            self._pages.move_to_end(str(bird_class_id))
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+鸟类类别注册表
+从 class_mapping.csv（class, original_label 列）加载一次，提供只读的
+类别ID -> 名称、名称 -> 类别ID 字典查询，以及预先构建的模糊匹配索引。
+不依赖 pandas，可被 app、model_utils 及各脚本共享。
+"""
+
+import csv
+import os
+import threading
+from types import MappingProxyType
+
+from config import CSV_PATH
+
+# 类别映射文件路径只在 config.CSV_PATH 中定义一次，app 与 model_utils 由此得到同一个注册表
+BIRD_CLASS_MAPPING_CSV = CSV_PATH
+
+
+def _bigrams(text):
+    """字符二元组集合，单字名称退化为单字符集合"""
+    if len(text) < 2:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + 2] for i in range(len(text) - 1))
+
+
+class ClassRegistry:
+    """不可变的类别注册表"""
+
+    def __init__(self, rows):
+        id_to_label = {}
+        label_to_id = {}
+        for class_id, label in rows:
+            id_to_label.setdefault(class_id, label)
+            # 名称重复时以第一条记录为准
+            label_to_id.setdefault(label, class_id)
+
+        self.id_to_label = MappingProxyType(id_to_label)
+        self.label_to_id = MappingProxyType(label_to_id)
+
+        # 模糊匹配索引：二元组 -> 包含它的名称
+        bigram_index = {}
+        label_bigrams = {}
+        for label in label_to_id:
+            grams = _bigrams(label)
+            label_bigrams[label] = grams
+            for gram in grams:
+                bigram_index.setdefault(gram, set()).add(label)
+        self._bigram_index = MappingProxyType({gram: frozenset(labels) for gram, labels in bigram_index.items()})
+        self._label_bigrams = MappingProxyType(label_bigrams)
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        """从 CSV 加载，文件不存在时返回空注册表"""
+        rows = []
+        try:
+            with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+                for row in csv.DictReader(f):
+                    rows.append((int(row['class']), row['original_label']))
+        except FileNotFoundError:
+            print(f"错误: {csv_path} 未找到。鸟类名称查找功能将无法工作。")
+        return cls(rows)
+
+    def __len__(self):
+        return len(self.id_to_label)
+
+    @property
+    def empty(self):
+        return not self.id_to_label
+
+    def label(self, class_id, default=None):
+        """类别ID -> 名称"""
+        return self.id_to_label.get(class_id, default)
+
+    def class_id(self, label):
+        """名称 -> 类别ID，不存在时返回 None"""
+        return self.label_to_id.get(label)
+
+    def find(self, query, limit=5):
+        """
+        模糊查找名称，返回 [(类别ID, 名称, 相似度)]，按相似度从高到低排序
+        完全匹配的相似度为 1.0，互相包含的名称次之，其余按二元组 Jaccard 相似度排序
+        """
+        if not query:
+            return []
+        exact = self.label_to_id.get(query)
+        if exact is not None:
+            return [(exact, query, 1.0)]
+
+        query_grams = _bigrams(query)
+        candidates = set()
+        for gram in query_grams:
+            candidates.update(self._bigram_index.get(gram, ()))
+
+        scored = []
+        for label in candidates:
+            grams = self._label_bigrams[label]
+            score = len(grams & query_grams) / len(grams | query_grams)
+            if query in label or label in query:
+                score = max(score, 0.99)
+            scored.append((self.label_to_id[label], label, round(score, 4)))
+        scored.sort(key=lambda item: (-item[2], item[0]))
+        return scored[:limit]
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_class_registry(csv_path=BIRD_CLASS_MAPPING_CSV):
+    """按路径返回共享的注册表实例（每个文件只加载一次）"""
+    key = os.path.abspath(csv_path)
+    registry = _registries.get(key)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.get(key)
+            if registry is None:
+                registry = ClassRegistry.from_csv(csv_path)
+                _registries[key] = registry
+    return registry
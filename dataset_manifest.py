@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据集清单
+把 all_data.csv 编译为紧凑的二进制文件，每张图片一条定长记录：
+    文件大小、修改时间、路径偏移、宽、高、类别ID、数据集划分、标记位
+路径以 UTF-8 连续存放在记录之后。加载时通过 numpy.memmap 映射文件，
+只读取几百字节的文件头，无需 pandas，按划分/标记筛选为向量化操作。
+
+验证未通过的图片设置 FLAG_INVALID 标记（原地修改，不删除文件、不改写 CSV），
+构建时文件不存在或无法读取的图片设置 FLAG_MISSING 标记。
+重新构建时，大小与修改时间未变的图片沿用旧清单中的尺寸与标记，不再打开图片。
+
+用法: python dataset_manifest.py --workers 8
+      python dataset_manifest.py --stats
+"""
+
+import argparse
+import csv
+import json
+import os
+import struct
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+DATASET_CSV = 'all_data.csv'
+DATASET_MANIFEST_PATH = os.environ.get('BIRD_DATASET_MANIFEST', 'dataset_manifest.bin')
+# 旧版本的无效图片列表，首次构建清单时导入为 FLAG_INVALID
+INVALID_IMAGES_LIST = 'invalid_images_list.txt'
+
+MANIFEST_MAGIC = b'BIRDMFST'
+MANIFEST_FORMAT = 1
+_HEADER = struct.Struct('<8sII')  # 魔数、格式版本、JSON 元数据长度
+
+FLAG_INVALID = 1  # 验证未通过（未检测到主体、多个主体、主体过小等）
+FLAG_MISSING = 2  # 构建时文件不存在或无法读取
+UNUSABLE = FLAG_INVALID | FLAG_MISSING
+
+# CSV 没有表头时的列顺序
+CSV_COLUMNS = ('filepaths', 'labels', 'class', 'data set')
+
+# 每条 32 字节，8 字节字段在前以保持对齐；路径结束位置为下一条记录的偏移
+RECORD_DTYPE = np.dtype([
+    ('size', '<u8'),
+    ('mtime_ns', '<i8'),
+    ('path_offset', '<u4'),
+    ('width', '<u4'),
+    ('height', '<u4'),
+    ('class_id', '<i2'),
+    ('split', 'u1'),
+    ('flags', 'u1'),
+])
+
+ManifestEntry = namedtuple('ManifestEntry',
+                           'filepath class_id split flags size mtime_ns width height')
+
+
+def _file_signature(path):
+    """文件的 (mtime, size)，不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_dataset_csv(csv_file):
+    """读取 CSV，返回 [(filepath, 类别ID, 划分)]；兼容没有表头的文件"""
+    rows = []
+    with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return rows
+        if 'filepaths' in header:
+            columns = {name: header.index(name) for name in ('filepaths', 'class', 'data set')}
+        else:
+            columns = {name: CSV_COLUMNS.index(name) for name in ('filepaths', 'class', 'data set')}
+            reader = [header] + list(reader)
+        for row in reader:
+            try:
+                class_id = int(float(row[columns['class']]))
+            except (ValueError, IndexError):
+                class_id = -1
+            rows.append((row[columns['filepaths']], class_id, row[columns['data set']].strip()))
+    return rows
+
+
+class DatasetManifest:
+    """只读（或仅可修改标记位）的内存映射清单"""
+
+    def __init__(self, path, meta, records, paths):
+        self.path = path
+        self.meta = meta
+        self.splits = tuple(meta['splits'])
+        self._records = records
+        self._paths = paths
+        self._index = None
+
+    @classmethod
+    def open(cls, path=DATASET_MANIFEST_PATH, writable=False):
+        """映射清单文件；writable 为 True 时可以修改标记位"""
+        with open(path, 'rb') as f:
+            magic, version, meta_length = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MANIFEST_MAGIC or version != MANIFEST_FORMAT:
+                raise ValueError(f"{path} 不是受支持的数据集清单（格式版本 {version}）")
+            meta = json.loads(f.read(meta_length).decode('utf-8'))
+
+        mode = 'r+' if writable else 'r'
+        count = meta['count']
+        if count:
+            records = np.memmap(path, dtype=RECORD_DTYPE, mode=mode, offset=meta['records_offset'], shape=(count,))
+        else:
+            records = np.zeros(0, dtype=RECORD_DTYPE)
+        if meta['paths_length']:
+            paths = np.memmap(path, dtype=np.uint8, mode='r', offset=meta['paths_offset'],
+                              shape=(meta['paths_length'],))
+        else:
+            paths = np.zeros(0, dtype=np.uint8)
+        return cls(path, meta, records, paths)
+
+    def __len__(self):
+        return len(self._records)
+
+    def is_current(self, csv_file, data_folder=None):
+        """清单是否由 csv_file 的当前版本（及 data_folder）构建；CSV 不存在时视为最新"""
+        signature = _file_signature(csv_file)
+        if signature is None:
+            return True
+        if data_folder is not None and self.meta.get('data_folder') != data_folder:
+            return False
+        return list(signature) == self.meta.get('source_signature')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.flush()
+        self._records = self._paths = None
+
+    def flush(self):
+        """把标记位的修改写回磁盘，并更新文件修改时间以便其他进程察觉变化"""
+        if isinstance(self._records, np.memmap) and self._records.mode == 'r+':
+            self._records.flush()
+            os.utime(self.path)
+
+    def filepath(self, i):
+        start = int(self._records['path_offset'][i])
+        end = int(self._records['path_offset'][i + 1]) if i + 1 < len(self._records) else len(self._paths)
+        return self._paths[start:end].tobytes().decode('utf-8')
+
+    def entry(self, i):
+        record = self._records[i]
+        return ManifestEntry(self.filepath(i), int(record['class_id']), self.splits[record['split']],
+                             int(record['flags']), int(record['size']), int(record['mtime_ns']),
+                             int(record['width']), int(record['height']))
+
+    def select(self, split=None, exclude=UNUSABLE):
+        """返回满足条件的记录下标数组；exclude 为需要排除的标记位，0 表示不按标记筛选"""
+        mask = np.ones(len(self._records), dtype=bool)
+        if split is not None:
+            if split not in self.splits:
+                return np.zeros(0, dtype=np.int64)
+            mask &= self._records['split'] == self.splits.index(split)
+        if exclude:
+            mask &= (self._records['flags'] & exclude) == 0
+        return np.flatnonzero(mask)
+
+    def entries(self, split=None, exclude=UNUSABLE):
+        return [self.entry(i) for i in self.select(split, exclude)]
+
+    def filepaths(self, split=None, exclude=UNUSABLE):
+        return [self.filepath(i) for i in self.select(split, exclude)]
+
+    def count(self, split=None, flags=0):
+        """统计划分中的记录数；flags 非 0 时只统计带有这些标记之一的记录"""
+        indices = self.select(split, exclude=0)
+        if flags:
+            return int(np.count_nonzero(self._records['flags'][indices] & flags))
+        return len(indices)
+
+    def index_of(self, filepath):
+        """filepath -> 记录下标，不存在时返回 None"""
+        if self._index is None:
+            self._index = {self.filepath(i): i for i in range(len(self._records))}
+        return self._index.get(filepath)
+
+    def set_flag(self, filepaths, flag, value=True):
+        """为一组图片设置或清除标记（需以 writable=True 打开），返回修改的条数"""
+        changed = 0
+        for filepath in filepaths:
+            i = self.index_of(filepath)
+            if i is None:
+                continue
+            old = int(self._records['flags'][i])
+            new = old | flag if value else old & ~flag
+            if new != old:
+                self._records['flags'][i] = new
+                changed += 1
+        return changed
+
+
+def _probe(args):
+    """读取文件大小、修改时间与图片尺寸（只解析文件头），返回 (size, mtime_ns, width, height, flags)"""
+    full_path, previous = args
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        return 0, 0, 0, 0, FLAG_MISSING
+    if previous is not None and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+        return previous
+    try:
+        with Image.open(full_path) as image:
+            width, height = image.size
+    except Exception:
+        return stat.st_size, stat.st_mtime_ns, 0, 0, FLAG_MISSING
+    # 文件内容变化后，旧的验证结果不再适用
+    return stat.st_size, stat.st_mtime_ns, width, height, 0
+
+
+def _previous_records(output):
+    """旧清单中的 {filepath: (size, mtime_ns, width, height, flags)}"""
+    try:
+        manifest = DatasetManifest.open(output)
+    except (OSError, ValueError):
+        return None
+    previous = {}
+    for i in range(len(manifest)):
+        entry = manifest.entry(i)
+        if not entry.flags & FLAG_MISSING:
+            previous[entry.filepath] = (entry.size, entry.mtime_ns, entry.width, entry.height,
+                                        entry.flags & FLAG_INVALID)
+    return previous
+
+
+def load_invalid_list(invalid_list=INVALID_IMAGES_LIST):
+    """读取旧版本的无效图片列表，文件不存在时返回空集合"""
+    if not invalid_list or not os.path.exists(invalid_list):
+        return set()
+    with open(invalid_list, 'r', encoding='utf-8') as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def write_manifest(output, rows, probes, meta):
+    """写入清单（先写临时文件再替换，已映射旧文件的进程不受影响）"""
+    splits = sorted(set(split for _, _, split in rows))
+    records = np.zeros(len(rows), dtype=RECORD_DTYPE)
+    encoded = [filepath.encode('utf-8') for filepath, _, _ in rows]
+    offsets = np.cumsum([0] + [len(path) for path in encoded])
+    paths = b''.join(encoded)
+
+    records['path_offset'] = offsets[:-1]
+    records['class_id'] = [class_id for _, class_id, _ in rows]
+    records['split'] = [splits.index(split) for _, _, split in rows]
+    for field, column in (('size', 0), ('mtime_ns', 1), ('width', 2), ('height', 3), ('flags', 4)):
+        records[field] = [probe[column] for probe in probes]
+
+    meta = dict(meta, count=len(rows), splits=splits, paths_length=len(paths))
+    # 记录区的偏移依赖元数据长度，预留固定宽度的数字后再计算
+    meta.update(records_offset=0, paths_offset=0)
+    meta_length = len(json.dumps(meta).encode('utf-8')) + 32
+    records_offset = (_HEADER.size + meta_length + 7) // 8 * 8
+    meta.update(records_offset=records_offset, paths_offset=records_offset + records.nbytes)
+    meta_bytes = json.dumps(meta).encode('utf-8').ljust(meta_length)
+
+    tmp_path = f"{output}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MANIFEST_MAGIC, MANIFEST_FORMAT, meta_length))
+        f.write(meta_bytes)
+        f.write(b'\0' * (records_offset - _HEADER.size - meta_length))
+        f.write(records.tobytes())
+        f.write(paths)
+    os.replace(tmp_path, output)
+
+
+def build_manifest(csv_file=DATASET_CSV, data_folder='static/', output=DATASET_MANIFEST_PATH,
+                   invalid_list=INVALID_IMAGES_LIST, workers=8):
+    """从 CSV 构建清单，返回打开的 DatasetManifest"""
+    start = time.perf_counter()
+    rows = read_dataset_csv(csv_file)
+    previous = _previous_records(output)
+    if previous is None:
+        # 首次构建：沿用旧的无效图片列表
+        invalid_images = load_invalid_list(invalid_list)
+        previous = {}
+    else:
+        invalid_images = set()
+
+    jobs = [(os.path.join(data_folder, filepath), previous.get(filepath)) for filepath, _, _ in rows]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        probes = list(executor.map(_probe, jobs, chunksize=64))
+    probes = [probe[:4] + (probe[4] | FLAG_INVALID,) if filepath in invalid_images else probe
+              for (filepath, _, _), probe in zip(rows, probes)]
+
+    write_manifest(output, rows, probes, {
+        'source': csv_file,
+        'source_signature': _file_signature(csv_file),
+        'data_folder': data_folder,
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    })
+    reused = sum(1 for (filepath, _, _), probe in zip(rows, probes) if previous.get(filepath) == probe)
+    print(f"📦 数据集清单已写入 {output}: {len(rows)} 条记录（沿用 {reused} 条），"
+          f"用时 {time.perf_counter() - start:.1f}s")
+    return DatasetManifest.open(output)
+
+
+def ensure_manifest(output=DATASET_MANIFEST_PATH, csv_file=DATASET_CSV, data_folder='static/', workers=8):
+    """打开清单；清单不存在，或 CSV / 图片目录与构建时不同时重新构建（供离线脚本使用，web 进程只读取）"""
+    try:
+        manifest = DatasetManifest.open(output)
+    except (OSError, ValueError):
+        manifest = None
+    if manifest is not None and manifest.is_current(csv_file, data_folder):
+        return manifest
+    return build_manifest(csv_file, data_folder, output, workers=workers)
+
+
+def print_stats(manifest):
+    print(f"📋 {manifest.path}: {len(manifest)} 条记录，构建于 {manifest.meta.get('built_at')}")
+    print(f"{'划分':<10}{'图片':>8}{'可用':>8}{'无效':>8}{'缺失':>8}")
+    for split in manifest.splits:
+        print(f"{split:<10}{manifest.count(split):>8}{len(manifest.select(split)):>8}"
+              f"{manifest.count(split, FLAG_INVALID):>8}{manifest.count(split, FLAG_MISSING):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建数据集二进制清单")
+    parser.add_argument('--csv', default=DATASET_CSV)
+    parser.add_argument('--data-folder', default='static/')
+    parser.add_argument('--output', default=DATASET_MANIFEST_PATH)
+    parser.add_argument('--invalid-list', default=INVALID_IMAGES_LIST,
+                        help="首次构建时导入的无效图片列表")
+    parser.add_argument('--workers', type=int, default=8, help="读取图片尺寸的线程数")
+    parser.add_argument('--stats', action='store_true', help="只输出已有清单的统计信息")
+    args = parser.parse_args()
+
+    if not args.stats:
+        build_manifest(args.csv, args.data_folder, args.output, args.invalid_list, args.workers).close()
+
+    start = time.perf_counter()
+    manifest = DatasetManifest.open(args.output)
+    test_count = len(manifest.select('test'))
+    print(f"⚡ 加载清单并筛选出 {test_count} 张可用测试图片，用时 {(time.perf_counter() - start) * 1000:.2f}ms")
+    print_stats(manifest)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,26 @@
 import os
-import pandas as pd
+from dataset_manifest import DatasetManifest, ensure_manifest, DATASET_MANIFEST_PATH, FLAG_MISSING
 
-def clean_non_test_images(csv_path, data_folder, new_data_folder):
+def clean_non_test_images(csv_path, data_folder, new_data_folder, manifest_path=DATASET_MANIFEST_PATH):
     """
-    清除表格中 'data set' 列不是 'test' 的所有图片，同时删除 new_data 文件夹中的对应文件。
-    
+    清除数据集清单中 'data set' 不是 'test' 的所有图片，同时删除 new_data 文件夹中的对应文件。
+    删除后在清单中把这些图片标记为缺失，CSV 保持不变。
+
     Args:
-    - csv_path: str，表格文件路径 (e.g., "all_data.csv")
-    - data_folder: str，原始图片所在的文件夹 (e.g., "data")
+    - csv_path: str，表格文件路径 (e.g., "all_data.csv")，清单不存在或过期时用于重新生成
+    - data_folder: str，原始图片所在的文件夹 (e.g., "static/")
     - new_data_folder: str，去除背景后的图片所在的文件夹 (e.g., "new_data")
+    - manifest_path: str，数据集清单路径
     """
-    # 加载 CSV 表格
-    df = pd.read_csv(csv_path, header=None, names=["filepaths", "labels", "class", "data set"])
-
-    # 筛选 'data set' 列为 'test' 的文件路径
-    test_images = set(df[df['data set'] == 'test']['filepaths'])
+    # 加载数据集清单
+    manifest = ensure_manifest(manifest_path, csv_path, data_folder)
 
-    # 遍历表格中的所有文件路径
-    all_images = set(df['filepaths'])
-    non_test_images = all_images - test_images  # 计算非 'test' 的文件路径
+    # 非 'test' 的文件路径（已缺失的图片无需处理）
+    test_images = set(manifest.filepaths('test', exclude=0))
+    non_test_images = set(manifest.filepaths(exclude=FLAG_MISSING)) - test_images
 
     # 删除非 'test' 的文件
+    deleted = []
     for filepath in non_test_images:
         # 转换为系统兼容路径格式
         normalized_filepath = filepath.replace("\\", "/")  # 如果表格中有 `\`，替换为 `/`
@@ -32,6 +32,7 @@ def clean_non_test_images(csv_path, data_folder, new_data_folder):
         if os.path.exists(data_path):
             os.remove(data_path)
             print(f"Deleted: {data_path}")
+        deleted.append(filepath)
 
         # # 删除 new_data 中的对应文件
         # new_data_path = os.path.join(new_data_folder, normalized_filepath)
@@ -39,11 +40,15 @@ def clean_non_test_images(csv_path, data_folder, new_data_folder):
         #     os.remove(new_data_path)
         #     print(f"Deleted: {new_data_path}")
 
+    with DatasetManifest.open(manifest_path, writable=True) as writable:
+        writable.set_flag(deleted, FLAG_MISSING)
+
     print("清理完成：所有非 'test' 图片已删除。")
 
-# 示例调用
-csv_path = "all_data.csv"  # 替换为实际 CSV 路径
-data_folder = ""  # 替换为原始图片文件夹路径
-new_data_folder = "new_"  # 替换为去除背景后的图片文件夹路径
+if __name__ == '__main__':
+    # 示例调用
+    csv_path = "all_data.csv"  # 替换为实际 CSV 路径
+    data_folder = "static/"  # 替换为原始图片文件夹路径（需与构建清单时一致）
+    new_data_folder = "new_"  # 替换为去除背景后的图片文件夹路径
 
-clean_non_test_images(csv_path, data_folder, new_data_folder)
\ No newline at end of file
+    clean_non_test_images(csv_path, data_folder, new_data_folder)
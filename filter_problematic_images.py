@@ -2,150 +2,304 @@
 # -*- coding: utf-8 -*-
 
 import os
-import pandas as pd
-from image_utils import compress_image, remove_background, create_final_image
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
 from PIL import Image
 import json
 from datetime import datetime
 
+from dataset_manifest import DatasetManifest, ensure_manifest, DATASET_MANIFEST_PATH, FLAG_INVALID
+
+# 增量结果文件：每验证完一张图片立即追加一行 JSON，同时作为断点续传的检查点；
+# 验证完成后删除，只在中断时保留
+CHECKPOINT_FILE = 'image_validation_checkpoint.jsonl'
+
+def file_signature(full_path):
+    """文件的 (修改时间纳秒, 大小)，文件不存在时返回 (None, None)"""
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        return None, None
+    return stat.st_mtime_ns, stat.st_size
+
+def check_subject_mask(mask):
+    """检查分割掩膜中的主体，返回 None 表示通过，否则返回错误详情"""
+    subject_mask = (mask > 0).astype(np.uint8)
+    num_labels, labels_im = cv2.connectedComponents(subject_mask)
+    num_subjects = num_labels - 1  # 减去背景
+
+    if num_subjects != 1:
+        return {
+            'error': f"未检测到主体或检测到多个主体（{num_subjects} 个主体）",
+            'subject_count': num_subjects,
+            'step': 'subject_detection'
+        }
+
+    coords = cv2.findNonZero(subject_mask)
+    if coords is None:
+        return {
+            'error': "未找到主体坐标",
+            'subject_count': num_subjects,
+            'step': 'coordinate_detection'
+        }
+
+    x, y, w, h = cv2.boundingRect(coords)
+    if w < 64 or h < 64:
+        return {
+            'error': f"主体尺寸过小（{w}x{h}）",
+            'subject_count': num_subjects,
+            'dimensions': f"{w}x{h}",
+            'step': 'size_check'
+        }
+    return None
+
+def validate_batch(items):
+    """
+    批量验证图片（可在子进程中运行）
+    所有步骤均在内存中完成，不会产生临时文件。
+    Args:
+        items (list): (filepath, 完整路径) 元组列表
+    Returns:
+        list: 每张图片一条记录 {'filepath', 'valid', 'details', 'mtime', 'size', 'model'}，
+              mtime/size/model 用于判断检查点中的记录是否过期
+    """
+    from image_utils import compress_pil_image, remove_background_batch, SEGMENTATION_MODEL_NAME
+
+    records = []
+    images = []
+    for filepath, full_path in items:
+        mtime, size = file_signature(full_path)
+        record = {'filepath': filepath, 'mtime': mtime, 'size': size, 'model': SEGMENTATION_MODEL_NAME}
+        if mtime is None:
+            records.append(dict(record, valid=False, details={'error': '文件不存在', 'step': 'file_check'}))
+            continue
+        try:
+            with Image.open(full_path) as image:
+                images.append((record, compress_pil_image(image)))
+        except Exception as e:
+            records.append(dict(record, valid=False, details={'error': str(e), 'step': 'exception'}))
+
+    if images:
+        try:
+            masks = remove_background_batch([image for _, image in images])
+        except Exception as e:
+            # 批量推理失败时逐张重试，定位具体出错的图片
+            masks = []
+            for _, image in images:
+                try:
+                    masks.append(remove_background_batch([image])[0])
+                except Exception as single_error:
+                    masks.append(single_error)
+
+        for (record, _), mask in zip(images, masks):
+            if isinstance(mask, Exception):
+                details = {'error': str(mask), 'step': 'exception'}
+            else:
+                details = check_subject_mask(mask)
+            records.append(dict(record, valid=details is None, details=details))
+    return records
+
+def _worker_model_name():
+    """返回（子）进程中使用的分割模型名称"""
+    from image_utils import SEGMENTATION_MODEL_NAME
+    return SEGMENTATION_MODEL_NAME
+
+def _init_worker(threads_per_worker):
+    """子进程初始化：限制 PyTorch 线程数并预先加载分割模型"""
+    import torch
+    torch.set_num_threads(threads_per_worker)
+    from image_utils import get_segmentation_model
+    get_segmentation_model()
+
 class ImageValidator:
-    def __init__(self, data_folder='static/', csv_file='all_data.csv'):
+    def __init__(self, data_folder='static/', csv_file='all_data.csv', checkpoint_file=CHECKPOINT_FILE,
+                 manifest_path=DATASET_MANIFEST_PATH):
         self.data_folder = data_folder
         self.csv_file = csv_file
+        self.manifest_path = manifest_path
+        self.checkpoint_file = checkpoint_file
         self.results = {
             'valid_images': [],
             'invalid_images': [],
             'error_details': {}
         }
     
-    def validate_single_image(self, image_path, filepath):
-        """验证单个图片是否可以正常处理"""
-        try:
-            print(f"正在验证: {filepath}")
-            
-            # 步骤1: 压缩图片
-            compressed_path = compress_image(image_path)
-            
-            # 步骤2: 移除背景
-            image_np, mask = remove_background(compressed_path)
-            
-            # 步骤3: 检查主体数量（这里是关键检查点）
-            subject_mask = (mask > 0).astype(np.uint8)
-            num_labels, labels_im = cv2.connectedComponents(subject_mask)
-            num_subjects = num_labels - 1  # 减去背景
-            
-            if num_subjects != 1:
-                error_msg = f"未检测到主体或检测到多个主体（{num_subjects} 个主体）"
-                print(f"  ❌ {error_msg}")
-                self.results['invalid_images'].append(filepath)
-                self.results['error_details'][filepath] = {
-                    'error': error_msg,
-                    'subject_count': num_subjects,
-                    'step': 'subject_detection'
-                }
-                return False
-            
-            # 步骤4: 检查主体尺寸
-            coords = cv2.findNonZero(subject_mask)
-            if coords is None:
-                error_msg = "未找到主体坐标"
-                print(f"  ❌ {error_msg}")
-                self.results['invalid_images'].append(filepath)
-                self.results['error_details'][filepath] = {
-                    'error': error_msg,
-                    'subject_count': num_subjects,
-                    'step': 'coordinate_detection'
-                }
-                return False
-                
-            x, y, w, h = cv2.boundingRect(coords)
-            if w < 64 or h < 64:
-                error_msg = f"主体尺寸过小（{w}x{h}）"
-                print(f"  ❌ {error_msg}")
-                self.results['invalid_images'].append(filepath)
-                self.results['error_details'][filepath] = {
-                    'error': error_msg,
-                    'subject_count': num_subjects,
-                    'dimensions': f"{w}x{h}",
-                    'step': 'size_check'
-                }
-                return False
-            
-            # 如果到这里，说明图片可以正常处理
-            print(f"  ✅ 验证通过")
+    def _record(self, record, checkpoint=None):
+        """记录单张图片的验证结果，并追加到检查点文件"""
+        filepath = record['filepath']
+        if record['valid']:
             self.results['valid_images'].append(filepath)
-            
-            # 清理临时文件
-            if os.path.exists(compressed_path):
-                os.remove(compressed_path)
-            
-            return True
-            
-        except Exception as e:
-            error_msg = str(e)
-            print(f"  ❌ 处理异常: {error_msg}")
+        else:
             self.results['invalid_images'].append(filepath)
-            self.results['error_details'][filepath] = {
-                'error': error_msg,
-                'step': 'exception'
-            }
-            return False
+            self.results['error_details'][filepath] = record['details']
+        if checkpoint is not None:
+            checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+    
+    def _load_checkpoint(self, filepaths, model_name):
+        """
+        读取检查点文件，恢复仍然有效的验证结果，返回已处理的 filepath 集合
+        文件的修改时间、大小或分割模型与记录不一致时，该记录视为过期，图片会被重新验证
+        """
+        processed = set()
+        if not self.checkpoint_file or not os.path.exists(self.checkpoint_file):
+            return processed
+        records = {}
+        with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 中断时可能留下不完整的最后一行
+                    continue
+                records[record['filepath']] = record
+        stale = 0
+        for filepath in filepaths:
+            record = records.get(filepath)
+            if record is None or filepath in processed:
+                continue
+            mtime, size = file_signature(os.path.join(self.data_folder, filepath))
+            if (record.get('mtime'), record.get('size'), record.get('model')) != (mtime, size, model_name):
+                stale += 1
+                continue
+            processed.add(filepath)
+            self._record(record)
+        if processed or stale:
+            print(f"♻️ 从检查点 {self.checkpoint_file} 恢复了 {len(processed)} 张图片的验证结果，"
+                  f"{stale} 条记录已过期将重新验证")
+        return processed
+    
+    def validate_single_image(self, image_path, filepath):
+        """验证单个图片是否可以正常处理"""
+        record = validate_batch([(filepath, image_path)])[0]
+        self._record(record)
+        if record['valid']:
+            print(f"  ✅ 验证通过: {filepath}")
+        else:
+            print(f"  ❌ {filepath}: {record['details']['error']}")
+        return record['valid']
     
-    def validate_all_images(self, dataset_filter='test'):
-        """验证所有图片"""
+    def validate_all_images(self, dataset_filter='test', workers=1, batch_size=4, resume=True, verbose=False):
+        """
+        验证所有图片
+        Args:
+            dataset_filter (str): 只验证该数据集划分中的图片，None 表示全部
+            workers (int): 并行进程数，1 表示在当前进程中运行
+            batch_size (int): 每次分割推理的图片数量
+            resume (bool): 是否从检查点文件继续上次中断的验证（验证完成后检查点会被删除）
+            verbose (bool): 是否逐张输出验证结果
+        """
         print(f"🔍 开始验证图片，数据集筛选: {dataset_filter}")
         
-        # 读取数据文件
+        # 读取数据集清单（不存在或 CSV 有变化时先重新生成）
         try:
-            df = pd.read_csv(self.csv_file)
-            print(f"📊 从 {self.csv_file} 读取到 {len(df)} 条记录")
+            manifest = ensure_manifest(self.manifest_path, self.csv_file, self.data_folder)
+            print(f"📊 从 {self.manifest_path} 读取到 {len(manifest)} 条记录")
         except Exception as e:
-            print(f"❌ 无法读取CSV文件: {e}")
+            print(f"❌ 无法读取数据集清单: {e}")
             return
         
-        # 筛选测试集数据
+        # 筛选测试集数据（包括已标记为无效的图片，以便重新验证）
+        filepaths = manifest.filepaths(dataset_filter, exclude=0)
         if dataset_filter:
-            test_images = df[df['data set'] == dataset_filter][['filepaths', 'class']].values.tolist()
-            print(f"📋 筛选出 {len(test_images)} 张 {dataset_filter} 集图片")
+            print(f"📋 筛选出 {len(filepaths)} 张 {dataset_filter} 集图片")
         else:
-            test_images = df[['filepaths', 'class']].values.tolist()
-            print(f"📋 处理所有 {len(test_images)} 张图片")
-        
-        # 验证每张图片
-        total_count = len(test_images)
-        valid_count = 0
-        invalid_count = 0
-        
-        for i, (filepath, bird_class) in enumerate(test_images):
-            print(f"\n[{i+1}/{total_count}] ", end="")
-            
-            full_path = os.path.join(self.data_folder, filepath)
-            if not os.path.exists(full_path):
-                print(f"文件不存在: {filepath}")
-                self.results['invalid_images'].append(filepath)
-                self.results['error_details'][filepath] = {
-                    'error': '文件不存在',
-                    'step': 'file_check'
-                }
-                invalid_count += 1
-                continue
-            
-            if self.validate_single_image(full_path, filepath):
-                valid_count += 1
-            else:
-                invalid_count += 1
+            print(f"📋 处理所有 {len(filepaths)} 张图片")
+        
+        if not resume:
+            self._remove_checkpoint()
+        
+        executor = None
+        if workers > 1:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                           initargs=(threads_per_worker,))
+        try:
+            # 分割模型名称从实际执行验证的进程中读取，主进程不加载 PyTorch
+            model_name = executor.submit(_worker_model_name).result() if executor else _worker_model_name()
+            print(f"🔍 分割模型: {model_name}")
+            done_count, elapsed = self._validate_pending(executor, workers, filepaths, model_name,
+                                                            batch_size, verbose)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        
+        # 验证完成后删除检查点，下次运行重新验证全部图片
+        self._remove_checkpoint()
+        
+        valid_count = len(self.results['valid_images'])
+        invalid_count = len(self.results['invalid_images'])
+        all_count = valid_count + invalid_count
         
         # 输出统计结果
         print(f"\n" + "="*50)
         print(f"📊 验证完成！")
         print(f"✅ 有效图片: {valid_count} 张")
         print(f"❌ 无效图片: {invalid_count} 张")
-        print(f"📈 有效率: {valid_count/total_count*100:.1f}%")
+        if all_count:
+            print(f"📈 有效率: {valid_count/all_count*100:.1f}%")
+        if done_count and elapsed > 0:
+            print(f"⚡ 本次验证 {done_count} 张，用时 {elapsed:.1f}s，吞吐量 {done_count / elapsed:.2f} 张/秒")
         
+        self.update_manifest()
         return self.results
     
+    def _remove_checkpoint(self):
+        if self.checkpoint_file and os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+    
+    def _validate_pending(self, executor, workers, filepaths, model_name, batch_size, verbose):
+        """验证检查点中没有有效记录的图片，返回 (本次验证张数, 用时秒)"""
+        processed = self._load_checkpoint(filepaths, model_name)
+        pending = [filepath for filepath in dict.fromkeys(filepaths) if filepath not in processed]
+        items = [(filepath, os.path.join(self.data_folder, filepath)) for filepath in pending]
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        print(f"⏳ 待验证 {len(pending)} 张图片，进程数: {workers}，批大小: {batch_size}")
+        
+        total_count = len(pending)
+        done_count = 0
+        start = time.perf_counter()
+        
+        def report(records):
+            nonlocal done_count
+            for record in records:
+                self._record(record, checkpoint)
+                if verbose:
+                    status = "✅" if record['valid'] else f"❌ {record['details']['error']}"
+                    print(f"  {record['filepath']}: {status}")
+            previous = done_count
+            done_count += len(records)
+            # 每 100 张输出一次进度与吞吐量
+            if done_count // 100 != previous // 100 or done_count == total_count:
+                elapsed = time.perf_counter() - start
+                print(f"[{done_count}/{total_count}] {done_count / elapsed:.2f} 张/秒")
+        
+        checkpoint = open(self.checkpoint_file, 'a', encoding='utf-8') if self.checkpoint_file else None
+        try:
+            results = executor.map(validate_batch, batches) if executor else map(validate_batch, batches)
+            for records in results:
+                report(records)
+        except KeyboardInterrupt:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            print(f"\n⚠️ 验证已中断，进度已保存到 {self.checkpoint_file}，重新运行即可继续")
+            raise
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+        
+        return done_count, time.perf_counter() - start
+    
+    def update_manifest(self):
+        """把验证结果写入数据集清单的无效标记（原地修改，不删除图片）"""
+        with DatasetManifest.open(self.manifest_path, writable=True) as manifest:
+            marked = manifest.set_flag(self.results['invalid_images'], FLAG_INVALID, True)
+            cleared = manifest.set_flag(self.results['valid_images'], FLAG_INVALID, False)
+        print(f"🏷️ 已更新数据集清单 {self.manifest_path}: 新标记无效 {marked} 张，取消标记 {cleared} 张")
+    
     def save_results(self, output_file='image_validation_results.json'):
         """保存验证结果到文件"""
         result_data = {
@@ -193,12 +347,21 @@ class ImageValidator:
                 print(f"   ... 还有 {len(files) - 5} 张图片")
 
 def main():
+    parser = argparse.ArgumentParser(description="验证数据集图片能否被识别流程正常处理")
+    parser.add_argument('--workers', type=int, default=1, help="并行进程数")
+    parser.add_argument('--batch-size', type=int, default=4, help="每次分割推理的图片数量")
+    parser.add_argument('--fresh', action='store_true', help="忽略检查点，从头开始验证")
+    parser.add_argument('--verbose', action='store_true', help="逐张输出验证结果")
+    args = parser.parse_args()
+
     print("🎯 开始图片验证任务")
     
     validator = ImageValidator()
     
     # 验证所有图片
-    results = validator.validate_all_images(dataset_filter='test')
+    results = validator.validate_all_images(dataset_filter='test', workers=args.workers,
+                                            batch_size=args.batch_size, resume=not args.fresh,
+                                            verbose=args.verbose)
     
     # 保存结果
     validator.save_results()
@@ -207,7 +370,7 @@ def main():
     validator.generate_report()
     
     print(f"\n✅ 验证任务完成！")
-    print(f"💡 提示：您可以使用生成的 'invalid_images_list.txt' 文件来过滤照片墙中的问题图片")
+    print(f"💡 提示：无效图片已在数据集清单中标记，照片墙会自动排除这些图片")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
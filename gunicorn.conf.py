@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn 配置
+主进程导入 app 时预加载模型（BIRD_PRELOAD_MODELS=1），之后再 fork worker，
+各 worker 以写时复制方式共享模型权重，而不是各自加载一份。
+
+启动: gunicorn -c gunicorn.conf.py app:app
+"""
+
+import os
+
+os.environ.setdefault('BIRD_PRELOAD_MODELS', '1')
+
+bind = os.environ.get('BIRD_BIND', '0.0.0.0:80')
+workers = int(os.environ.get('BIRD_WEB_WORKERS', '2'))
+threads = int(os.environ.get('BIRD_WEB_THREADS', '64'))
+# 推理服务按 worker 数平分 CPU 核（见 inference_server 的线程策略）
+os.environ.setdefault('BIRD_WEB_WORKERS', str(workers))
+# 处理页通过长轮询等待任务进度，每个等待中的请求占用一个（几乎不耗 CPU 的）线程；
+# 每个 worker 保留 RESERVED_THREADS 个线程处理普通请求，其余都可用于等待，
+# 默认 2 x (64 - 8) = 112 个等待名额，足够约 100 个同时打开的处理页（超出时请求立即返回并让客户端稍后重试）
+RESERVED_THREADS = 8
+os.environ.setdefault('BIRD_TASK_MAX_WAITERS', str(max(1, threads - RESERVED_THREADS)))
+# 任务由哪个 worker 执行与处理页请求落在哪个 worker 上无关，约一半的等待只能靠复查数据库发现跨进程的更新；
+# 复查间隔从 2 秒缩短到 0.5 秒（100 个等待时约 200 次/秒的单行查询）
+if workers > 1:
+    os.environ.setdefault('BIRD_TASK_WAIT_RECHECK', '0.5')
+timeout = 120
+
+# 在主进程中导入 app（及其中预加载的模型）后再 fork
+preload_app = True
+
+
+def post_fork(server, worker):
+    """每个 worker 在 fork 之后应用自己的 PyTorch 线程策略"""
+    import inference_server
+    inference_server.apply_thread_policy()
+
+
+def child_exit(server, worker):
+    """
+    worker 退出（崩溃、超时或 max_requests 重启）后，把它未完成的任务标记为失败，处理页随即结束等待
+    用完即关闭连接：主进程长期运行，且之后 fork 的 worker 不应继承打开的 SQLite 连接
+    """
+    from jobs import JobStore
+    store = JobStore()
+    try:
+        orphaned = store.fail_orphaned()
+    finally:
+        store.close()
+    if orphaned:
+        server.log.warning("worker %s 退出，已将 %s 个中断的任务标记为失败", worker.pid, orphaned)
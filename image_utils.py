@@ -6,26 +6,76 @@ from PIL import Image
 import os
 import random
 import string
+import zlib
+from model_runtime import MODEL_RUNTIME, resolve_runtime, select_export, load_exported_model
+from model_registry import model_registry
+from uploads_janitor import sharded_path
 
 # 确定计算设备
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-# 加载分割模型
-def load_segmentation_model():
-    model = models.segmentation.deeplabv3_resnet101(pretrained=True)
+# 可选的分割后端（torchvision 预训练模型）
+SEGMENTATION_BACKENDS = (
+    "deeplabv3_resnet101",
+    "deeplabv3_mobilenet_v3_large",
+    "lraspp_mobilenet_v3_large",
+)
+
+# 分割后端与输入尺寸（可通过环境变量覆盖）
+# BIRD_SEGMENTATION_INPUT_SIZE 大于 0 时先把图片缩小到该边长再分割，掩膜再上采样回原尺寸
+SEGMENTATION_BACKEND = os.environ.get('BIRD_SEGMENTATION_BACKEND', 'deeplabv3_resnet101')
+SEGMENTATION_INPUT_SIZE = int(os.environ.get('BIRD_SEGMENTATION_INPUT_SIZE', '0'))
+
+# 缩小分割时掩膜的恢复方式：
+# logits - 把全部类别的 logits 双线性上采样回原尺寸后再取 argmax
+# mask   - 在低分辨率下取 argmax，只上采样单通道的前景掩膜（不再生成原尺寸的浮点张量）
+SEGMENTATION_UPSAMPLE_MODES = ('logits', 'mask')
+SEGMENTATION_UPSAMPLE = os.environ.get('BIRD_SEGMENTATION_UPSAMPLE', 'logits')
+
+def segmentation_model_name(backend=SEGMENTATION_BACKEND, input_size=SEGMENTATION_INPUT_SIZE,
+                            upsample=SEGMENTATION_UPSAMPLE):
+    """后端、输入尺寸与上采样方式组成的名称，例如 deeplabv3_resnet101 或 lraspp_mobilenet_v3_large@512/mask"""
+    if input_size <= 0:
+        return backend
+    name = f"{backend}@{input_size}"
+    return f"{name}/{upsample}" if upsample != 'logits' else name
+
+# 加载分割模型（eager fp32，model_export.py 以此为导出源）
+def load_segmentation_model(backend=SEGMENTATION_BACKEND):
+    if backend not in SEGMENTATION_BACKENDS:
+        raise ValueError(f"未知的分割后端: {backend}，可选: {', '.join(SEGMENTATION_BACKENDS)}")
+    model = getattr(models.segmentation, backend)(pretrained=True)
     model.to(DEVICE)
     model.eval()
     return model
 
-segmentation_model = load_segmentation_model()
+# 按运行时选择导出文件（此时不加载），模型在首次使用时由注册表加载
+SEGMENTATION_EXPORT_PATH, SEGMENTATION_RUNTIME = select_export(SEGMENTATION_BACKEND, resolve_runtime(MODEL_RUNTIME))
+
+def _load_runtime_segmentation_model():
+    if SEGMENTATION_EXPORT_PATH is not None:
+        return load_exported_model(SEGMENTATION_EXPORT_PATH, SEGMENTATION_RUNTIME, DEVICE, output_key='out')
+    return load_segmentation_model()
+
+model_registry.register('segmentation', _load_runtime_segmentation_model, SEGMENTATION_RUNTIME)
+
+def get_segmentation_model():
+    """返回分割模型（首次调用时加载）"""
+    return model_registry.get('segmentation')
+
+# 分割模型名称（同时作为结果缓存版本号的一部分）
+SEGMENTATION_MODEL_NAME = segmentation_model_name()
+if SEGMENTATION_RUNTIME != 'eager':
+    SEGMENTATION_MODEL_NAME = f"{SEGMENTATION_MODEL_NAME}:{SEGMENTATION_RUNTIME}"
 
 # 生成随机文件名的函数
 def generate_random_filename(extension):
     random_str = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
     return f"{random_str}.{extension}"
 
-def compress_image(image_path, output_folder="uploads"):
-    image = Image.open(image_path).convert("RGB")
+# 缩放并居中粘贴到 1024x1024 白色画布（内存版本）
+def compress_pil_image(image):
+    image = image.convert("RGB")
     orig_w, orig_h = image.size
     scale = min(1024 / orig_w, 1024 / orig_h)
     new_w = int(orig_w * scale)
@@ -36,10 +86,12 @@ def compress_image(image_path, output_folder="uploads"):
     x_offset = (1024 - new_w) // 2
     y_offset = (1024 - new_h) // 2
     background.paste(image_resized, (x_offset, y_offset))
+    return background
 
-    os.makedirs(output_folder, exist_ok=True)
-    output_filename = generate_random_filename("jpg")
-    output_path = os.path.join(output_folder, output_filename)
+def compress_image(image_path, output_folder="uploads"):
+    background = compress_pil_image(Image.open(image_path))
+
+    output_path = sharded_path(output_folder, generate_random_filename("jpg"))
     background.save(output_path, quality=85)
     return output_path
 
@@ -52,27 +104,60 @@ def preprocess(image):
     ])
     return preprocess_transform(image).unsqueeze(0).to(DEVICE)
 
-# 分割背景
-def remove_background(image_path):
-    image = Image.open(image_path).convert("RGB")
-    input_tensor = preprocess(image)
-    
+# 批量分割背景（同一批图片尺寸必须一致）
+# model/input_size/upsample 默认使用配置值，基准测试可传入其他取值进行对比
+# upsample 为 mask 时返回 0/1 前景掩膜，否则返回类别编号掩膜（调用方只使用 mask > 0）
+def remove_background_batch(images, model=None, input_size=None, upsample=None):
+    model = get_segmentation_model() if model is None else model
+    input_size = SEGMENTATION_INPUT_SIZE if input_size is None else input_size
+    upsample = SEGMENTATION_UPSAMPLE if upsample is None else upsample
+    if upsample not in SEGMENTATION_UPSAMPLE_MODES:
+        raise ValueError(f"未知的掩膜上采样方式: {upsample}，可选: {', '.join(SEGMENTATION_UPSAMPLE_MODES)}")
+
+    output_size = images[0].size[::-1]
+    if input_size > 0 and max(images[0].size) > input_size:
+        # 在缩小的副本上分割，降低主干网络的计算量
+        scale = input_size / max(images[0].size)
+        small_size = (max(1, round(images[0].width * scale)), max(1, round(images[0].height * scale)))
+        images = [image.resize(small_size, Image.Resampling.BILINEAR) for image in images]
+    input_tensor = torch.cat([preprocess(image) for image in images])
+
     with torch.no_grad():
-        output = segmentation_model(input_tensor)["out"][0]
-    # 将输出上采样到输入图像大小
+        output = model(input_tensor)["out"]
+
+    if upsample == 'mask' and output.shape[2:] != output_size:
+        # 低分辨率下取 argmax，只把单通道前景掩膜放大回原尺寸
+        low_masks = (output.argmax(1) > 0).byte().cpu().numpy()
+        return [cv2.resize(mask, output_size[::-1], interpolation=cv2.INTER_LINEAR) for mask in low_masks]
+
+    # 将输出上采样到原始输入图像大小
     output = torch.nn.functional.interpolate(
-        output.unsqueeze(0),
-        size=image.size[::-1],
+        output,
+        size=output_size,
         mode='bilinear',
         align_corners=False
-    )[0]
-    mask = output.argmax(0).byte().cpu().numpy()
-    
+    )
+    masks = output.argmax(1).byte().cpu().numpy()
+    return list(masks)
+
+# 分割背景
+def remove_background(image_path):
+    image = Image.open(image_path).convert("RGB")
+    mask = remove_background_batch([image])[0]
+
     image_np = np.array(image)
     return image_np, mask
 
-# 创建最终图像
-def create_final_image(image_np, mask, output_folder="uploads"):
+class SubjectDetectionError(Exception):
+    """分割结果中没有可用的主体"""
+
+
+class SubjectTooSmallError(SubjectDetectionError):
+    """选中的主体边界框小于 64x64"""
+
+
+# 选择主体，返回 (主体掩膜, 边界框 (x, y, w, h), 连通组件编号)
+def select_subject(image_np, mask):
     # 识别主体部分
     subject_mask = (mask > 0).astype(np.uint8)
     
@@ -85,127 +170,146 @@ def create_final_image(image_np, mask, output_folder="uploads"):
     kernel_large = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
     subject_mask = cv2.morphologyEx(subject_mask, cv2.MORPH_CLOSE, kernel_large)
     
-    # 查找连接的组件（主体）
-    num_labels, labels_im = cv2.connectedComponents(subject_mask)
+    # 查找连接的组件（主体），同时得到每个组件的边界框与面积
+    num_labels, labels_im, stats, _ = cv2.connectedComponentsWithStats(subject_mask)
     num_subjects = num_labels - 1  # 减去背景
     
     if num_subjects == 0:
-        raise Exception(f"未检测到任何主体")
+        raise SubjectDetectionError("未检测到任何主体")
     elif num_subjects == 1:
         # 只有一个主体，使用原有逻辑
-        coords = cv2.findNonZero(subject_mask)
-        x, y, w, h = cv2.boundingRect(coords)
+        x, y, w, h = (int(v) for v in stats[1, :4])
+        best_component = 1
     else:
         # 多个主体时，选择最佳的主体
         print(f"🔍 检测到 {num_subjects} 个主体，智能选择最佳主体")
         
-        best_score = 0
-        best_component = 0
         image_center_x, image_center_y = image_np.shape[1] // 2, image_np.shape[0] // 2
         
-        # 遍历所有连通组件，计算综合评分
-        for label in range(1, num_labels):  # 跳过背景（label=0）
-            component_mask = (labels_im == label).astype(np.uint8)
-            area = cv2.countNonZero(component_mask)
-            
-            # 跳过过小的组件
-            if area < 100:  # 过滤掉噪声点
-                continue
-            
-            # 获取组件的边界框和中心点
-            coords = cv2.findNonZero(component_mask)
-            if coords is None:
-                continue
-                
-            x, y, w, h = cv2.boundingRect(coords)
-            component_center_x = x + w // 2
-            component_center_y = y + h // 2
-            
-            # 计算综合评分
-            # 1. 面积评分 (40%)
-            area_score = area / (image_np.shape[0] * image_np.shape[1])  # 归一化面积
-            
-            # 2. 位置评分 (30%) - 越靠近图像中心越好
-            distance_to_center = np.sqrt((component_center_x - image_center_x)**2 + 
-                                       (component_center_y - image_center_y)**2)
-            max_distance = np.sqrt(image_center_x**2 + image_center_y**2)
-            position_score = 1 - (distance_to_center / max_distance)
-            
-            # 3. 形状评分 (20%) - 长宽比接近1:1到2:1之间较好（鸟类特征）
-            aspect_ratio = max(w, h) / min(w, h)
-            if aspect_ratio <= 2.0:
-                shape_score = 1.0
-            elif aspect_ratio <= 3.0:
-                shape_score = 0.7
-            else:
-                shape_score = 0.3
-            
-            # 4. 尺寸评分 (10%) - 不能太小也不能太大
-            size_ratio = min(w, h) / max(image_np.shape[0], image_np.shape[1])
-            if 0.1 <= size_ratio <= 0.8:
-                size_score = 1.0
-            else:
-                size_score = 0.5
-            
-            # 综合评分
-            total_score = (area_score * 0.6 + position_score * 0.1 + 
-                          shape_score * 0.1 + size_score * 0.1)
-            
-            print(f"  组件 {label}: 面积={area}, 位置=({component_center_x},{component_center_y}), "
-                  f"尺寸={w}x{h}, 评分={total_score:.3f}")
-            
-            if total_score > best_score:
-                best_score = total_score
-                best_component = label
+        # 所有组件的统计量（跳过背景 label=0），过滤掉面积过小的噪声点
+        labels = np.arange(1, num_labels)
+        component_stats = stats[1:].astype(np.int64)
+        keep = component_stats[:, cv2.CC_STAT_AREA] >= 100
+        labels = labels[keep]
+        xs, ys, ws, hs, areas = component_stats[keep].T
+        component_centers_x = xs + ws // 2
+        component_centers_y = ys + hs // 2
+        
+        # 计算综合评分（对所有组件一次完成）
+        # 1. 面积评分 - 归一化面积
+        area_scores = areas / (image_np.shape[0] * image_np.shape[1])
         
-        if best_component == 0:
-            raise Exception(f"未找到合适的主体组件")
+        # 2. 位置评分 - 越靠近图像中心越好
+        distances_to_center = np.sqrt((component_centers_x - image_center_x)**2 +
+                                      (component_centers_y - image_center_y)**2)
+        max_distance = np.sqrt(image_center_x**2 + image_center_y**2)
+        position_scores = 1 - (distances_to_center / max_distance)
+        
+        # 3. 形状评分 - 长宽比接近1:1到2:1之间较好（鸟类特征）
+        aspect_ratios = np.maximum(ws, hs) / np.minimum(ws, hs)
+        shape_scores = np.where(aspect_ratios <= 2.0, 1.0, np.where(aspect_ratios <= 3.0, 0.7, 0.3))
+        
+        # 4. 尺寸评分 - 不能太小也不能太大
+        size_ratios = np.minimum(ws, hs) / max(image_np.shape[0], image_np.shape[1])
+        size_scores = np.where((size_ratios >= 0.1) & (size_ratios <= 0.8), 1.0, 0.5)
+        
+        # 综合评分
+        total_scores = (area_scores * 0.6 + position_scores * 0.1 +
+                        shape_scores * 0.1 + size_scores * 0.1)
+        
+        # 评分相同时取编号最小的组件（与逐个比较 total_score > best_score 的结果一致）
+        if len(labels) == 0 or total_scores.max() <= 0:
+            raise SubjectDetectionError("未找到合适的主体组件")
+        best_index = int(np.argmax(total_scores))
+        best_component = int(labels[best_index])
+        best_score = total_scores[best_index]
         
         # 创建只包含最佳主体的掩膜
         subject_mask = (labels_im == best_component).astype(np.uint8)
-        coords = cv2.findNonZero(subject_mask)
-        
-        if coords is None:
-            raise Exception(f"无法找到最佳主体的坐标")
-            
-        x, y, w, h = cv2.boundingRect(coords)
+        x, y, w, h = (int(v) for v in stats[best_component, :4])
         print(f"✅ 选择了评分最高的主体 (评分: {best_score:.3f}, 尺寸: {w}x{h})")
     
     # 检查主体尺寸
     if w < 64 or h < 64:
-        raise Exception(f"主体尺寸过小（{w}x{h}）")
-    
+        raise SubjectTooSmallError(f"主体尺寸过小（{w}x{h}）")
+
+    return subject_mask, (x, y, w, h), best_component
+
+# 最终图像的背景填充方式（可通过环境变量覆盖）：
+# random: 每次调用生成新的随机噪声（原有行为，结果不可复现，仅用于对比）
+# seeded: 以主体内容为种子生成噪声，同一张图片每次结果相同
+# tile:   使用启动时按 BIRD_BACKGROUND_SEED 生成的固定噪声图块（默认，最省时）
+# mean:   使用主体周围背景像素的平均颜色
+# zero:   使用 ImageNet 均值颜色，归一化后背景约为 0
+BACKGROUND_MODES = ('random', 'seeded', 'tile', 'mean', 'zero')
+BACKGROUND_MODE = os.environ.get('BIRD_BACKGROUND_MODE', 'tile')
+BACKGROUND_SEED = int(os.environ.get('BIRD_BACKGROUND_SEED', '0'))
+if BACKGROUND_MODE not in BACKGROUND_MODES:
+    raise ValueError(f"未知的背景填充方式: {BACKGROUND_MODE}，可选: {', '.join(BACKGROUND_MODES)}")
+
+FINAL_IMAGE_SIZE = 224
+IMAGENET_MEAN_COLOR = np.array([0.485 * 255, 0.456 * 255, 0.406 * 255]).round().astype(np.uint8)
+BACKGROUND_TILE = np.random.default_rng(BACKGROUND_SEED).integers(
+    0, 256, (FINAL_IMAGE_SIZE, FINAL_IMAGE_SIZE, 3), dtype=np.uint8)
+
+def _fill_background(final_image, mode, subject_resized, mask_resized):
+    """按背景填充方式填充 224x224 画布"""
+    if mode == 'tile':
+        final_image[...] = BACKGROUND_TILE
+    elif mode == 'seeded':
+        seed = zlib.crc32(np.ascontiguousarray(subject_resized)) ^ BACKGROUND_SEED
+        final_image[...] = np.random.default_rng(seed).integers(0, 256, final_image.shape, dtype=np.uint8)
+    elif mode == 'mean':
+        background_pixels = subject_resized[~mask_resized]
+        if len(background_pixels) == 0:
+            background_pixels = subject_resized.reshape(-1, 3)
+        final_image[...] = background_pixels.mean(axis=0).round().astype(np.uint8)
+    elif mode == 'zero':
+        final_image[...] = IMAGENET_MEAN_COLOR
+    elif mode == 'random':
+        final_image[...] = np.random.randint(0, 256, final_image.shape, dtype=np.uint8)
+    else:
+        raise ValueError(f"未知的背景填充方式: {mode}")
+
+# 将选中的主体缩放并居中合成到 224x224 背景上，返回 RGB uint8 数组
+def render_final_image(image_np, subject_mask, bbox, mode=None):
+    x, y, w, h = bbox
+
     # 提取主体和掩膜
     subject = image_np[y:y+h, x:x+w]
     subject_mask = subject_mask[y:y+h, x:x+w]
     
     # 保持长宽比调整主体尺寸到适合 224x224
     subject_h, subject_w = subject.shape[:2]
-    scale = min(224 / subject_w, 224 / subject_h)
+    scale = min(FINAL_IMAGE_SIZE / subject_w, FINAL_IMAGE_SIZE / subject_h)
     new_w = int(subject_w * scale)
     new_h = int(subject_h * scale)
     subject_resized = cv2.resize(subject, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
     mask_resized = cv2.resize(subject_mask, (new_w, new_h), interpolation=cv2.INTER_NEAREST)
     mask_resized = mask_resized.astype(bool)
     
-    # 创建随机噪声背景
-    final_image = np.random.randint(0, 256, (224, 224, 3), dtype=np.uint8)
+    # 填充背景
+    final_image = np.empty((FINAL_IMAGE_SIZE, FINAL_IMAGE_SIZE, 3), dtype=np.uint8)
+    _fill_background(final_image, mode or BACKGROUND_MODE, subject_resized, mask_resized)
     
     # 计算主体在背景中的位置，使其居中
-    x_offset = (224 - new_w) // 2
-    y_offset = (224 - new_h) // 2
+    x_offset = (FINAL_IMAGE_SIZE - new_w) // 2
+    y_offset = (FINAL_IMAGE_SIZE - new_h) // 2
     
-    # 合成最终图像
+    # 合成最终图像（输入已是 RGB，无需再转换通道顺序）
     roi = final_image[y_offset:y_offset+new_h, x_offset:x_offset+new_w]
     roi[mask_resized] = subject_resized[mask_resized]
-    final_image[y_offset:y_offset+new_h, x_offset:x_offset+new_w] = roi
-    
-    # 将图像从BGR转换为RGB
-    final_image_rgb = cv2.cvtColor(final_image, cv2.COLOR_BGR2RGB)
-    final_image_pil = Image.fromarray(final_image_rgb)
+    return final_image
+
+# 合成最终图像（内存版本），返回 224x224x3 的 uint8 数组
+def compose_final_image(image_np, mask):
+    subject_mask, bbox, _ = select_subject(image_np, mask)
+    return render_final_image(image_np, subject_mask, bbox)
+
+# 创建最终图像
+def create_final_image(image_np, mask, output_folder="uploads"):
+    final_image_pil = Image.fromarray(compose_final_image(image_np, mask))
 
-    os.makedirs(output_folder, exist_ok=True)
-    output_filename = generate_random_filename("jpg")
-    output_path = os.path.join(output_folder, output_filename)
+    output_path = sharded_path(output_folder, generate_random_filename("jpg"))
     final_image_pil.save(output_path)
     return output_path
\ No newline at end of file
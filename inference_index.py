@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+照片墙预计算推理索引
+照片墙中的测试集图片不会变化，因此离线对每张有效图片执行一次完整识别流程，
+将主体边界框、所选连通组件、最终 224x224 图像与 top-k 预测按 filepath 存入 SQLite。
+线上选择照片墙图片时直接查询索引，只有索引缺失时才回退到实时识别。
+
+构建索引: python inference_index.py --workers 4
+（支持断点续传：再次运行时跳过已索引的图片；--rebuild 清空后重建）
+"""
+
+import argparse
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dataset_manifest import ensure_manifest, DATASET_MANIFEST_PATH
+
+# 索引文件路径（可通过环境变量覆盖）
+INFERENCE_INDEX_PATH = os.environ.get('BIRD_INFERENCE_INDEX', 'inference_index.db')
+
+# 每写入多少条记录提交一次，中断时最多丢失这么多条
+COMMIT_EVERY = 20
+
+
+class InferenceIndex:
+    """按 filepath 查询预计算识别结果"""
+
+    def __init__(self, db_path=INFERENCE_INDEX_PATH, version=None):
+        self.db_path = db_path
+        self.version = version
+        self._local = threading.local()
+
+    def _connection(self, create=False):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if not create and not os.path.exists(self.db_path):
+                return None
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS predictions (
+                    filepath TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    label TEXT,
+                    class_id INTEGER,
+                    top_k TEXT,
+                    bbox TEXT,
+                    component INTEGER,
+                    crop BLOB,
+                    error TEXT,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, filepath):
+        """返回与当前流程版本一致的成功识别结果，未找到时返回 None"""
+        conn = self._connection()
+        if conn is None:
+            return None
+        row = conn.execute(
+            'SELECT label, class_id, top_k, bbox, component FROM predictions '
+            'WHERE filepath = ? AND version = ? AND error IS NULL',
+            (filepath, self.version)
+        ).fetchone()
+        if row is None:
+            return None
+        label, class_id, top_k, bbox, component = row
+        return {
+            'label': label,
+            'class_id': class_id,
+            'top_k': json.loads(top_k),
+            'bbox': json.loads(bbox),
+            'component': component
+        }
+
+    def indexed_filepaths(self, version):
+        """返回指定版本下已处理过（成功或失败）的 filepath 集合"""
+        conn = self._connection(create=True)
+        rows = conn.execute('SELECT filepath FROM predictions WHERE version = ?', (version,)).fetchall()
+        return {row[0] for row in rows}
+
+    def write(self, record):
+        """写入一条索引记录（不立即提交）"""
+        conn = self._connection(create=True)
+        conn.execute(
+            'INSERT OR REPLACE INTO predictions '
+            '(filepath, version, label, class_id, top_k, bbox, component, crop, error, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (record['filepath'], record['version'], record.get('label'), record.get('class_id'),
+             json.dumps(record.get('top_k'), ensure_ascii=False), json.dumps(record.get('bbox')),
+             record.get('component'), record.get('crop'), record.get('error'), time.time())
+        )
+
+    def commit(self):
+        conn = self._connection(create=True)
+        conn.commit()
+
+    def clear(self):
+        conn = self._connection(create=True)
+        conn.execute('DELETE FROM predictions')
+        conn.commit()
+
+
+# ---------------- 离线构建 ----------------
+
+def _init_worker(threads_per_worker):
+    """子进程初始化：限制 PyTorch 线程数并加载模型"""
+    # 推理服务首次推理时按 BIRD_TORCH_THREADS 应用线程策略，须在导入之前设置，
+    # 否则每个构建进程都会按 CPU 核数 / 槽位数创建线程
+    os.environ['BIRD_TORCH_THREADS'] = str(threads_per_worker)
+    os.environ['BIRD_WEB_WORKERS'] = '1'
+    from model_registry import model_registry
+    import pipeline  # noqa: F401
+    model_registry.preload()
+
+
+def _worker_version():
+    """返回子进程中加载的流程版本"""
+    from pipeline import PIPELINE_VERSION
+    return PIPELINE_VERSION
+
+
+def _index_one(args):
+    """对单张图片执行识别流程，返回索引记录"""
+    filepath, data_folder = args
+    from PIL import Image
+    from pipeline import run_pipeline, PIPELINE_VERSION
+
+    record = {'filepath': filepath, 'version': PIPELINE_VERSION}
+    try:
+        outcome = run_pipeline(os.path.join(data_folder, filepath))
+        buffer = io.BytesIO()
+        Image.fromarray(outcome['final_image']).save(buffer, format='JPEG', quality=90)
+        record.update({
+            'label': outcome['label'],
+            'class_id': outcome['class_id'],
+            'top_k': outcome['top_k'],
+            'bbox': [int(v) for v in outcome['bbox']],
+            'component': int(outcome['component']),
+            'crop': buffer.getvalue()
+        })
+    except Exception as e:
+        record['error'] = str(e)
+    return record
+
+
+def build_index(data_folder='static/', csv_file='all_data.csv', manifest_path=DATASET_MANIFEST_PATH,
+                db_path=INFERENCE_INDEX_PATH, workers=1, rebuild=False):
+    """并行构建索引，已处理的图片会被跳过"""
+    index = InferenceIndex(db_path)
+    if rebuild:
+        index.clear()
+
+    # 测试集中未被标记为无效或缺失的图片
+    filepaths = ensure_manifest(manifest_path, csv_file, data_folder).filepaths('test')
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(threads_per_worker,)) as executor:
+        version = executor.submit(_worker_version).result()
+        done = index.indexed_filepaths(version)
+        todo = [filepath for filepath in filepaths
+                if filepath not in done and os.path.exists(os.path.join(data_folder, filepath))]
+        print(f"🔍 流程版本: {version}")
+        print(f"📋 共 {len(filepaths)} 张有效测试图片，已索引 {len(done)} 张，待处理 {len(todo)} 张")
+
+        start = time.perf_counter()
+        succeeded = failed = 0
+        try:
+            results = executor.map(_index_one, [(filepath, data_folder) for filepath in todo], chunksize=4)
+            for i, record in enumerate(results, 1):
+                index.write(record)
+                if record.get('error'):
+                    failed += 1
+                else:
+                    succeeded += 1
+                if i % COMMIT_EVERY == 0:
+                    index.commit()
+                    elapsed = time.perf_counter() - start
+                    print(f"  [{i}/{len(todo)}] {i / elapsed:.2f} 张/秒")
+        except KeyboardInterrupt:
+            print("\n⚠️ 构建已中断，已完成的结果会被保留，重新运行即可继续")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            # 中断时也保留已完成的结果，下次运行从这里继续
+            index.commit()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ 索引构建完成: 成功 {succeeded} 张，失败 {failed} 张，用时 {elapsed:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建照片墙预计算推理索引")
+    parser.add_argument('--data-folder', default='static/')
+    parser.add_argument('--csv', default='all_data.csv')
+    parser.add_argument('--manifest', default=DATASET_MANIFEST_PATH)
+    parser.add_argument('--output', default=INFERENCE_INDEX_PATH)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--rebuild', action='store_true', help="清空已有索引后重建")
+    args = parser.parse_args()
+
+    build_index(args.data_folder, args.csv, args.manifest, args.output, args.workers, args.rebuild)
+
+
+if __name__ == "__main__":
+    main()
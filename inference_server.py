@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+推理服务：动态微批处理
+将并发请求在几毫秒内攒成一批，对每个模型只执行一次批量前向计算，
+再把各自的掩膜/类别结果分发回调用方。
+
+线程策略：每次前向计算需要占用一个推理槽位，同时进行的前向计算不超过 INFERENCE_SLOTS 个；
+每个计算使用 TORCH_INTRA_OP_THREADS 个线程，默认 web worker 数 x 槽位数 x 线程数 = 可用 CPU 核数，避免线程超额订阅。
+线程策略在每个进程首次推理时（或 gunicorn 的 post_fork 钩子中）应用，导入本模块不会修改 PyTorch 的线程设置。
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+from PIL import Image
+
+from image_utils import remove_background_batch
+from model_utils import classify_batch
+
+# 批处理配置（可通过环境变量覆盖）
+INFERENCE_MAX_BATCH = int(os.environ.get('BIRD_INFERENCE_MAX_BATCH', '8'))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('BIRD_INFERENCE_MAX_WAIT_MS', '5'))
+
+# 线程策略（可通过环境变量覆盖）
+# 默认两个槽位（分割与分类各一个批处理线程，可以重叠执行）；
+# 同一主机上的 BIRD_WEB_WORKERS 个 web worker 各自拥有这些槽位，CPU 核按 worker 数 x 槽位数平分
+CPU_COUNT = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+INFERENCE_SLOTS = max(1, int(os.environ.get('BIRD_INFERENCE_SLOTS', '2')))
+WEB_WORKERS = max(1, int(os.environ.get('BIRD_WEB_WORKERS', '1')))
+TORCH_INTRA_OP_THREADS = (int(os.environ.get('BIRD_TORCH_THREADS', '0'))
+                          or max(1, CPU_COUNT // (WEB_WORKERS * INFERENCE_SLOTS)))
+# inter-op 线程数为 0 时保持 PyTorch 默认值
+TORCH_INTER_OP_THREADS = int(os.environ.get('BIRD_TORCH_INTEROP_THREADS', '1'))
+
+# 已应用线程策略的进程号（fork 后的子进程需要重新应用）
+_policy_pid = None
+_policy_lock = threading.Lock()
+
+
+def apply_thread_policy():
+    """设置 PyTorch 的 intra-op / inter-op 线程数，每个进程只执行一次"""
+    global _policy_pid
+    with _policy_lock:
+        if _policy_pid == os.getpid():
+            return
+        _policy_pid = os.getpid()
+    torch.set_num_threads(TORCH_INTRA_OP_THREADS)
+    if TORCH_INTER_OP_THREADS <= 0:
+        return
+    try:
+        # inter-op 线程池只能在首次并行计算之前设置一次
+        torch.set_num_interop_threads(TORCH_INTER_OP_THREADS)
+    except RuntimeError as e:
+        print(f"⚠️ 无法设置 inter-op 线程数（{e}），保持 {torch.get_num_interop_threads()}")
+
+
+# 所有批处理器共享的推理槽位
+inference_slots = threading.BoundedSemaphore(INFERENCE_SLOTS)
+
+
+class MicroBatcher:
+    """收集待处理请求，达到批大小或等待超时后统一调用 batch_fn"""
+
+    def __init__(self, batch_fn, max_batch_size=INFERENCE_MAX_BATCH,
+                 max_wait_ms=INFERENCE_MAX_WAIT_MS, name='batcher', slots=None):
+        self.batch_fn = batch_fn
+        self.slots = slots
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'batches': 0,
+            'items': 0,
+            'max_batch_seen': 0,
+            'slot_wait_ms': 0.0
+        }
+
+    def _ensure_started(self):
+        """首次提交时应用线程策略并启动工作线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        apply_thread_policy()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item):
+        """提交单个输入，返回 Future"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((item, future))
+        return future
+
+    def submit_many(self, items):
+        """一次性提交多个输入（尽量落在同一批中），返回与输入顺序一致的 Future 列表"""
+        futures = [Future() for _ in items]
+        self._ensure_started()
+        for item, future in zip(items, futures):
+            self._queue.put((item, future))
+        return futures
+
+    def __call__(self, item, timeout=None):
+        """提交单个输入并阻塞等待结果"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect_batch(self):
+        """阻塞等待第一个请求，然后在 max_wait 内尽量凑满一批"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # 跳过调用方已取消的请求
+            batch = [(item, future) for item, future in batch
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                if self.slots is None:
+                    results = self.batch_fn(items)
+                else:
+                    wait_start = time.perf_counter()
+                    with self.slots:
+                        self.stats['slot_wait_ms'] += (time.perf_counter() - wait_start) * 1000
+                        results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: 批处理结果数量 {len(results)} 与输入数量 {len(items)} 不一致")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.stats['batches'] += 1
+            self.stats['items'] += len(items)
+            self.stats['max_batch_seen'] = max(self.stats['max_batch_seen'], len(items))
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+def _segment_grouped(images):
+    """按尺寸分组后批量分割，保证同一批内张量形状一致"""
+    groups = {}
+    for index, image in enumerate(images):
+        groups.setdefault(image.size, []).append(index)
+
+    masks = [None] * len(images)
+    for indices in groups.values():
+        group_masks = remove_background_batch([images[i] for i in indices])
+        for i, mask in zip(indices, group_masks):
+            masks[i] = mask
+    return masks
+
+
+segmentation_batcher = MicroBatcher(_segment_grouped, name='segmentation-batcher', slots=inference_slots)
+classification_batcher = MicroBatcher(classify_batch, name='classification-batcher', slots=inference_slots)
+
+
+def segment_image(image):
+    """对内存中的 PIL 图片执行分割，返回掩膜"""
+    return segmentation_batcher(image)
+
+
+def classify_image(image):
+    """对内存中的 PIL 图片或 RGB 数组执行分类，返回包含 label、class_id、confidence、top_k 的字典"""
+    return classification_batcher(image)
+
+
+def segment_images(images):
+    """批量分割，返回与输入顺序一致的 Future 列表（单张失败不影响其他图片）"""
+    return segmentation_batcher.submit_many(images)
+
+
+def classify_images(images):
+    """批量分类，返回与输入顺序一致的 Future 列表"""
+    return classification_batcher.submit_many(images)
+
+
+def remove_background(image_path):
+    """与 image_utils.remove_background 接口一致，分割经由批处理线程执行"""
+    image = Image.open(image_path).convert("RGB")
+    mask = segmentation_batcher(image)
+    return np.array(image), mask
+
+
+def predict_image(image_path):
+    """与 model_utils.predict_image 接口一致，分类经由批处理线程执行"""
+    image = Image.open(image_path).convert("RGB")
+    return classification_batcher(image)['label']
+
+
+def get_stats():
+    """返回各批处理器的统计信息"""
+    return {
+        'max_batch_size': INFERENCE_MAX_BATCH,
+        'max_wait_ms': INFERENCE_MAX_WAIT_MS,
+        'thread_policy': {
+            'cpu_count': CPU_COUNT,
+            'web_workers': WEB_WORKERS,
+            'inference_slots': INFERENCE_SLOTS,
+            'intra_op_threads': torch.get_num_threads(),
+            'inter_op_threads': torch.get_num_interop_threads()
+        },
+        'segmentation': dict(segmentation_batcher.stats),
+        'classification': dict(classification_batcher.stats)
+    }
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+任务子系统
+- JobStore: 基于 SQLite 的任务状态存储，可在多个进程（gunicorn worker）之间共享并在重启后保留；
+  每次更新递增任务的 revision，等待方可阻塞到任务发生变化（长轮询）；
+  上传预览等较大的二进制内容单独存放，不随任务状态读写
+- JobEvents: 进程内的任务更新通知
+- JobQueue: 有界队列 + 固定数量的工作线程，队列满时拒绝新任务（背压）
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+# 任务配置（可通过环境变量覆盖）
+JOB_DB_PATH = os.environ.get('BIRD_JOB_DB', 'jobs.db')
+JOB_WORKERS = int(os.environ.get('BIRD_JOB_WORKERS', '2'))
+JOB_QUEUE_SIZE = int(os.environ.get('BIRD_JOB_QUEUE_SIZE', '32'))
+JOB_TTL_SECONDS = int(os.environ.get('BIRD_JOB_TTL_SECONDS', '3600'))
+JOB_CLEANUP_INTERVAL = int(os.environ.get('BIRD_JOB_CLEANUP_INTERVAL', '60'))
+# 长轮询：等待任务更新的最长时间、跨进程更新的复查间隔与每个进程同时等待的请求数上限
+JOB_WAIT_TIMEOUT = float(os.environ.get('BIRD_TASK_WAIT_TIMEOUT', '25'))
+JOB_WAIT_RECHECK = float(os.environ.get('BIRD_TASK_WAIT_RECHECK', '2'))
+JOB_MAX_WAITERS = int(os.environ.get('BIRD_TASK_MAX_WAITERS', '128'))
+
+# 已结束的任务状态，仅这些状态的任务会被 TTL 清理
+FINISHED_STATUSES = ('completed', 'failed')
+
+# 本进程的唯一标识；容器中重启后 PID 可能不变，需要用它区分新旧进程
+OWNER_TOKEN = uuid.uuid4().hex
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+    def __init__(self, depth):
+        super().__init__(f"任务队列已满（当前排队 {depth} 个任务）")
+        self.depth = depth
+
+
+def _pid_alive(pid):
+    """判断进程是否仍在运行"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobEvents:
+    """进程内的任务更新通知：等待方阻塞在 Condition 上，任务更新时唤醒，只为有人等待的任务记录版本号"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._watchers = {}  # job_id -> [通知次数, 等待者数量]
+
+    def watch(self, job_id):
+        """登记等待者，返回当前通知次数（须在读取任务状态之前调用，以免错过通知）"""
+        with self._cond:
+            entry = self._watchers.setdefault(job_id, [0, 0])
+            entry[1] += 1
+            return entry[0]
+
+    def unwatch(self, job_id):
+        with self._cond:
+            entry = self._watchers.get(job_id)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._watchers[job_id]
+
+    def notify(self, job_id):
+        """任务已更新，唤醒等待该任务的线程"""
+        with self._cond:
+            entry = self._watchers.get(job_id)
+            if entry is not None:
+                entry[0] += 1
+                self._cond.notify_all()
+
+    def wait(self, job_id, seen, timeout):
+        """阻塞到通知次数不再等于 seen 或超时，返回最新的通知次数"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._watchers[job_id][0] != seen, timeout)
+            return self._watchers[job_id][0]
+
+
+class JobStore:
+    """任务状态存储，每条任务以 JSON 形式保存完整状态字典"""
+
+    def __init__(self, db_path=JOB_DB_PATH, max_waiters=JOB_MAX_WAITERS):
+        self.db_path = db_path
+        self._local = threading.local()
+        self.events = JobEvents()
+        self._waiters = threading.BoundedSemaphore(max(1, max_waiters))
+        self.waiter_stats = {'waits': 0, 'rejected': 0, 'wakeups': 0, 'timeouts': 0}
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    owner_pid INTEGER,
+                    owner_token TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, updated_at)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS job_previews (
+                    id TEXT PRIMARY KEY,
+                    data BLOB NOT NULL
+                )
+            ''')
+
+    def _connection(self):
+        """每个线程复用自己的连接（自动提交模式）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _transaction(self):
+        """开启写事务"""
+        return _Transaction(self._connection())
+
+    def create(self, job_id, data):
+        """新建任务"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, data, owner_pid, owner_token, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, data.get('status', 'queued'), json.dumps(data, ensure_ascii=False),
+                 os.getpid(), OWNER_TOKEN, now, now)
+            )
+
+    def get(self, job_id):
+        """读取任务状态，不存在时返回 None"""
+        row = self._connection().execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, job_id, mutate):
+        """在事务中读取任务状态，调用 mutate(data) 原地修改后写回"""
+        with self._transaction() as conn:
+            row = conn.execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            data = json.loads(row[0])
+            mutate(data)
+            data['revision'] = data.get('revision', 0) + 1
+            conn.execute(
+                'UPDATE jobs SET status = ?, data = ?, updated_at = ? WHERE id = ?',
+                (data.get('status'), json.dumps(data, ensure_ascii=False), time.time(), job_id)
+            )
+        self.events.notify(job_id)
+        return data
+
+    def wait_for_change(self, job_id, revision, timeout=JOB_WAIT_TIMEOUT, recheck=JOB_WAIT_RECHECK):
+        """
+        长轮询：阻塞到任务的 revision 不再等于给定值、任务结束或超时，返回最新状态
+        同一进程内的更新通过 JobEvents 立即唤醒；其他进程中的更新每 recheck 秒读取一次数据库发现。
+        同时等待的请求数超过上限时不阻塞，直接返回当前状态（调用方应让客户端稍后再试）。
+        Returns:
+            tuple: (任务状态或 None, 是否进行了等待)
+        """
+        if not self._waiters.acquire(blocking=False):
+            self.waiter_stats['rejected'] += 1
+            return self.get(job_id), False
+        seen = self.events.watch(job_id)
+        try:
+            self.waiter_stats['waits'] += 1
+            deadline = time.monotonic() + timeout
+            while True:
+                data = self.get(job_id)
+                if data is None or data.get('revision', 0) != revision or data.get('status') in FINISHED_STATUSES:
+                    return data, True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.waiter_stats['timeouts'] += 1
+                    return data, True
+                notified = self.events.wait(job_id, seen, min(remaining, recheck))
+                if notified != seen:
+                    self.waiter_stats['wakeups'] += 1
+                seen = notified
+        finally:
+            self.events.unwatch(job_id)
+            self._waiters.release()
+
+    def set_fields(self, job_id, **fields):
+        """更新任务的若干顶层字段"""
+        return self.update(job_id, lambda data: data.update(fields))
+
+    def set_step(self, job_id, step, done=True):
+        """更新单个处理步骤的完成状态"""
+        return self.set_steps(job_id, [step], done)
+
+    def set_steps(self, job_id, steps, done=True):
+        """在一次写入中更新多个处理步骤的完成状态"""
+        def mutate(data):
+            data.setdefault('steps', {}).update((step, done) for step in steps)
+        return self.update(job_id, mutate)
+
+    def add_files(self, job_id, paths):
+        """记录任务在磁盘上产生的文件（files 字段），任务结束前清理上传目录时不会删除这些文件"""
+        def mutate(data):
+            files = data.setdefault('files', [])
+            files.extend(path for path in paths if path not in files)
+        return self.update(job_id, mutate)
+
+    def set_preview(self, job_id, data):
+        """保存任务的上传预览（JPEG 字节），不修改任务状态与 revision"""
+        with self._transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO job_previews (id, data) VALUES (?, ?)', (job_id, data))
+
+    def get_preview(self, job_id):
+        """读取任务的上传预览，不存在时返回 None"""
+        row = self._connection().execute('SELECT data FROM job_previews WHERE id = ?', (job_id,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def list_active(self):
+        """返回所有未结束的任务状态"""
+        placeholders = ', '.join('?' for _ in FINISHED_STATUSES)
+        rows = self._connection().execute(
+            f'SELECT data FROM jobs WHERE status NOT IN ({placeholders})', FINISHED_STATUSES
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def purge_expired(self, ttl=JOB_TTL_SECONDS):
+        """删除结束超过 ttl 秒的任务，返回删除数量"""
+        placeholders = ', '.join('?' for _ in FINISHED_STATUSES)
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f'DELETE FROM jobs WHERE status IN ({placeholders}) AND updated_at < ?',
+                (*FINISHED_STATUSES, time.time() - ttl)
+            )
+            conn.execute('DELETE FROM job_previews WHERE id NOT IN (SELECT id FROM jobs)')
+        return cursor.rowcount
+
+    def fail_orphaned(self):
+        """将所属进程已退出的未完成任务标记为失败（例如服务重启前排队中的任务）"""
+        placeholders = ', '.join('?' for _ in FINISHED_STATUSES)
+        rows = self._connection().execute(
+            f'SELECT id, owner_pid, owner_token FROM jobs WHERE status NOT IN ({placeholders})', FINISHED_STATUSES
+        ).fetchall()
+        orphaned = [
+            job_id for job_id, pid, token in rows
+            if pid is None or not _pid_alive(pid) or (pid == os.getpid() and token != OWNER_TOKEN)
+        ]
+        for job_id in orphaned:
+            self.set_fields(job_id, status='failed', error='服务重启，任务已中断，请重新提交')
+        return len(orphaned)
+
+
+class _Transaction:
+    """以 BEGIN IMMEDIATE 开启写事务，避免多进程并发读改写时丢失更新"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
+
+
+class JobQueue:
+    """有界任务队列与工作线程池"""
+
+    def __init__(self, handler, store, num_workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE,
+                 ttl=JOB_TTL_SECONDS, cleanup_interval=JOB_CLEANUP_INTERVAL):
+        self.handler = handler
+        self.store = store
+        self.num_workers = max(1, num_workers)
+        self.max_queue = max(1, max_queue)
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动工作线程与清理线程（重复调用无副作用）"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.num_workers):
+                thread = threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            cleaner = threading.Thread(target=self._cleaner, name='job-cleaner', daemon=True)
+            cleaner.start()
+            self._threads.append(cleaner)
+
+    def submit(self, job_id, payload):
+        """提交任务，队列已满时抛出 QueueFullError"""
+        self.start()
+        try:
+            self._queue.put_nowait((job_id, payload))
+        except queue.Full:
+            raise QueueFullError(self.depth())
+
+    def depth(self):
+        """当前排队中的任务数"""
+        return self._queue.qsize()
+
+    def _worker(self):
+        while True:
+            job_id, payload = self._queue.get()
+            try:
+                self.handler(job_id, payload)
+            except Exception as e:
+                print(f"❌ 任务 {job_id} 执行异常: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _cleaner(self):
+        while True:
+            time.sleep(self.cleanup_interval)
+            try:
+                removed = self.store.purge_expired(self.ttl)
+                if removed:
+                    print(f"🧹 已清理 {removed} 个过期任务")
+                # 其他 worker 进程被重启时，它的未完成任务不会再有人执行
+                orphaned = self.store.fail_orphaned()
+                if orphaned:
+                    print(f"⚠️ 已将 {orphaned} 个中断的任务标记为失败")
+            except Exception as e:
+                print(f"⚠️ 清理过期任务失败: {e}")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+运行指标
+- Histogram: 线程安全的累积直方图（Prometheus 语义，桶上界单位为毫秒）
+- timed_stage: 记录识别流程中单个步骤的耗时，同时写入调用方的 timings 字典与直方图
+- MetricsRegistry.render: 输出 Prometheus 文本格式（/metrics），队列深度、模型加载耗时、缓存统计等
+  即时数值由 app 登记的采集函数在导出时读取
+指标按进程统计；gunicorn 多 worker 部署时每次抓取只反映处理该请求的 worker。
+"""
+
+import contextlib
+import math
+import threading
+import time
+
+# 步骤耗时直方图的桶上界（毫秒）
+STAGE_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """按标签分组的累积直方图"""
+
+    def __init__(self, name, documentation, buckets=STAGE_BUCKETS_MS, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}  # 标签值元组 -> [各桶计数, 总和, 总数]
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series_items = sorted((key, ([*series[0]], series[1], series[2])) for key, series in self._series.items())
+        for key, (counts, total, count) in series_items:
+            labels = dict(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": bound})} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": "+Inf"})} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """直方图与即时指标采集函数的集合"""
+
+    def __init__(self):
+        self._histograms = []
+        self._collectors = []
+
+    def histogram(self, name, documentation, buckets=STAGE_BUCKETS_MS, labelnames=()):
+        histogram = Histogram(name, documentation, buckets, labelnames)
+        self._histograms.append(histogram)
+        return histogram
+
+    def register_collector(self, collector):
+        """
+        登记采集函数，导出时调用
+        collector() 返回 [(指标名, 类型 gauge/counter, 说明, [(标签字典, 数值), ...]), ...]
+        """
+        self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+        for histogram in self._histograms:
+            lines.extend(histogram.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                lines.append(f'# 采集失败 {getattr(collector, "__name__", collector)}: {e}')
+                continue
+            for name, metric_type, documentation, samples in families:
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+# 识别流程各步骤的耗时（cache_lookup 为结果缓存查询耗时）
+stage_duration = metrics_registry.histogram(
+    'bird_stage_duration_ms', '识别流程各步骤耗时（毫秒）', labelnames=('stage',))
+# 后台任务从提交到开始处理的排队时间
+job_queue_wait = metrics_registry.histogram(
+    'bird_job_queue_wait_ms', '后台任务排队等待时间（毫秒）')
+# 识别请求的总耗时（按入口区分：job / api / api_batch）
+request_duration = metrics_registry.histogram(
+    'bird_identify_duration_ms', '识别请求总耗时（毫秒）', labelnames=('endpoint',))
+
+
+def observe_stage(timings, stage, elapsed_ms):
+    """记录单个步骤的耗时（毫秒）到 timings[stage] 与步骤耗时直方图"""
+    timings[stage] = round(elapsed_ms, 2)
+    stage_duration.observe(elapsed_ms, stage=stage)
+
+
+@contextlib.contextmanager
+def timed_stage(timings, stage):
+    """记录 with 块的耗时，见 observe_stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(timings, stage, (time.perf_counter() - start) * 1000)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+模型导出
+把分类模型（ResNet50）与分割模型导出为 model_runtime 可加载的版本：
+- torchscript       分类模型 trace、分割模型 script（fp32）
+- torchscript-int8  torch 动态 int8 量化（仅量化线性层；DeepLabV3/LR-ASPP 没有线性层，因此跳过）
+- onnx              ONNX（批大小与分割输入尺寸为动态维度）
+- onnx-int8         ONNX Runtime 动态 int8 量化（包括卷积层）
+
+导出: python model_export.py --models classifier segmentation --runtimes torchscript onnx onnx-int8
+使用: BIRD_MODEL_RUNTIME=onnx-int8 python app.py
+"""
+
+import argparse
+import os
+
+# 导出源必须是 eager fp32 模型
+os.environ['BIRD_MODEL_RUNTIME'] = 'eager'
+
+import torch
+
+from model_runtime import EXPORT_DIR, MODEL_RUNTIMES, export_path
+
+EXPORT_MODELS = ('classifier', 'segmentation')
+
+# 导出时使用的示例输入尺寸
+CLASSIFIER_INPUT_SHAPE = (1, 3, 224, 224)
+SEGMENTATION_INPUT_SHAPE = (1, 3, 1024, 1024)
+
+ONNX_OPSET = 17
+
+
+class SegmentationOutput(torch.nn.Module):
+    """只返回分割模型的 'out' 输出，便于 script 与 ONNX 导出"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x)['out']
+
+
+def _quantize_dynamic(model):
+    """动态 int8 量化线性层，返回 None 表示模型中没有可量化的层"""
+    if not any(isinstance(module, torch.nn.Linear) for module in model.modules()):
+        return None
+    return torch.quantization.quantize_dynamic(model.cpu(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _export_torchscript(model, example, path, script=False):
+    with torch.no_grad():
+        module = torch.jit.script(model) if script else torch.jit.trace(model, example)
+    module.save(path)
+
+
+def _export_onnx(model, example, path, dynamic_axes):
+    with torch.no_grad():
+        torch.onnx.export(
+            model, example, path,
+            input_names=['input'],
+            output_names=['out'],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET
+        )
+
+
+def _quantize_onnx(fp32_path, path):
+    """使用 ONNX Runtime 对已导出的 fp32 模型做动态 int8 量化"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+
+
+def export_model(name, model_name, model, example, runtimes, dynamic_axes, script=False, export_dir=EXPORT_DIR):
+    """按运行时列表导出单个模型，返回 [(运行时, 路径或跳过原因)]"""
+    model = model.cpu().eval()
+    example = example.cpu()
+    results = []
+    for runtime in runtimes:
+        path = export_path(model_name, runtime, export_dir)
+        try:
+            if runtime == 'torchscript':
+                _export_torchscript(model, example, path, script=script)
+            elif runtime == 'torchscript-int8':
+                quantized = _quantize_dynamic(model)
+                if quantized is None:
+                    results.append((runtime, "跳过：没有可动态量化的线性层"))
+                    continue
+                _export_torchscript(quantized, example, path, script=script)
+            elif runtime == 'onnx':
+                _export_onnx(model, example, path, dynamic_axes)
+            elif runtime == 'onnx-int8':
+                fp32_path = export_path(model_name, 'onnx', export_dir)
+                if not os.path.exists(fp32_path):
+                    _export_onnx(model, example, fp32_path, dynamic_axes)
+                _quantize_onnx(fp32_path, path)
+        except ImportError as e:
+            results.append((runtime, f"跳过：缺少依赖（{e.name}）"))
+            continue
+        results.append((runtime, path))
+        print(f"  ✅ {name} {runtime}: {path} ({os.path.getsize(path) / 1024 / 1024:.1f}MB)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出量化 / TorchScript / ONNX 模型")
+    parser.add_argument('--models', nargs='+', choices=EXPORT_MODELS, default=list(EXPORT_MODELS))
+    parser.add_argument('--runtimes', nargs='+', choices=[runtime for runtime in MODEL_RUNTIMES if runtime != 'eager'],
+                        default=['torchscript', 'torchscript-int8', 'onnx', 'onnx-int8'])
+    parser.add_argument('--output', default=EXPORT_DIR)
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    skipped = []
+
+    if 'classifier' in args.models:
+        from model_utils import load_classification_model, WEIGHTS_VERSION
+        print(f"🔧 导出分类模型 {WEIGHTS_VERSION}")
+        results = export_model(
+            'classifier', WEIGHTS_VERSION, load_classification_model(), torch.randn(*CLASSIFIER_INPUT_SHAPE),
+            args.runtimes, dynamic_axes={'input': {0: 'batch'}, 'out': {0: 'batch'}}, export_dir=args.output
+        )
+        skipped += [('classifier', runtime, reason) for runtime, reason in results if reason.startswith('跳过')]
+
+    if 'segmentation' in args.models:
+        from image_utils import load_segmentation_model, SEGMENTATION_BACKEND
+        print(f"🔧 导出分割模型 {SEGMENTATION_BACKEND}")
+        results = export_model(
+            'segmentation', SEGMENTATION_BACKEND, SegmentationOutput(load_segmentation_model()),
+            torch.randn(*SEGMENTATION_INPUT_SHAPE), args.runtimes,
+            dynamic_axes={'input': {0: 'batch', 2: 'height', 3: 'width'},
+                          'out': {0: 'batch', 2: 'height', 3: 'width'}},
+            script=True, export_dir=args.output
+        )
+        skipped += [('segmentation', runtime, reason) for runtime, reason in results if reason.startswith('跳过')]
+
+    for name, runtime, reason in skipped:
+        print(f"  ⏭️ {name} {runtime}: {reason}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+模型注册表
+image_utils / model_utils 在导入时只登记模型的加载函数，首次使用时才真正加载，
+只做部分工作的脚本不再为用不到的模型付出加载时间与内存。
+
+多进程部署（gunicorn preload_app）时可在 fork 之前调用 preload_for_fork()：
+主进程加载全部模型并冻结垃圾回收器，各 worker 以写时复制方式共享同一份权重。
+"""
+
+import gc
+import os
+import threading
+import time
+
+# 设置为 1 时 app 在导入阶段预加载全部模型（配合 gunicorn preload_app 使用）
+PRELOAD_MODELS = os.environ.get('BIRD_PRELOAD_MODELS', '0') == '1'
+
+
+class ModelRegistry:
+    """按名称登记加载函数，首次 get 时加载并缓存模型"""
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._locks = {}
+        self._status = {}
+
+    def register(self, name, loader, runtime='eager'):
+        """登记模型；loader 为无参函数，返回加载好的模型"""
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        self._status[name] = {
+            'state': 'not_loaded',
+            'runtime': runtime,
+            'load_seconds': None,
+            'loaded_at': None,
+            'error': None
+        }
+
+    def get(self, name):
+        """返回模型，尚未加载时在当前线程加载（同一模型只加载一次）"""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is not None:
+                return model
+
+            status = self._status[name]
+            status['state'] = 'loading'
+            start = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                status['state'] = 'error'
+                status['error'] = str(e)
+                raise
+            status['load_seconds'] = round(time.perf_counter() - start, 3)
+            status['loaded_at'] = time.time()
+            status['state'] = 'loaded'
+            status['error'] = None
+            self._models[name] = model
+            print(f"✅ 模型 {name} 加载完成，用时 {status['load_seconds']:.2f}s")
+            return model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def preload(self, names=None):
+        """加载全部（或指定的）已登记模型"""
+        for name in names or list(self._loaders):
+            self.get(name)
+
+    def status(self):
+        """各模型的加载状态、运行时与加载耗时"""
+        return {name: dict(status) for name, status in self._status.items()}
+
+
+model_registry = ModelRegistry()
+
+
+def preload_for_fork(names=None):
+    """
+    fork worker 之前在主进程调用：加载模型后冻结垃圾回收器，
+    避免 worker 中的 GC 扫描写入这些对象所在的内存页，破坏写时复制共享
+    """
+    model_registry.preload(names)
+    gc.freeze()
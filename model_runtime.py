@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+模型运行时
+除默认的 eager fp32 PyTorch 外，可加载由 model_export.py 导出的模型版本：
+- torchscript       TorchScript（fp32）
+- torchscript-int8  动态 int8 量化后的 TorchScript
+- onnx              ONNX，使用 ONNX Runtime 推理
+- onnx-int8         ONNX Runtime 动态 int8 量化模型
+
+未安装 onnxruntime 时 ONNX 版本回退到对应的 TorchScript 版本；int8 导出文件不存在时使用对应的 fp32 版本
+（例如 DeepLabV3 没有可动态量化的线性层，只有 onnx-int8 版本），仍不存在时回退到 eager。
+加载后的模型与 eager 模型调用方式一致：分类模型返回 logits 张量，分割模型返回 {'out': logits}。
+"""
+
+import os
+
+import torch
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+# 运行时与导出目录（可通过环境变量覆盖）
+MODEL_RUNTIME = os.environ.get('BIRD_MODEL_RUNTIME', 'eager')
+EXPORT_DIR = os.environ.get('BIRD_EXPORT_DIR', 'exported_models')
+
+MODEL_RUNTIMES = ('eager', 'torchscript', 'torchscript-int8', 'onnx', 'onnx-int8')
+
+# 运行时 -> 导出文件后缀
+_RUNTIME_SUFFIXES = {
+    'torchscript': '.pt',
+    'torchscript-int8': '.int8.pt',
+    'onnx': '.onnx',
+    'onnx-int8': '.int8.onnx',
+}
+
+# ONNX Runtime 不可用时的替代运行时
+_ONNX_FALLBACKS = {'onnx': 'torchscript', 'onnx-int8': 'torchscript-int8'}
+
+
+def export_path(model_name, runtime, export_dir=EXPORT_DIR):
+    """导出文件路径，例如 exported_models/resnet50-0123456789abcdef.int8.onnx"""
+    return os.path.join(export_dir, f"{model_name}{_RUNTIME_SUFFIXES[runtime]}")
+
+
+def resolve_runtime(runtime=MODEL_RUNTIME):
+    """校验运行时名称，ONNX Runtime 不可用时返回对应的 TorchScript 运行时"""
+    if runtime not in MODEL_RUNTIMES:
+        raise ValueError(f"未知的模型运行时: {runtime}，可选: {', '.join(MODEL_RUNTIMES)}")
+    if runtime in _ONNX_FALLBACKS and onnxruntime is None:
+        print(f"⚠️ 未安装 onnxruntime，{runtime} 回退为 {_ONNX_FALLBACKS[runtime]}")
+        return _ONNX_FALLBACKS[runtime]
+    return runtime
+
+
+class TorchScriptRunner:
+    """加载 TorchScript 模型，output_key 不为空时把输出包装为字典"""
+
+    def __init__(self, path, device, output_key=None):
+        self.path = path
+        self.device = device
+        self.output_key = output_key
+        self.module = torch.jit.load(path, map_location=device)
+        self.module.eval()
+
+    def __call__(self, input_tensor):
+        output = self.module(input_tensor.to(self.device))
+        return {self.output_key: output} if self.output_key else output
+
+
+class OnnxRunner:
+    """使用 ONNX Runtime 推理，输入输出均为 torch 张量"""
+
+    def __init__(self, path, device, output_key=None):
+        self.path = path
+        self.device = device
+        self.output_key = output_key
+        available = onnxruntime.get_available_providers()
+        providers = [provider for provider in ('CUDAExecutionProvider', 'CPUExecutionProvider')
+                     if provider in available and (provider != 'CUDAExecutionProvider' or device.type == 'cuda')]
+        self.session = onnxruntime.InferenceSession(path, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, input_tensor):
+        output = self.session.run(None, {self.input_name: input_tensor.detach().cpu().numpy()})[0]
+        output = torch.from_numpy(output).to(self.device)
+        return {self.output_key: output} if self.output_key else output
+
+
+def select_export(model_name, runtime, export_dir=EXPORT_DIR):
+    """
+    选择将要加载的导出文件（不加载模型）
+    Returns:
+        tuple: (导出文件路径, 实际使用的运行时)；没有可用的导出文件时为 (None, 'eager')
+    """
+    if runtime == 'eager':
+        return None, 'eager'
+    candidates = [runtime]
+    if runtime.endswith('-int8'):
+        candidates.append(runtime[:-len('-int8')])
+    for candidate in candidates:
+        path = export_path(model_name, candidate, export_dir)
+        if os.path.exists(path):
+            if candidate != runtime:
+                print(f"⚠️ 未找到 {model_name} 的 {runtime} 版本，使用 {candidate}")
+            return path, candidate
+
+    print(f"⚠️ 未找到 {model_name} 的 {runtime} 导出文件，使用 eager 模型（可运行 python model_export.py 生成）")
+    return None, 'eager'
+
+
+def load_exported_model(path, runtime, device, output_key=None):
+    """加载 select_export 选出的导出文件，返回 TorchScriptRunner 或 OnnxRunner"""
+    print(f"📦 加载 {runtime} 模型: {path}")
+    if runtime.startswith('onnx'):
+        return OnnxRunner(path, device, output_key)
+    return TorchScriptRunner(path, device, output_key)
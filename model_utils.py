@@ -1,18 +1,54 @@
 import torch
 from torchvision import transforms, models
 from PIL import Image
-import pandas as pd
 from config import MODEL_PATH, CSV_PATH
+from class_registry import get_class_registry
+from model_runtime import MODEL_RUNTIME, resolve_runtime, select_export, load_exported_model
+from model_registry import model_registry
 import os
+import hashlib
+import json
+import threading
+import numpy as np
 
 # 确定计算设备
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-# 加载类别映射
-class_mapping = pd.read_csv(CSV_PATH)
-class_to_label = class_mapping.set_index('class')['original_label'].to_dict()
+# 加载类别映射（与 app 共享同一注册表实例）
+class_registry = get_class_registry(CSV_PATH)
 
-# 加载分类模型
+# 模型权重版本：权重文件内容的摘要，同时用作导出模型的文件名
+# 摘要连同权重文件的修改时间与大小保存在旁边的 .sha256 文件中，两者不变时直接复用，不必每个进程都读取整个权重文件
+def _compute_weights_version(model_path):
+    stat = os.stat(model_path)
+    signature = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    sidecar_path = f"{model_path}.sha256"
+    try:
+        with open(sidecar_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if all(cached.get(key) == value for key, value in signature.items()) and cached.get('sha256'):
+            return f"resnet50-{cached['sha256'][:16]}"
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    tmp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(signature, sha256=digest.hexdigest()), f)
+        os.replace(tmp_path, sidecar_path)
+    except OSError as e:
+        print(f"⚠️ 无法保存权重摘要 {sidecar_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return f"resnet50-{digest.hexdigest()[:16]}"
+
+WEIGHTS_VERSION = _compute_weights_version(MODEL_PATH)
+
+# 加载分类模型（eager fp32，model_export.py 以此为导出源）
 def load_classification_model():
     model = models.resnet50(weights=None)
     num_classes = 167
@@ -22,23 +58,144 @@ def load_classification_model():
     model.eval()
     return model
 
-classification_model = load_classification_model()
+# 按运行时选择导出文件（此时不加载），模型在首次使用时由注册表加载
+CLASSIFIER_EXPORT_PATH, CLASSIFIER_RUNTIME = select_export(WEIGHTS_VERSION, resolve_runtime(MODEL_RUNTIME))
+
+def _load_runtime_classification_model():
+    if CLASSIFIER_EXPORT_PATH is not None:
+        return load_exported_model(CLASSIFIER_EXPORT_PATH, CLASSIFIER_RUNTIME, DEVICE)
+    return load_classification_model()
+
+model_registry.register('classifier', _load_runtime_classification_model, CLASSIFIER_RUNTIME)
+
+def get_classification_model():
+    """返回分类模型（首次调用时加载）"""
+    return model_registry.get('classifier')
+
+# 模型版本：用于区分不同模型（及量化/导出版本）产生的缓存结果
+MODEL_VERSION = WEIGHTS_VERSION if CLASSIFIER_RUNTIME == 'eager' else f"{WEIGHTS_VERSION}:{CLASSIFIER_RUNTIME}"
+
+# 返回的候选类别数量与置信度阈值（可通过环境变量覆盖）
+DEFAULT_TOP_K = int(os.environ.get('BIRD_TOP_K', '5'))
+CONFIDENCE_THRESHOLD = float(os.environ.get('BIRD_CONFIDENCE_THRESHOLD', '0.5'))
 
 # 数据转换
+INPUT_SIZE = 224
+NORMALIZE_MEAN = [0.485, 0.456, 0.406]
+NORMALIZE_STD = [0.229, 0.224, 0.225]
 data_transforms = transforms.Compose([
-    transforms.Resize((224, 224)),
+    transforms.Resize((INPUT_SIZE, INPUT_SIZE)),
     transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    transforms.Normalize(mean=NORMALIZE_MEAN, std=NORMALIZE_STD)
 ])
 
-def predict_image(image_path):
-    """模型预测"""
-    image = Image.open(image_path).convert("RGB")
-    input_tensor = data_transforms(image).unsqueeze(0).to(DEVICE)
+_mean_tensor = torch.tensor(NORMALIZE_MEAN).view(3, 1, 1)
+_std_tensor = torch.tensor(NORMALIZE_STD).view(3, 1, 1)
+# 每个线程复用的输入张量，批大小变大时扩容
+_input_buffers = threading.local()
+
+def _input_buffer(batch_size):
+    buffer = getattr(_input_buffers, 'tensor', None)
+    if buffer is None or buffer.shape[0] < batch_size:
+        buffer = _input_buffers.tensor = torch.empty((batch_size, 3, INPUT_SIZE, INPUT_SIZE))
+    return buffer[:batch_size]
+
+def images_to_tensor(images):
+    """
+    把一批图片写入预分配的输入张量，结果与逐张 data_transforms 后 stack 相同
+    224x224 的 RGB uint8 数组（render_final_image 的输出）或同尺寸的 RGB 图片直接复制并原地归一化，
+    其他尺寸的图片仍经过 data_transforms
+    """
+    batch = _input_buffer(len(images))
+    for i, image in enumerate(images):
+        if isinstance(image, Image.Image):
+            if image.mode != 'RGB' or image.size != (INPUT_SIZE, INPUT_SIZE):
+                batch[i].copy_(data_transforms(image))
+                continue
+            image = np.array(image)
+        if image.shape != (INPUT_SIZE, INPUT_SIZE, 3):
+            batch[i].copy_(data_transforms(Image.fromarray(image)))
+            continue
+        batch[i].copy_(torch.from_numpy(image).permute(2, 0, 1))
+        batch[i].div_(255).sub_(_mean_tensor).div_(_std_tensor)
+    return batch
+
+def classify_batch(images, top_k=DEFAULT_TOP_K):
+    """批量模型预测，返回每张图片的类别名称、类别ID及 top-k 概率；images 可以是 PIL 图片或 RGB uint8 数组"""
+    input_tensor = images_to_tensor(images).to(DEVICE)
 
     # 模型预测
     with torch.no_grad():
-        outputs = classification_model(input_tensor)
-        _, preds = torch.max(outputs, 1)
-        predicted_class = preds.item()
-        return class_to_label.get(predicted_class, "未知类别")
\ No newline at end of file
+        outputs = get_classification_model()(input_tensor)
+        probabilities = torch.softmax(outputs, dim=1)
+        scores, classes = probabilities.topk(min(top_k, probabilities.shape[1]), dim=1)
+
+    results = []
+    for class_row, score_row in zip(classes.tolist(), scores.tolist()):
+        candidates = [
+            {
+                'class_id': class_id,
+                'label': class_registry.label(class_id, "未知类别"),
+                'score': round(score, 6)
+            }
+            for class_id, score in zip(class_row, score_row)
+        ]
+        results.append({
+            'label': candidates[0]['label'],
+            'class_id': candidates[0]['class_id'],
+            'confidence': candidates[0]['score'],
+            'top_k': candidates
+        })
+    return results
+
+def prediction_confidence(prediction):
+    """预测结果的置信度（最高类别的 softmax 概率）"""
+    if 'confidence' in prediction:
+        return prediction['confidence']
+    # 旧的缓存/索引结果只有 top_k
+    top_k = prediction.get('top_k') or []
+    return top_k[0]['score'] if top_k else 0.0
+
+def is_confident(prediction, threshold=CONFIDENCE_THRESHOLD):
+    """置信度是否达到阈值"""
+    return prediction_confidence(prediction) >= threshold
+
+def vote_predictions(predictions):
+    """
+    汇总同一连拍中多张图片的预测：各类别在每张图片 top_k 中的概率取平均（软投票）
+    Returns:
+        dict: label/class_id 为得票最高的类别，score 为其平均概率，
+              frames 为参与投票的图片数，top1_frames 为以该类别为首选的图片数；无图片时返回 None
+    """
+    if not predictions:
+        return None
+    scores = {}
+    labels = {}
+    top1_counts = {}
+    for prediction in predictions:
+        for candidate in prediction.get('top_k') or []:
+            class_id = candidate['class_id']
+            scores[class_id] = scores.get(class_id, 0.0) + candidate['score']
+            labels[class_id] = candidate['label']
+        top1_counts[prediction['class_id']] = top1_counts.get(prediction['class_id'], 0) + 1
+        labels.setdefault(prediction['class_id'], prediction['label'])
+    if not scores:
+        # 缺少候选列表时按首选类别计票
+        scores = {class_id: float(count) for class_id, count in top1_counts.items()}
+    class_id = max(scores, key=lambda key: (scores[key], top1_counts.get(key, 0)))
+    return {
+        'label': labels[class_id],
+        'class_id': class_id,
+        'score': scores[class_id] / len(predictions),
+        'frames': len(predictions),
+        'top1_frames': top1_counts.get(class_id, 0)
+    }
+
+def predict_batch(images):
+    """批量模型预测，返回每张图片的类别名称"""
+    return [result['label'] for result in classify_batch(images)]
+
+def predict_image(image_path):
+    """模型预测"""
+    image = Image.open(image_path).convert("RGB")
+    return predict_batch([image])[0]
\ No newline at end of file
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+照片墙图片目录
+启动时从数据集清单（dataset_manifest.py）构建一次有效测试图片列表并常驻内存，每次请求只需随机抽样；
+清单文件在磁盘上发生变化（重新生成或更新了无效标记）时自动重新加载。
+web 进程只读取已有的清单，不会重新生成：清单早于 all_data.csv 时只输出提示；
+清单缺失时改为只读地读取一次 CSV（不生成清单，与改造前相同，逐个检查文件并排除旧的无效图片列表），
+照片墙仍可显示，/api/health 的 photo_wall 字段会报告来源，需要离线运行 python dataset_manifest.py。
+"""
+
+import os
+import random
+import threading
+import time
+
+from dataset_manifest import DatasetManifest, FLAG_INVALID, read_dataset_csv, load_invalid_list
+
+# 两次检查文件变化之间的最短间隔（秒）
+CHECK_INTERVAL = 2.0
+
+
+def _file_signature(path):
+    """文件的 (mtime, size)，不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PhotoWallCatalog:
+    """照片墙有效图片目录，条目为 (filepath, 鸟类名称, 类别ID, 修改时间) 元组"""
+
+    def __init__(self, manifest_path, csv_path, data_folder, class_to_label, check_interval=CHECK_INTERVAL):
+        self.manifest_path = manifest_path
+        self.csv_path = csv_path
+        self.data_folder = data_folder
+        self.class_to_label = class_to_label
+        self.check_interval = check_interval
+        self._entries = ()
+        self._signature = None
+        self._source = None  # 'manifest'、'csv'（清单缺失时的回退）或 None
+        self._manifest_current = False
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _current_signature(self):
+        return _file_signature(self.manifest_path), _file_signature(self.csv_path)
+
+    def rebuild(self):
+        """重新加载数据集清单，构建有效图片目录（排除无效与缺失的图片）"""
+        signature = self._current_signature()
+        try:
+            manifest = DatasetManifest.open(self.manifest_path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 无法加载数据集清单 {self.manifest_path}（{e}）")
+            print(f"💡 请运行 'python dataset_manifest.py' 生成清单")
+            if self._source != 'csv':
+                # 只回退读取一次 CSV，清单生成之前不再在请求中重复扫描
+                print(f"📋 改为直接读取 {self.csv_path}")
+                self._entries = tuple(self._entries_from_csv())
+            self._signature = signature
+            self._source = 'csv'
+            self._manifest_current = False
+            return len(self._entries)
+        self._manifest_current = manifest.is_current(self.csv_path)
+        if not self._manifest_current:
+            print(f"💡 {self.csv_path} 在清单生成后有变化，请运行 'python dataset_manifest.py' 更新清单")
+
+        entries = []
+        for entry in manifest.entries('test'):
+            bird_name = self.class_to_label.get(entry.class_id, "未知鸟类")
+            # 修改时间用作缩略图 URL 的版本号，原图变化后浏览器缓存自动失效
+            entries.append((entry.filepath, bird_name, entry.class_id, entry.mtime_ns))
+
+        filtered_count = manifest.count('test', FLAG_INVALID)
+        if filtered_count > 0:
+            print(f"✅ 已过滤掉 {filtered_count} 张无效图片，剩余 {len(entries)} 张有效图片")
+
+        # 整体替换，读取方无需加锁
+        self._entries = tuple(entries)
+        self._signature = signature
+        self._source = 'manifest'
+        return len(entries)
+
+    def _entries_from_csv(self):
+        """清单缺失时的回退：只读取 CSV 与文件状态，不生成清单"""
+        try:
+            rows = read_dataset_csv(self.csv_path)
+        except OSError as e:
+            print(f"⚠️ 无法读取 {self.csv_path}: {e}")
+            return []
+        invalid_images = load_invalid_list()
+        entries = []
+        for filepath, class_id, split in rows:
+            if split != 'test' or filepath in invalid_images:
+                continue
+            signature = _file_signature(os.path.join(self.data_folder, filepath))
+            if signature is None:
+                continue
+            bird_name = self.class_to_label.get(class_id, "未知鸟类")
+            entries.append((filepath, bird_name, class_id, signature[0]))
+        return entries
+
+    def status(self):
+        """照片墙的图片来源与数量，供健康检查使用"""
+        return {
+            'source': self._source,
+            'images': len(self._entries),
+            'manifest_current': self._manifest_current
+        }
+
+    def refresh_if_changed(self):
+        """文件发生变化时重建目录（最多每 check_interval 秒检查一次）"""
+        now = time.monotonic()
+        if self._signature is not None and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if self._signature is not None and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            if self._current_signature() != self._signature:
+                try:
+                    self.rebuild()
+                except Exception as e:
+                    # 记录本次签名，文件再次变化前不再重试
+                    self._signature = self._current_signature()
+                    print(f"⚠️ 重建照片墙目录失败: {e}")
+
+    def sample(self, count=50):
+        """随机抽取 count 张图片"""
+        self.refresh_if_changed()
+        entries = self._entries
+        return random.sample(entries, min(count, len(entries)))
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+内存中的端到端识别流程
+各步骤之间直接传递 PIL 图片与 NumPy 数组，不再写入/读取中间 JPEG 文件。
+仅当调用方传入 debug_dir 时才把中间结果保存到磁盘。
+上传的图片在解码时即按画布尺寸缩小（JPEG 使用 draft 按比例解码），不会完整解码大尺寸相机原图。
+"""
+
+import io
+import math
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from image_utils import (compress_pil_image, select_subject, render_final_image,
+                         generate_random_filename, SEGMENTATION_MODEL_NAME, BACKGROUND_MODE)
+from model_utils import MODEL_VERSION, prediction_confidence
+from inference_server import segment_image, classify_image, segment_images, classify_images
+from result_cache import ResultCache, make_cache_key
+from uploads_janitor import sharded_path
+from metrics import timed_stage, observe_stage
+
+# 与 process_task 中 tasks[task_id]['steps'] 的键保持一致
+PIPELINE_STEPS = ('compress_image', 'remove_background', 'create_final_image', 'prediction')
+
+# 流程版本：任一模型或最终图像背景填充方式变化都会使旧的缓存结果失效
+PIPELINE_VERSION = f"{MODEL_VERSION}+{SEGMENTATION_MODEL_NAME}+bg-{BACKGROUND_MODE}"
+
+# 识别结果中写入缓存的字段
+CACHED_FIELDS = ('label', 'class_id', 'confidence', 'top_k')
+
+# 压缩步骤的画布边长
+CANVAS_SIZE = 1024
+
+# 允许解码的最大像素数（可通过环境变量覆盖），在读取文件头后、解码前检查
+MAX_IMAGE_PIXELS = int(os.environ.get('BIRD_MAX_IMAGE_PIXELS', str(64 * 1000 * 1000)))
+
+# 上传图片预览（保存在任务中，用于结果页展示）的最长边
+PREVIEW_SIZE = 512
+
+result_cache = ResultCache()
+
+
+class ImageTooLargeError(ValueError):
+    """图片像素数超过 MAX_IMAGE_PIXELS"""
+
+    def __init__(self, width, height, max_pixels=MAX_IMAGE_PIXELS):
+        super().__init__(f"图片尺寸过大（{width}x{height}，上限 {max_pixels} 像素）")
+        self.width = width
+        self.height = height
+
+
+def check_image_size(image, max_pixels=MAX_IMAGE_PIXELS):
+    """检查已打开（尚未解码）的图片像素数"""
+    width, height = image.size
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLargeError(width, height, max_pixels)
+
+
+def inspect_image(data, max_pixels=MAX_IMAGE_PIXELS):
+    """只读取文件头，校验是图片且像素数未超限，返回 (宽, 高)"""
+    with Image.open(io.BytesIO(data)) as image:
+        check_image_size(image, max_pixels)
+        return image.size
+
+
+def load_image(source, target_size=None, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    接受文件路径、文件对象或 PIL 图片，返回 RGB 格式的 PIL 图片
+    指定 target_size 时在解码阶段缩小，保证长边不小于 target_size：
+    JPEG 通过 draft 直接按 1/2、1/4、1/8 比例解码，其他格式解码后用 reduce 整数倍缩小
+    """
+    if isinstance(source, Image.Image):
+        return source.convert("RGB")
+    with Image.open(source) as image:
+        check_image_size(image, max_pixels)
+        scale = target_size / max(image.size) if target_size else 1
+        if scale >= 1:
+            return image.convert("RGB")
+
+        requested = (math.ceil(image.width * scale), math.ceil(image.height * scale))
+        image.draft('RGB', requested)
+        factor = min(image.width // requested[0], image.height // requested[1])
+        image = image.convert("RGB")
+        return image.reduce(factor) if factor >= 2 else image
+
+
+def make_preview(data, max_side=PREVIEW_SIZE):
+    """生成上传图片的 JPEG 预览，返回 JPEG 字节"""
+    image = load_image(io.BytesIO(data), target_size=max_side)
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=80)
+    return buffer.getvalue()
+
+
+def _save_debug_artifact(image, debug_dir):
+    """保存调试用的中间结果，返回文件路径"""
+    output_path = sharded_path(debug_dir, generate_random_filename("jpg"))
+    image.save(output_path, quality=95)
+    return output_path
+
+
+def _compress_step(source, debug_dir, artifacts):
+    """步骤1: 解码并缩放到画布"""
+    compressed = compress_pil_image(load_image(source, target_size=CANVAS_SIZE))
+    if debug_dir:
+        artifacts['compressed'] = _save_debug_artifact(compressed, debug_dir)
+    return compressed
+
+
+def _final_image_step(compressed, mask, debug_dir, artifacts):
+    """步骤3: 选择主体并合成 224x224 的最终图像（RGB 数组，直接交给分类模型）"""
+    image_np = np.array(compressed)
+    subject_mask, bbox, component = select_subject(image_np, mask)
+    final_image = render_final_image(image_np, subject_mask, bbox)
+    if debug_dir:
+        artifacts['final'] = _save_debug_artifact(Image.fromarray(final_image), debug_dir)
+    return final_image, bbox, component
+
+
+def _outcome(prediction, final_image, bbox, component, artifacts, timings):
+    return {
+        'label': prediction['label'],
+        'class_id': prediction['class_id'],
+        'confidence': prediction['confidence'],
+        'top_k': prediction['top_k'],
+        'bbox': bbox,
+        'component': component,
+        'final_image': final_image,
+        'artifacts': artifacts,
+        'timings': timings
+    }
+
+
+def run_pipeline(source, debug_dir=None, on_step=None, on_artifact=None):
+    """
+    执行完整的识别流程
+    Args:
+        source: 文件路径、文件对象或 PIL 图片
+        debug_dir (str): 若指定，则把压缩图与最终图保存到该目录
+        on_step (callable): 每完成一个步骤时以步骤名调用，用于更新进度
+        on_artifact (callable): 每保存一个调试文件时以其路径调用（在该步骤的 on_step 之前）
+    Returns:
+        dict: label/class_id 为预测类别，confidence 为其 softmax 概率，top_k 为候选类别及概率，
+              bbox/component 为所选主体在 1024x1024 画布上的边界框与连通组件编号，
+              final_image 为 224x224 的 RGB 数组，artifacts 为调试文件路径（未开启调试时为空），
+              timings 为各步骤耗时（毫秒）
+    """
+    def step_done(step):
+        if on_artifact is not None:
+            for path in artifacts.values():
+                if path not in reported:
+                    reported.add(path)
+                    on_artifact(path)
+        if on_step is not None:
+            on_step(step)
+
+    artifacts = {}
+    reported = set()
+    timings = {}
+
+    # 步骤1: 压缩图像
+    with timed_stage(timings, 'compress_image'):
+        compressed = _compress_step(source, debug_dir, artifacts)
+    step_done('compress_image')
+
+    # 步骤2: 去背景
+    with timed_stage(timings, 'remove_background'):
+        mask = segment_image(compressed)
+    step_done('remove_background')
+
+    # 步骤3: 创建最终图像
+    with timed_stage(timings, 'create_final_image'):
+        final_image, bbox, component = _final_image_step(compressed, mask, debug_dir, artifacts)
+    step_done('create_final_image')
+
+    # 步骤4: 模型预测
+    with timed_stage(timings, 'prediction'):
+        prediction = classify_image(final_image)
+    step_done('prediction')
+
+    return _outcome(prediction, final_image, bbox, component, artifacts, timings)
+
+
+def run_pipeline_batch(sources, debug_dir=None):
+    """
+    对多张图片执行识别流程，分割与分类各以一批提交给推理服务
+    （分割与分类的耗时为从整批提交到该图片结果返回的时间）
+    Returns:
+        list: 与输入顺序一致，每项为 run_pipeline 的返回值，或该图片处理失败时的异常
+    """
+    outcomes = [None] * len(sources)
+    artifacts = [{} for _ in sources]
+    timings = [{} for _ in sources]
+
+    # 步骤1: 逐张解码压缩，失败的图片不再参与后续步骤
+    compressed = {}
+    for index, source in enumerate(sources):
+        try:
+            with timed_stage(timings[index], 'compress_image'):
+                compressed[index] = _compress_step(source, debug_dir, artifacts[index])
+        except Exception as e:
+            outcomes[index] = e
+
+    # 步骤2: 一次性提交全部图片的分割
+    indices = list(compressed)
+    final_images = {}
+    start = time.perf_counter()
+    for index, future in zip(indices, segment_images([compressed[i] for i in indices])):
+        try:
+            mask = future.result()
+            observe_stage(timings[index], 'remove_background', (time.perf_counter() - start) * 1000)
+            # 步骤3: 逐张选择主体（主体过小等错误只影响该图片）
+            with timed_stage(timings[index], 'create_final_image'):
+                final_images[index] = _final_image_step(compressed[index], mask, debug_dir, artifacts[index])
+        except Exception as e:
+            outcomes[index] = e
+
+    # 步骤4: 一次性提交全部最终图像的分类
+    indices = list(final_images)
+    start = time.perf_counter()
+    for index, future in zip(indices, classify_images([final_images[i][0] for i in indices])):
+        final_image, bbox, component = final_images[index]
+        try:
+            prediction = future.result()
+            observe_stage(timings[index], 'prediction', (time.perf_counter() - start) * 1000)
+            outcomes[index] = _outcome(prediction, final_image, bbox, component, artifacts[index], timings[index])
+        except Exception as e:
+            outcomes[index] = e
+    return outcomes
+
+
+def _cached_prediction(key):
+    """读取结果缓存，未命中时返回 None"""
+    cached = result_cache.get(key)
+    if cached is not None and 'confidence' not in cached:
+        # 旧版本的缓存条目没有 confidence 字段
+        cached = dict(cached, confidence=prediction_confidence(cached))
+    return cached
+
+
+def identify(data, debug_dir=None, on_step=None, on_artifact=None):
+    """
+    带结果缓存的识别，命中缓存时不执行任何模型计算
+    Args:
+        data (bytes): 原始图片文件内容
+        on_step (callable): 以完成的步骤名调用；命中缓存时只调用一次，参数为全部步骤名
+        on_artifact (callable): 与 run_pipeline 相同，命中缓存时不会调用
+    Returns:
+        tuple: (包含 label、class_id、confidence、top_k 与各步骤耗时 timings（毫秒，不写入缓存）的字典, 是否命中缓存)
+    """
+    timings = {}
+    with timed_stage(timings, 'cache_lookup'):
+        key = make_cache_key(data, PIPELINE_VERSION)
+        cached = _cached_prediction(key)
+    if cached is not None:
+        if on_step is not None:
+            on_step(*PIPELINE_STEPS)
+        return dict(cached, timings=timings), True
+
+    outcome = run_pipeline(io.BytesIO(data), debug_dir=debug_dir, on_step=on_step, on_artifact=on_artifact)
+    prediction = {field: outcome[field] for field in CACHED_FIELDS}
+    result_cache.put(key, prediction)
+    return dict(prediction, timings={**timings, **outcome['timings']}), False
+
+
+def identify_batch(datas, debug_dir=None):
+    """
+    带结果缓存的批量识别
+    Args:
+        datas (list): 各图片的原始文件内容
+    Returns:
+        list: 与输入顺序一致，每项为 (预测字典, 是否命中缓存)，或该图片处理失败时的异常；
+              预测字典与 identify 相同，包含 timings
+    """
+    keys = []
+    lookup_timings = []
+    results = [None] * len(datas)
+    misses = []
+    for index, data in enumerate(datas):
+        timings = {}
+        with timed_stage(timings, 'cache_lookup'):
+            key = make_cache_key(data, PIPELINE_VERSION)
+            cached = _cached_prediction(key)
+        keys.append(key)
+        lookup_timings.append(timings)
+        if cached is not None:
+            results[index] = (dict(cached, timings=timings), True)
+        else:
+            misses.append(index)
+
+    outcomes = run_pipeline_batch([io.BytesIO(datas[i]) for i in misses], debug_dir=debug_dir)
+    for index, outcome in zip(misses, outcomes):
+        if isinstance(outcome, Exception):
+            results[index] = outcome
+            continue
+        prediction = {field: outcome[field] for field in CACHED_FIELDS}
+        result_cache.put(keys[index], prediction)
+        results[index] = (dict(prediction, timings={**lookup_timings[index], **outcome['timings']}), False)
+    return results
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+识别结果缓存
+以「输入字节的哈希 + 模型版本」为键，缓存预测类别、类别ID与 top-k 概率。
+内存层使用 LRU 淘汰；可选的磁盘层以 JSON 文件保存，在进程重启后仍然有效。
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# 缓存配置（可通过环境变量覆盖）
+RESULT_CACHE_SIZE = int(os.environ.get('BIRD_RESULT_CACHE_SIZE', '1024'))
+RESULT_CACHE_DIR = os.environ.get('BIRD_RESULT_CACHE_DIR') or None
+
+
+def make_cache_key(data, version):
+    """根据输入字节和模型版本生成缓存键"""
+    digest = hashlib.sha256(data).hexdigest()
+    return hashlib.sha256(f"{version}:{digest}".encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """两级（内存 LRU + 可选磁盘）结果缓存"""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, disk_dir=RESULT_CACHE_DIR):
+        self.max_entries = max(1, max_entries)
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        """磁盘层按键的前两位分目录，避免单目录文件过多"""
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key, value):
+        """写入内存层并按 LRU 淘汰（调用方需持有锁）"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ 写入结果缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, key):
+        """查询缓存，未命中返回 None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                self._counters['memory_hits'] += 1
+                return dict(value)
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self._counters['misses'] += 1
+                return None
+            self._remember(key, value)
+            self._counters['hits'] += 1
+            self._counters['disk_hits'] += 1
+        return dict(value)
+
+    def put(self, key, value):
+        """写入缓存，value 必须可序列化为 JSON"""
+        with self._lock:
+            self._remember(key, dict(value))
+        self._write_disk(key, value)
+
+    def stats(self):
+        """返回命中/未命中计数等统计信息"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['disk_enabled'] = bool(self.disk_dir)
+        return stats
@@ -1,13 +1,58 @@
-from PIL import Image
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+照片墙缩略图
+缩略图按「原图路径 + 修改时间 + 文件大小 + 尺寸 + 格式」的摘要寻址存放在缓存目录中，
+原图变化后会自动生成新的缩略图。支持 WebP 与 JPEG 两种格式。
+
+批量生成: python smallphoto.py --workers 4
+"""
+
+import argparse
+import hashlib
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from dataset_manifest import ensure_manifest, DATASET_MANIFEST_PATH
+
+# 缩略图缓存目录（可通过环境变量覆盖）
+THUMBNAIL_DIR = os.environ.get('BIRD_THUMBNAIL_DIR', 'thumbnails')
+
+# 照片墙卡片为 150x150，300 用于高分屏
+THUMBNAIL_SIZES = (150, 300)
+
+# URL 中的格式名 -> (PIL 格式, MIME 类型, 扩展名)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'image/webp', 'webp'),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+}
+
+
+def thumbnail_key(original_path, size, fmt):
+    """根据原图的路径、修改时间与大小计算缩略图的缓存键"""
+    stat = os.stat(original_path)
+    source = f"{os.path.abspath(original_path)}:{stat.st_mtime_ns}:{stat.st_size}:{size}:{fmt}"
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def thumbnail_cache_path(key, fmt, cache_dir=THUMBNAIL_DIR):
+    """缓存键对应的缩略图路径，按前两位分目录"""
+    extension = THUMBNAIL_FORMATS[fmt][2]
+    return os.path.join(cache_dir, key[:2], f"{key}.{extension}")
+
 
-def generate_thumbnail(original_path, thumbnail_path, size=(150, 150)):
+def generate_thumbnail(original_path, thumbnail_path, size=(150, 150), fmt='jpeg'):
     """
     生成缩略图
     Args:
         original_path (str): 原始图片路径
         thumbnail_path (str): 缩略图保存路径
-        size (tuple): 缩略图尺寸，默认为 (150, 150)
+        size (tuple): 缩略图尺寸，默认为 (150, 150)；短边缩放到该尺寸，便于前端按 cover 裁剪
+        fmt (str): 'jpeg' 或 'webp'
     """
     # 确保缩略图目录存在
     os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
@@ -16,15 +61,89 @@ def generate_thumbnail(original_path, thumbnail_path, size=(150, 150)):
     if os.path.exists(thumbnail_path):
         return thumbnail_path
 
+    pil_format = THUMBNAIL_FORMATS[fmt][0]
+    tmp_path = f"{thumbnail_path}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
         # 打开原始图片
         with Image.open(original_path) as img:
-            # 保持长宽比生成缩略图
-            img.thumbnail(size)
-            # 保存缩略图
-            img.save(thumbnail_path, "JPEG")
-            print(f"Generated thumbnail: {thumbnail_path}")
-            return thumbnail_path
+            # JPEG 解码时直接按比例缩小，避免完整解码大图
+            img.draft('RGB', size)
+            img = img.convert('RGB')
+            # 保持长宽比，短边缩放到目标尺寸
+            scale = max(size[0] / img.width, size[1] / img.height)
+            if scale < 1:
+                img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                                 Image.Resampling.LANCZOS)
+            # 先写临时文件再原子替换，避免并发请求读到不完整的文件
+            if pil_format == 'WEBP':
+                img.save(tmp_path, pil_format, quality=80, method=4)
+            else:
+                img.save(tmp_path, pil_format, quality=85, optimize=True, progressive=True)
+        os.replace(tmp_path, thumbnail_path)
+        return thumbnail_path
     except Exception as e:
         print(f"Error generating thumbnail for {original_path}: {e}")
-        return None
\ No newline at end of file
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+
+def ensure_thumbnail(original_path, size, fmt, cache_dir=THUMBNAIL_DIR):
+    """返回 (缩略图路径, 缓存键)，缓存中不存在时立即生成；失败时路径为 None"""
+    key = thumbnail_key(original_path, size, fmt)
+    path = thumbnail_cache_path(key, fmt, cache_dir)
+    if not os.path.exists(path):
+        path = generate_thumbnail(original_path, path, (size, size), fmt)
+    return path, key
+
+
+def _build_one(args):
+    """为单张图片生成全部尺寸与格式的缩略图，返回生成的字节数"""
+    original_path, cache_dir = args
+    total_bytes = 0
+    for size in THUMBNAIL_SIZES:
+        for fmt in THUMBNAIL_FORMATS:
+            try:
+                path, _ = ensure_thumbnail(original_path, size, fmt, cache_dir)
+            except OSError as e:
+                print(f"Error generating thumbnail for {original_path}: {e}")
+                continue
+            if path:
+                total_bytes += os.path.getsize(path)
+    return total_bytes
+
+
+def build_thumbnails(data_folder='static/', csv_file='all_data.csv', cache_dir=THUMBNAIL_DIR, workers=1,
+                     manifest_path=DATASET_MANIFEST_PATH):
+    """批量为照片墙会展示的测试集图片生成缩略图（已存在的会被跳过）"""
+    filepaths = ensure_manifest(manifest_path, csv_file, data_folder).filepaths('test')
+    originals = [os.path.join(data_folder, filepath) for filepath in filepaths]
+    originals = [path for path in originals if os.path.exists(path)]
+    print(f"🔍 为 {len(originals)} 张测试集图片生成缩略图，进程数: {workers}")
+
+    start = time.perf_counter()
+    original_bytes = sum(os.path.getsize(path) for path in originals)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        thumbnail_bytes = sum(executor.map(_build_one, [(path, cache_dir) for path in originals], chunksize=16))
+    elapsed = time.perf_counter() - start
+
+    print(f"✅ 完成，用时 {elapsed:.1f}s")
+    print(f"📦 原图共 {original_bytes / 1024 / 1024:.1f}MB，"
+          f"缩略图（{len(THUMBNAIL_SIZES)} 种尺寸 x {len(THUMBNAIL_FORMATS)} 种格式）共 "
+          f"{thumbnail_bytes / 1024 / 1024:.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量生成照片墙缩略图")
+    parser.add_argument('--data-folder', default='static/')
+    parser.add_argument('--csv', default='all_data.csv')
+    parser.add_argument('--manifest', default=DATASET_MANIFEST_PATH)
+    parser.add_argument('--output', default=THUMBNAIL_DIR)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    build_thumbnails(args.data_folder, args.csv, args.output, args.workers, args.manifest)
+
+
+if __name__ == "__main__":
+    main()
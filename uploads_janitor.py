@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+上传目录清理
+- sharded_path: 按文件名前两个字符分片存放（uploads/ab/abXXXX.jpg），避免单个目录下文件过多
+- UploadsJanitor: 后台线程定期清理超过 TTL 的文件，总大小超过配额时从最旧的文件开始删除；
+  未结束任务引用的文件与刚写入的文件不会被删除，并统计回收的文件数与字节数；
+  分片目录最多 36x36 个，清空后也保留：sharded_path 创建目录后由调用方写入，删除目录会让并发的写入失败
+多个 worker 进程共用同一目录时，通过文件锁保证同一时间只有一个进程在清理。
+"""
+
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台不加锁
+    fcntl = None
+
+# 清理配置（可通过环境变量覆盖）
+UPLOAD_TTL_SECONDS = int(os.environ.get('BIRD_UPLOAD_TTL_SECONDS', '86400'))
+UPLOAD_QUOTA_MB = float(os.environ.get('BIRD_UPLOAD_QUOTA_MB', '1024'))  # 0 表示不限制总大小
+UPLOAD_SWEEP_INTERVAL = int(os.environ.get('BIRD_UPLOAD_SWEEP_INTERVAL', '300'))
+
+# 修改时间在此范围内的文件可能仍在写入或刚交给调用方，配额清理时跳过
+MIN_AGE_SECONDS = 60
+SHARD_CHARS = 2
+LOCK_FILENAME = '.janitor.lock'
+
+
+def shard_name(filename):
+    """文件名对应的分片目录名"""
+    return filename[:SHARD_CHARS].lower()
+
+
+def sharded_path(folder, filename):
+    """返回 folder/<分片>/filename，并确保分片目录存在"""
+    shard_dir = os.path.join(folder, shard_name(filename))
+    os.makedirs(shard_dir, exist_ok=True)
+    return os.path.join(shard_dir, filename)
+
+
+class UploadsJanitor:
+    """按 TTL 与总大小配额清理一个或多个目录"""
+
+    def __init__(self, roots, ttl=UPLOAD_TTL_SECONDS, quota_mb=UPLOAD_QUOTA_MB,
+                 interval=UPLOAD_SWEEP_INTERVAL, referenced=None, min_age=MIN_AGE_SECONDS):
+        """
+        Args:
+            roots (list): 需要清理的目录，不存在或为空的项会被忽略
+            referenced (callable): 返回仍被使用的文件路径列表，这些文件不会被删除
+        """
+        self.roots = list(dict.fromkeys(os.path.abspath(root) for root in roots if root))
+        self.ttl = ttl
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        self.interval = interval
+        self.referenced = referenced
+        self.min_age = min_age
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'sweeps': 0,
+            'skipped_sweeps': 0,
+            'deleted_files': 0,
+            'reclaimed_bytes': 0,
+            'expired_files': 0,
+            'quota_files': 0,
+            'errors': 0,
+            'last_sweep': None
+        }
+
+    def start(self):
+        """启动清理线程（重复调用无副作用）"""
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='uploads-janitor', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                with self._stats_lock:
+                    self._stats['errors'] += 1
+                print(f"⚠️ 清理上传目录失败: {e}")
+            time.sleep(self.interval)
+
+    def _scan(self, root):
+        """递归列出目录中的文件 (路径, 大小, 修改时间)"""
+        files = []
+        pending = [root]
+        while pending:
+            current = pending.pop()
+            try:
+                entries = list(os.scandir(current))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        files.append((entry.path, stat.st_size, stat.st_mtime))
+                except FileNotFoundError:
+                    continue
+        return files
+
+    def _protected_paths(self):
+        if self.referenced is None:
+            return set()
+        return {os.path.abspath(path) for path in self.referenced() if path}
+
+    def _try_lock(self, root):
+        """获取目录的清理锁，其他进程正在清理时返回 None"""
+        if fcntl is None:
+            return True
+        os.makedirs(root, exist_ok=True)
+        lock_file = open(os.path.join(root, LOCK_FILENAME), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _remove(self, path):
+        """删除文件，已被其他进程删除时返回 False"""
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def sweep(self, now=None):
+        """执行一次清理，返回本次清理的统计"""
+        now = time.time() if now is None else now
+        start = time.perf_counter()
+        locks = []
+        try:
+            for root in self.roots:
+                lock = self._try_lock(root)
+                if lock is None:
+                    with self._stats_lock:
+                        self._stats['skipped_sweeps'] += 1
+                    return None
+                locks.append(lock)
+
+            protected = self._protected_paths()
+            files = []
+            for root in self.roots:
+                files.extend(self._scan(root))
+
+            total_bytes = sum(size for _, size, _ in files)
+            expired_files = 0
+            quota_files = 0
+            reclaimed_bytes = 0
+            kept = []
+            for path, size, mtime in files:
+                if now - mtime > self.ttl and path not in protected:
+                    if self._remove(path):
+                        expired_files += 1
+                        reclaimed_bytes += size
+                    total_bytes -= size
+                else:
+                    kept.append((path, size, mtime))
+
+            if self.quota_bytes > 0 and total_bytes > self.quota_bytes:
+                # 超出配额时从最旧的文件开始删除
+                kept.sort(key=lambda item: item[2])
+                for path, size, mtime in kept:
+                    if total_bytes <= self.quota_bytes:
+                        break
+                    if path in protected or now - mtime < self.min_age:
+                        continue
+                    if self._remove(path):
+                        quota_files += 1
+                        reclaimed_bytes += size
+                    total_bytes -= size
+        finally:
+            for lock in locks:
+                if lock is not True:
+                    lock.close()
+
+        deleted_files = expired_files + quota_files
+        summary = {
+            'at': now,
+            'ms': (time.perf_counter() - start) * 1000,
+            'scanned_files': len(files),
+            'deleted_files': deleted_files,
+            'reclaimed_bytes': reclaimed_bytes,
+            'remaining_files': len(files) - deleted_files,
+            'remaining_bytes': total_bytes,
+            'protected_files': len(protected)
+        }
+        with self._stats_lock:
+            self._stats['sweeps'] += 1
+            self._stats['deleted_files'] += deleted_files
+            self._stats['reclaimed_bytes'] += reclaimed_bytes
+            self._stats['expired_files'] += expired_files
+            self._stats['quota_files'] += quota_files
+            self._stats['last_sweep'] = summary
+        if deleted_files:
+            print(f"🧹 上传目录已清理 {deleted_files} 个文件（过期 {expired_files}，超出配额 {quota_files}），"
+                  f"回收 {reclaimed_bytes / 1024 / 1024:.1f}MB")
+        return summary
+
+    def stats(self):
+        """清理统计（本进程内累计）"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            'roots': self.roots,
+            'ttl_seconds': self.ttl,
+            'quota_bytes': self.quota_bytes,
+            'interval_seconds': self.interval,
+            'running': self._thread is not None
+        })
+        return stats